@@ -0,0 +1,132 @@
+# agenda_parametros.py
+"""
+Agenda de parâmetros de Bolus (RIC, FSI e glicemia alvo) por horário do dia.
+
+A agenda é uma lista ordenada de segmentos; cada um vale do seu inicio_minuto
+(0-1439) até o início do seguinte, e o último vai até a meia-noite. Assim cabem
+tanto os três turnos fixos (manhã/almoço/jantar) quanto os 48 segmentos de meia
+hora das bombas de insulina. A busca do segmento vigente é binária (bisect /
+np.searchsorted), para um instante ou para muitos de uma vez.
+"""
+
+from bisect import bisect_right
+from datetime import datetime
+
+import numpy as np
+
+MINUTOS_DIA = 1440
+
+# Turnos usados quando o paciente não tem agenda própria (mesmos horários de antes)
+TURNOS_PADRAO = (
+    (0, 'jantar'),     # 00:00-05:59 segue o parâmetro da noite
+    (6 * 60, 'manha'),
+    (12 * 60, 'almoco'),
+    (18 * 60, 'jantar'),
+)
+
+
+def minuto_do_dia(momento=None):
+    """Minuto do dia (0-1439) de um datetime, ts_epoch (hora de parede) ou None (agora)."""
+    if momento is None:
+        momento = datetime.now()
+    if isinstance(momento, datetime):
+        return momento.hour * 60 + momento.minute
+    # ts_epoch é a hora de parede tratada como UTC: o resto do dia já é a hora local
+    return (int(momento) % 86400) // 60
+
+
+class AgendaParametros:
+    """Segmentos (inicio_minuto, ric, fsi, glicemia_alvo) de um paciente, imutável."""
+
+    __slots__ = ('inicios', 'ric', 'fsi', 'glicemia_alvo')
+
+    def __init__(self, segmentos):
+        segmentos = sorted(segmentos, key=lambda s: s[0])
+        if not segmentos:
+            raise ValueError("A agenda precisa de pelo menos um segmento.")
+        inicios = [int(s[0]) for s in segmentos]
+        if any(not 0 <= m < MINUTOS_DIA for m in inicios):
+            raise ValueError("inicio_minuto deve estar entre 0 e 1439.")
+        if len(set(inicios)) != len(inicios):
+            raise ValueError("Dois segmentos começam no mesmo minuto.")
+        if any(v is None for s in segmentos for v in s[1:]):
+            raise ValueError("Todos os segmentos precisam de RIC, FSI e glicemia alvo.")
+
+        # Sem segmento às 00:00, a madrugada continua o último segmento do dia anterior
+        if inicios[0] != 0:
+            segmentos.insert(0, (0,) + tuple(segmentos[-1][1:]))
+
+        self.inicios = tuple(int(s[0]) for s in segmentos)
+        self.ric = tuple(float(s[1]) for s in segmentos)
+        self.fsi = tuple(float(s[2]) for s in segmentos)
+        self.glicemia_alvo = tuple(float(s[3]) for s in segmentos)
+
+    @classmethod
+    def de_parametros(cls, parametros, segmentos=()):
+        """
+        Monta a agenda do paciente a partir de obter_parametros_clinicos():
+        sem segmentos próprios, usa os três turnos fixos; com segmentos,
+        os campos NULL herdam o valor do turno vigente naquele minuto.
+        """
+        padrao = cls([
+            (inicio, parametros[f'ric_{turno}'], parametros[f'fsi_{turno}'], parametros['glicemia_alvo'])
+            for inicio, turno in TURNOS_PADRAO
+        ])
+        if not segmentos:
+            return padrao
+        completos = []
+        for inicio, ric, fsi, alvo in segmentos:
+            i = padrao.indice(inicio)
+            completos.append((
+                inicio,
+                padrao.ric[i] if ric is None else ric,
+                padrao.fsi[i] if fsi is None else fsi,
+                padrao.glicemia_alvo[i] if alvo is None else alvo,
+            ))
+        return cls(completos)
+
+    def __len__(self):
+        return len(self.inicios)
+
+    def indice(self, minuto):
+        """Índice do segmento vigente no minuto do dia (busca binária)."""
+        return bisect_right(self.inicios, minuto) - 1
+
+    def parametros_em(self, momento=None):
+        """Parâmetros vigentes em um datetime/ts_epoch (None = agora)."""
+        i = self.indice(minuto_do_dia(momento))
+        return {
+            'inicio_minuto': self.inicios[i],
+            'ric': self.ric[i],
+            'fsi': self.fsi[i],
+            'glicemia_alvo': self.glicemia_alvo[i],
+        }
+
+    def segmentos(self):
+        """Lista de dicionários {'inicio', 'ric', 'fsi', 'glicemia_alvo'} (para exibição)."""
+        return [
+            {'inicio': f'{m // 60:02d}:{m % 60:02d}', 'ric': r, 'fsi': f, 'glicemia_alvo': a}
+            for m, r, f, a in zip(self.inicios, self.ric, self.fsi, self.glicemia_alvo)
+        ]
+
+
+def resolver_agendas_lote(agendas, grupos, ts_epoch):
+    """
+    Parâmetros vigentes para muitos (grupo, ts_epoch) de uma vez.
+
+    agendas: lista de AgendaParametros indexada pelo grupo (inteiro >= 0).
+    Todas as agendas são concatenadas com chave grupo * 1440 + inicio_minuto e
+    cada consulta é resolvida por um único np.searchsorted.
+
+    Retorna (ric, fsi, glicemia_alvo) como arrays alinhados às consultas.
+    """
+    chaves = np.concatenate([g * MINUTOS_DIA + np.asarray(a.inicios) for g, a in enumerate(agendas)])
+    ric = np.concatenate([a.ric for a in agendas])
+    fsi = np.concatenate([a.fsi for a in agendas])
+    alvo = np.concatenate([a.glicemia_alvo for a in agendas])
+
+    minutos = (np.asarray(ts_epoch, dtype=np.int64) % 86400) // 60
+    consulta = np.asarray(grupos, dtype=np.int64) * MINUTOS_DIA + minutos
+    # Toda agenda começa no minuto 0, então o segmento encontrado é sempre do próprio grupo
+    indices = np.searchsorted(chaves, consulta, side='right') - 1
+    return ric[indices], fsi[indices], alvo[indices]
@@ -3,17 +3,19 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from datetime import datetime
 from functools import wraps
 import json
 import logging
 import plotly.graph_objects as go
 import numpy as np
-import os
 from relatorios import relatorios_bp
 from service_manager import formatar_registros_para_exibicao 
-from db_instance import db_manager # <--- NOVO: Importa a instância global
-from models import User 
+from db_instance import db_manager, init_app as init_db_manager # Instância global compartilhada (lazy)
+from cache_templates import configurar_templates, init_app as init_cache_templates
+import cache_fragmentos
+from models import User, PAPEL_ADMIN, PAPEL_PACIENTE, MASCARA_MEDICO, MASCARA_GESTAO
+from database_manager import datetime_para_epoch
 from service_manager import BolusService
 bolus_service = BolusService(db_manager) 
 
@@ -21,9 +23,9 @@ bolus_service = BolusService(db_manager)
 # --- Configuração da Aplicação ---
 app = Flask(__name__)
 
-# CONFIGURAÇÃO CRÍTICA PARA DESATIVAR O CACHE DE TEMPLATE EM DESENVOLVIMENTO
-# Isso garante que o Jinja2 não armazene o HTML antigo.
-app.jinja_env.cache = {} 
+# Cache de templates conforme o ambiente (cache_templates.py): em produção, LRU +
+# bytecode em disco compartilhado pelos workers; em debug, recarrega o HTML alterado.
+init_cache_templates(app)
 
 
 # Após a inicialização do Flask e antes das rotas
@@ -34,49 +36,11 @@ app.secret_key = 'sua_chave_secreta_aqui'
 app.logger.setLevel(logging.INFO)
 
 # --- Inicialização das Classes ---
-db_path = os.path.join('data', 'glicemia.db')
-
-# AVISO: Esta linha assume a existência da classe DatabaseManager. 
-# Se esta classe não estiver definida no seu ambiente, ocorrerá um erro de NameError.
-try:
-    from database_manager import DatabaseManager
-    db_manager = DatabaseManager()
-except ImportError:
-    app.logger.error("A classe DatabaseManager não foi encontrada. Substitua com sua implementação real.")
-    # Adicionar um mock para evitar quebra total, mas o código não funcionará corretamente sem o DB
-    class MockDatabaseManager:
-        def carregar_usuario(self, username): return None
-        def carregar_usuario_por_id(self, user_id): return None
-        def salvar_log_acao(self, acao, usuario): pass
-        def carregar_registros(self, user_id): return []
-        def carregar_alimentos(self): return []
-        def encontrar_registro(self, id): return None
-        def excluir_registro(self, id): return False
-        def atualizar_registro(self, registro): return False
-        def carregar_todos_os_usuarios(self, perfil=None): return []
-        def carregar_medicos(self): return []
-        def atualizar_usuario(self, usuario): return False
-        def excluir_usuario(self, username): return False
-        def salvar_usuario(self, novo_usuario): return True
-        def obter_pacientes_por_medico(self, medico_id): return []
-        def medico_tem_acesso_a_paciente(self, medico_id, paciente_id): return True
-        def carregar_ficha_medica(self, paciente_id): return {}
-        def salvar_ficha_medica(self, ficha_data): return True
-        def buscar_agendamentos_paciente(self, paciente_id): return []
-        def atualizar_status_agendamento(self, agendamento_id, status): return True
-        def buscar_todos_agendamentos(self): return []
-        def get_user_id_by_username(self, username): return 1
-        def salvar_agendamento(self, paciente_id, medico_id, data_hora, obs): return True
-        def carregar_todos_os_usuarios(self, perfil=None): return []
-        def carregar_cuidadores(self): return []
-        def vincular_paciente_medico(self, paciente_id, medico_id): return True
-        def salvar_alimento(self, alimento_data): return True
-        def excluir_alimento(self, id): return True
-        def buscar_exames_paciente(self, paciente_id): return []
-        def salvar_exame_laboratorial(self, exame_data): return True
-        def vincular_cuidador_paciente(self, cuidador_username, paciente_username): return True
-
-    db_manager = MockDatabaseManager()
+# O DatabaseManager é único por processo (db_instance) e só é construído no primeiro uso.
+# init_db_manager já confere o esquema: com migrações pendentes o app não sobe.
+init_db_manager(app)
+# Snippets dos painéis médicos em cache por (template, paciente, versão dos dados)
+fragmentos = cache_fragmentos.init_app(app, lambda ids: db_manager.obter_versoes_dados(ids))
 
 
 login_manager = LoginManager()
@@ -106,8 +70,8 @@ def admin_only(f):
     @login_required # Garante que o usuário esteja logado
     def decorated_function(*args, **kwargs):
         
-        # Apenas permite se a propriedade 'is_admin' for True
-        if not current_user.is_admin: 
+        # Apenas permite se o papel for admin (bit PAPEL_ADMIN)
+        if not current_user.papel & PAPEL_ADMIN: 
             flash('Acesso negado. Apenas administradores do sistema podem acessar esta função.', 'danger')
             return redirect(url_for('dashboard')) 
             
@@ -117,9 +81,8 @@ def admin_only(f):
 def paciente_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Assumindo que current_user tem uma propriedade 'is_paciente' 
-        # OU o papel (role) é 'paciente'
-        if not current_user.is_authenticated or current_user.role != 'paciente':
+        # Exclusivo do papel 'paciente' (bit PAPEL_PACIENTE)
+        if not current_user.is_authenticated or not current_user.papel & PAPEL_PACIENTE:
             flash('Acesso não autorizado. Esta página é exclusiva para pacientes.', 'danger')
             return redirect(url_for('dashboard')) # Redireciona para um dashboard neutro
         return f(*args, **kwargs)
@@ -163,66 +126,50 @@ class AppCore:
 def carregar_dados_dashboard(user_id):
     """
     Carrega e processa os dados de glicemia para o dashboard.
+    As leituras vêm uma única vez em arrays NumPy (SerieGlicemica) e as
+    métricas da última semana são calculadas de forma vetorizada.
     """
-    # Use sua classe DatabaseManager para buscar os dados
-    registros = db_manager.carregar_registros(user_id)
-    
     # Inicializa os dados para o dashboard
     resumo_dados = {
         'ultimo_registro': None,
         'media_ultima_semana': 'N/A',
         'hiperglicemia_count': 0,
-        'hipoglicemia_count': 0
+        'hipoglicemia_count': 0,
+        'metricas': None
     }
-    
-    if not registros:
+
+    serie = db_manager.carregar_serie_glicemica(user_id)
+    if not len(serie):
         return resumo_dados
 
-    # Encontra o último registro de glicemia
-    registros_glicemia = [
-        r for r in registros 
-        if r.get('tipo') in ['Glicemia'] and r.get('data_hora') and r.get('valor') is not None
-    ]
-    registros_glicemia.sort(key=lambda x: datetime.fromisoformat(x['data_hora']) if isinstance(x['data_hora'], str) else datetime.min, reverse=True)
-    
-    if registros_glicemia:
-        ultimo_registro = registros_glicemia[0]
-        data_hora_ultimo = datetime.fromisoformat(ultimo_registro['data_hora'])
-        tempo_passado = datetime.now() - data_hora_ultimo
-        
-        # Formata o tempo para exibição
-        if tempo_passado.total_seconds() < 60:
-            tempo_str = f"{int(tempo_passado.total_seconds())} segundos atrás"
-        elif tempo_passado.total_seconds() < 3600:
-            tempo_str = f"{int(tempo_passado.total_seconds() / 60)} minutos atrás"
-        elif tempo_passado.total_seconds() < 86400:
-            tempo_str = f"{int(tempo_passado.total_seconds() / 3600)} horas atrás"
-        else:
-            tempo_str = f"{int(tempo_passado.total_seconds() / 86400)} dias atrás"
+    # Último registro de glicemia
+    agora_ts = datetime_para_epoch(datetime.now())
+    ts_ultimo, valor_ultimo = serie.ultimo
+    segundos = agora_ts - ts_ultimo
+
+    # Formata o tempo para exibição
+    if segundos < 60:
+        tempo_str = f"{int(segundos)} segundos atrás"
+    elif segundos < 3600:
+        tempo_str = f"{int(segundos / 60)} minutos atrás"
+    elif segundos < 86400:
+        tempo_str = f"{int(segundos / 3600)} horas atrás"
+    else:
+        tempo_str = f"{int(segundos / 86400)} dias atrás"
 
-        resumo_dados['ultimo_registro'] = {
-            'valor': "%.1f" % ultimo_registro.get('valor', 0),
-            'tempo_desde_ultimo': tempo_str
-        }
+    resumo_dados['ultimo_registro'] = {
+        'valor': "%.1f" % valor_ultimo,
+        'tempo_desde_ultimo': tempo_str
+    }
+
+    # Métricas da última semana (janela por busca binária, sem laço em Python)
+    metricas = serie.metricas(agora_ts - 7 * 86400)
+    resumo_dados['metricas'] = metricas
+    if metricas['n']:
+        resumo_dados['media_ultima_semana'] = "%.1f" % metricas['media']
+        resumo_dados['hipoglicemia_count'] = metricas['hipo_count']
+        resumo_dados['hiperglicemia_count'] = metricas['hiper_count']
 
-    # Filtra os dados da última semana e calcula a média e eventos extremos
-    data_limite = datetime.now() - timedelta(days=7)
-    glicemias_semana = []
-    
-    for r in registros_glicemia:
-        data_hora = datetime.fromisoformat(r['data_hora']) if isinstance(r.get('data_hora'), str) else datetime.min
-        if data_hora >= data_limite:
-            glicemias_semana.append(r['valor'])
-            # Conta eventos extremos
-            if r['valor'] < 70:
-                resumo_dados['hipoglicemia_count'] += 1
-            elif r['valor'] > 180:
-                resumo_dados['hiperglicemia_count'] += 1
-    
-    if glicemias_semana:
-        media = sum(glicemias_semana) / len(glicemias_semana)
-        resumo_dados['media_ultima_semana'] = "%.1f" % media
-    
     return resumo_dados
 
 # Lista de Especialidades Médicas
@@ -250,30 +197,12 @@ app_core = AppCore(db_manager)
 
 @login_manager.user_loader
 def load_user(user_id):
+    # Identidade em cache no DatabaseManager (TTL curto, invalidada ao alterar/excluir
+    # o usuário): a maioria das requisições não abre conexão nem cria outro User
     if db_manager:
-        user_data = db_manager.carregar_usuario_por_id(int(user_id))
-        if user_data:
-            return User(
-                id=user_data.get('id'),
-                username=user_data.get('username'),
-                password_hash=user_data.get('password_hash'),
-                role=user_data.get('role', 'user').lower(), 
-                email=user_data.get('email'),
-                razao_ic=user_data.get('razao_ic', 1.0),
-                fator_sensibilidade=user_data.get('fator_sensibilidade', 1.0),
-                data_nascimento=user_data.get('data_nascimento'),
-                sexo=user_data.get('sexo'),
-                
-                # ⭐ NOVOS CAMPOS QUE VOCÊ ADICIONOU ANTERIORMENTE DEVEM ESTAR AQUI:
-                nome_completo=user_data.get('nome_completo'),
-                telefone=user_data.get('telefone'),
-                documento=user_data.get('documento'),
-                crm=user_data.get('crm'),
-                cns=user_data.get('cns'),
-                especialidade=user_data.get('especialidade')
-                # ⭐ FIM DOS NOVOS CAMPOS
-            )
+        return db_manager.carregar_identidade(int(user_id))
     return None
+
 # --- DECORADOR DE ACESSO EXCLUSIVO PARA MÉDICOS ---
 def medico_required(f):
     @wraps(f)
@@ -282,7 +211,7 @@ def medico_required(f):
             flash('Você precisa estar logado para acessar esta página.', 'warning')
             return redirect(url_for('login'))
             
-        if not current_user.is_medico:
+        if not current_user.papel & MASCARA_MEDICO:
             flash('Acesso negado. Apenas médicos podem acessar esta página.', 'danger')
             return redirect(url_for('dashboard')) 
         return f(*args, **kwargs)
@@ -294,10 +223,8 @@ def gestao_required(f):
     @login_required 
     def decorated_function(*args, **kwargs):
         
-        # Lista de todos os papéis que têm permissão de Gestão/Gerenciamento.
-        PAPEIS_DE_GESTAO = ['admin', 'secretario', 'medico']
-        
-        if current_user.role not in PAPEIS_DE_GESTAO:
+        # Papéis com permissão de Gestão/Gerenciamento: admin, secretario e medico (MASCARA_GESTAO)
+        if not current_user.papel & MASCARA_GESTAO:
             # Note a mensagem mais clara sobre quem pode acessar
             flash('Acesso negado. Apenas profissionais de gestão, médicos e administradores podem acessar esta página.', 'danger')
             return redirect(url_for('dashboard')) 
@@ -1277,6 +1204,10 @@ def guia_insulina():
 # Certifique-se de que 'request', 'jsonify', 'login_required' e 'db_manager'
 # (ou o objeto que gerencia seu SQLite) estejam importados corretamente.
 
+# Quantidade de resultados da busca de alimentos (parâmetro 'limit')
+LIMITE_BUSCA_ALIMENTOS_PADRAO = 50
+LIMITE_BUSCA_ALIMENTOS_MAX = 200
+
 @app.route('/buscar_alimentos', methods=['POST'])
 @login_required 
 def buscar_alimentos():
@@ -1284,44 +1215,27 @@ def buscar_alimentos():
     
     if len(termo) < 3:
         return jsonify({'resultados': []})
+
+    try:
+        limite = int(request.values.get('limit', LIMITE_BUSCA_ALIMENTOS_PADRAO))
+    except (TypeError, ValueError):
+        limite = LIMITE_BUSCA_ALIMENTOS_PADRAO
+    limite = max(1, min(limite, LIMITE_BUSCA_ALIMENTOS_MAX))
         
     try:
-        # A função deve retornar uma lista de dicionários/Rows com as chaves: 
-        # 'alimento', 'medida_caseira', 'peso', 'kcal', 'carbs'
-        alimentos_encontrados = db_manager.buscar_alimentos_por_nome(termo)
+        # Os itens já vêm com as chaves que o JavaScript usa ('nome', 'medida_caseira',
+        # 'peso_g', 'carbs_porcao', 'kcal_porcao'), com os valores por porção
+        # calculados quando o alimento foi gravado.
+        # Sem resultado para o termo digitado, a busca tenta a grafia corrigida
+        alimentos_encontrados, termo_corrigido = db_manager.buscar_alimentos_com_correcao(termo, limite=limite)
     except Exception as e:
         print(f"Erro no Database Manager ao buscar alimentos: {e}")
         return jsonify({'resultados': []})
     
-    resultados_finais = []
-    for item_db in alimentos_encontrados:
-        
-        # 🟢 Mapeamento 1 e 2: DB para chaves esperadas pelo JavaScript
-        nome_alimento = item_db.get('alimento', 'Nome Indefinido') # DB 'alimento' -> JSON 'nome'
-        peso_porcao = float(item_db.get('peso', 100))               # DB 'peso' -> JSON 'peso_g'
-        
-        # Mapeamento 3: Obter valores base
-        # ATENÇÃO: Estou assumindo que 'carbs' e 'kcal' são os valores por 100g.
-        # Se os valores em 'carbs' e 'kcal' já forem referentes ao peso da porção (coluna 'peso'), 
-        # a lógica de cálculo precisa ser simplificada (veja o bloco 'Atenção' abaixo).
-        carbs_100g_base = float(item_db.get('carbs', 0)) 
-        kcal_100g_base = float(item_db.get('kcal', 0))         
-        medida_caseira = item_db.get('medida_caseira', 'Porção')
-        
-        # Lógica de Cálculo: Usando o peso da porção e o valor por 100g
-        carbs_porcao = (carbs_100g_base * peso_porcao) / 100
-        kcal_porcao = (kcal_100g_base * peso_porcao) / 100
-        
-        # Monta o dicionário de SAÍDA (o que o JavaScript espera)
-        resultados_finais.append({
-            'nome': nome_alimento,          # O JS usa esta chave
-            'medida_caseira': medida_caseira,
-            'peso_g': peso_porcao,          # O JS usa esta chave
-            'carbs_porcao': carbs_porcao,   # O JS usa esta chave
-            'kcal_porcao': kcal_porcao      # O JS usa esta chave
-        })
-        
-    return jsonify({'resultados': resultados_finais})
+    resposta = {'resultados': alimentos_encontrados}
+    if termo_corrigido:
+        resposta['termo_corrigido'] = termo_corrigido  # "Mostrando resultados para ..."
+    return jsonify(resposta)
 
 # --- ROTAS DA ÁREA MÉDICA ---
 
@@ -1343,12 +1257,15 @@ def dashboard_paciente():
 @login_required
 @medico_required
 def dashboard_medico():
-    # Carrega dados filtrados pelo médico logado
-    resumo = db_manager.obter_resumo_medico_filtrado(current_user.id)
-    pacientes = db_manager.obter_pacientes_do_medico(current_user.id) 
+    # Pacientes, KPIs e métricas de 14 dias em uma passada (número fixo de consultas)
+    painel = db_manager.carregar_painel_medico(current_user.id)
+    pacientes = painel.pacientes
+
+    # Uma consulta para as versões de todos os pacientes (chave do cache das linhas)
+    fragmentos.precarregar_versoes([p['id'] for p in pacientes])
     
     # Renderiza o template do médico
-    return render_template('dashboard_medico.html', pacientes=pacientes, resumo=resumo)
+    return render_template('dashboard_medico.html', pacientes=pacientes, resumo=painel.resumo())
 
 # No seu arquivo app.py
 
@@ -1868,4 +1785,5 @@ def configurar_parametros():
 
 
 if __name__ == '__main__':
+    configurar_templates(app, debug=True)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,220 @@
+# auditoria.py
+"""
+Gravação assíncrona do log de auditoria (logs_acao).
+
+As ações entram numa fila limitada em memória e uma thread de fundo grava em
+lotes, um INSERT em massa e um commit por lote. Quem registra (login, logout,
+exclusões) não espera pela escrita no banco.
+
+Contrapressão, quando a fila está cheia (ver POLITICAS):
+    'sincrono'   a ação é gravada na hora, na thread de quem chamou (padrão:
+                 nada se perde, e só paga a latência quem chega com a fila cheia)
+    'bloquear'   espera até timeout_bloqueio por espaço; depois descarta
+    'descartar'  descarta na hora (conta em 'descartados')
+
+Um lote que falha ao gravar (ex.: 'database is locked' sob carga) é tentado de
+novo com espera crescente (tentativas, espera_retentativa); só depois disso as
+ações são descartadas, e contadas uma a uma em 'perdidos'.
+
+No encerramento do processo (atexit) a fila é drenada antes de sair.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+POLITICAS = ('sincrono', 'bloquear', 'descartar')
+
+_FIM = object()  # sentinela que encerra a thread gravadora
+
+
+class FilaAuditoria:
+    """Fila limitada + thread gravadora em lotes para o log de ações."""
+
+    def __init__(self, gravar_lote, tamanho_maximo=10000, tamanho_lote=200,
+                 intervalo_s=0.5, politica='sincrono', timeout_bloqueio=0.1,
+                 tentativas=5, espera_retentativa=0.1):
+        """
+        gravar_lote: função que recebe uma lista de tuplas (data_hora, acao,
+        usuario) e as grava numa única transação.
+        intervalo_s: espera máxima para juntar um lote antes de gravar.
+        tentativas: gravações de um lote pela thread gravadora antes de
+        descartá-lo; a espera entre elas começa em espera_retentativa e dobra.
+        """
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de contrapressão desconhecida: {politica!r}. Use uma de {POLITICAS}.")
+        self.gravar_lote = gravar_lote
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_s = intervalo_s
+        self.politica = politica
+        self.timeout_bloqueio = timeout_bloqueio
+        self.tentativas = max(1, tentativas)
+        self.espera_retentativa = espera_retentativa
+        self._fila = queue.Queue(maxsize=tamanho_maximo)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._atexit_registrado = False
+
+        # Métricas
+        self._enfileirados = 0
+        self._gravados = 0
+        self._lotes = 0
+        self._sincronos = 0
+        self._descartados = 0
+        self._retentativas = 0
+        self._perdidos = 0
+
+    # --- Produção ---
+
+    def registrar(self, acao, usuario):
+        """
+        Enfileira uma ação (o horário é o do registro, não o da gravação).
+        Retorna False só se a ação foi descartada pela política de contrapressão.
+        """
+        item = (datetime.now().isoformat(), acao, usuario)
+        self._garantir_thread()
+        try:
+            self._fila.put_nowait(item)
+        except queue.Full:
+            return self._fila_cheia(item)
+        with self._lock:
+            self._enfileirados += 1
+        return True
+
+    def _fila_cheia(self, item):
+        if self.politica == 'sincrono':
+            with self._lock:
+                self._sincronos += 1
+            # Uma tentativa só: quem chamou não fica esperando o backoff
+            return self._gravar([item], tentativas=1)
+        if self.politica == 'bloquear':
+            try:
+                self._fila.put(item, timeout=self.timeout_bloqueio)
+                with self._lock:
+                    self._enfileirados += 1
+                return True
+            except queue.Full:
+                pass
+        with self._lock:
+            self._descartados += 1
+        print(f"Aviso: fila de auditoria cheia; ação descartada: {item[1]!r} ({item[2]})")
+        return False
+
+    # --- Thread gravadora ---
+
+    def _garantir_thread(self):
+        """Inicia a gravadora no primeiro uso (e de novo num processo filho após fork)."""
+        pid = os.getpid()
+        if self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread.is_alive():
+                return
+            self._pid = pid
+            self._thread = threading.Thread(target=self._laco, name='auditoria', daemon=True)
+            self._thread.start()
+            if not self._atexit_registrado:
+                atexit.register(self.encerrar)
+                self._atexit_registrado = True
+
+    def _laco(self):
+        while True:
+            primeiro = self._fila.get()
+            if primeiro is _FIM:
+                return
+            lote = [primeiro]
+            # Junta o que chegar até completar o lote ou vencer o intervalo
+            prazo = time.monotonic() + self.intervalo_s
+            fim = False
+            while len(lote) < self.tamanho_lote:
+                restante = prazo - time.monotonic()
+                try:
+                    item = self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _FIM:
+                    fim = True
+                    break
+                lote.append(item)
+            self._gravar(lote)
+            if fim:
+                return
+
+    def _gravar(self, lote, tentativas=None):
+        """Grava o lote, tentando de novo com espera crescente; False se as ações foram perdidas."""
+        tentativas = self.tentativas if tentativas is None else tentativas
+        espera = self.espera_retentativa
+        for tentativa in range(1, tentativas + 1):
+            try:
+                self.gravar_lote(lote)
+            except Exception as e:
+                if tentativa < tentativas:
+                    with self._lock:
+                        self._retentativas += 1
+                    time.sleep(espera)
+                    espera *= 2
+                    continue
+                with self._lock:
+                    self._perdidos += len(lote)
+                print(f"Erro ao gravar lote de auditoria: {len(lote)} ações perdidas após {tentativas} tentativa(s): {e}")
+                return False
+            with self._lock:
+                self._gravados += len(lote)
+                self._lotes += 1
+            return True
+
+    # --- Encerramento ---
+
+    def encerrar(self, timeout=5.0):
+        """Drena a fila (grava tudo o que está pendente) e para a thread gravadora."""
+        with self._lock:
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is None or not thread.is_alive():
+            # Sem gravadora neste processo: grava o que restou aqui mesmo
+            self.drenar()
+            return
+        prazo = time.monotonic() + timeout
+        try:
+            # Com a fila cheia, espera a gravadora abrir espaço para a sentinela (sem travar a saída)
+            self._fila.put(_FIM, timeout=timeout)
+        except queue.Full:
+            print(f"Aviso: fila de auditoria cheia no encerramento; {self._fila.qsize()} ações pendentes não gravadas.")
+            return
+        thread.join(max(prazo - time.monotonic(), 0))
+        if thread.is_alive():
+            print(f"Aviso: auditoria não terminou de gravar em {timeout:.0f} s; {self._fila.qsize()} ações pendentes.")
+
+    def drenar(self):
+        """Grava, na thread atual, tudo o que está na fila."""
+        lote = []
+        while True:
+            try:
+                item = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _FIM:
+                lote.append(item)
+            if len(lote) >= self.tamanho_lote:
+                self._gravar(lote)
+                lote = []
+        if lote:
+            self._gravar(lote)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'pendentes': self._fila.qsize(),
+                'tamanho_maximo': self._fila.maxsize,
+                'politica': self.politica,
+                'enfileirados': self._enfileirados,
+                'gravados': self._gravados,
+                'lotes': self._lotes,
+                'sincronos': self._sincronos,
+                'descartados': self._descartados,
+                'retentativas': self._retentativas,
+                'perdidos': self._perdidos,
+            }
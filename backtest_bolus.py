@@ -0,0 +1,272 @@
+# backtest_bolus.py
+"""
+Back-test da calculadora de Bolus sobre o histórico de registros.
+
+Para cada refeição registrada (total_carbs > 0) o histórico do paciente é
+reproduzido na ordem do tempo: glicemia pré-refeição, Insulina Ativa das doses
+anteriores e parâmetros da agenda no horário da refeição entram em
+BolusService.compor_bolus. A sugestão é comparada com a dose registrada
+(dose_aplicada, ou dose_insulina) e com a glicemia pós-prandial.
+
+- Streaming: cada paciente é lido em ordem de ts_epoch com fetchmany; só ficam
+  em memória as doses dentro da duração de ação e as refeições aguardando a
+  glicemia pós-prandial.
+- Paralelo: um processo por paciente (ProcessPoolExecutor), cada um com sua
+  conexão somente-leitura.
+
+Limitação: os parâmetros usados são os ATUAIS do paciente (o banco não guarda
+histórico de RIC/FSI); o erro mede a calculadora de hoje contra as doses de então.
+
+Uso:
+    python backtest_bolus.py [--db glicemia.db] [--pacientes 1 2 3] [--processos 4]
+                             [--curva linear] [--lote 5000] [--json resultado.json]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.request import pathname2url
+
+import numpy as np
+
+from database_manager import DatabaseManager
+from insulina_ativa import insulina_ativa, obter_curva
+from metricas_glicemicas import ALVO_MIN, ALVO_MAX
+from service_manager import BolusService
+
+# Janelas (segundos) em torno da refeição
+JANELA_GLICEMIA_PRE = 30 * 60          # glicemia até 30 min antes vale como pré-refeição
+JANELA_POS_INICIO = 90 * 60            # glicemia pós-prandial entre 90 min...
+JANELA_POS_FIM = 180 * 60              # ...e 180 min depois
+ALVO_POS = 120 * 60                    # a leitura mais próxima de 2 h é a escolhida
+
+SQL_HISTORICO = """
+    SELECT r.ts_epoch, r.valor,
+           COALESCE(r.total_carbs, dr.carboidratos) AS carbs,
+           r.dose_insulina, r.dose_aplicada
+    FROM registros r LEFT JOIN detalhes_refeicao dr ON dr.registro_id = r.id
+    WHERE r.user_id = ? AND r.ts_epoch IS NOT NULL
+    ORDER BY r.ts_epoch
+"""
+
+
+def _conectar_leitura(caminho):
+    conn = sqlite3.connect(f"file:{pathname2url(caminho)}?mode=ro", uri=True)
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def _finalizar(refeicao, resultados):
+    """Fecha uma refeição (com ou sem glicemia pós) e guarda a linha do resultado."""
+    resultados.append((
+        refeicao['ts'], refeicao['sugerida'], refeicao['aplicada'],
+        refeicao['gc_pre'], refeicao['gc_pos'] if refeicao['gc_pos'] is not None else np.nan,
+    ))
+
+
+def backtest_paciente(caminho_db, user_id, agenda, nome_curva, tamanho_lote=5000):
+    """
+    Reproduz o histórico de UM paciente (roda no processo filho).
+    Retorna (user_id, array Nx5 [ts, sugerida, aplicada, gc_pre, gc_pos], contadores).
+    contadores['doses_max'] é o maior número de doses mantidas ao mesmo tempo.
+    """
+    curva = obter_curva(nome_curva)
+    duracao_s = curva.duracao_minutos * 60
+    doses = deque()          # (ts, UI) dentro da duração de ação
+    ultima_glicemia = None   # (ts, valor)
+    pendentes = deque()      # refeições aguardando a glicemia pós-prandial
+    resultados = []
+    contadores = {'linhas': 0, 'refeicoes': 0, 'sem_glicemia_pre': 0, 'sem_dose_registrada': 0, 'parametros_invalidos': 0, 'doses_max': 0}
+
+    conn = _conectar_leitura(caminho_db)
+    try:
+        cursor = conn.execute(SQL_HISTORICO, (user_id,))
+        while True:
+            linhas = cursor.fetchmany(tamanho_lote)
+            if not linhas:
+                break
+            contadores['linhas'] += len(linhas)
+            for ts, valor, carbs, dose_insulina, dose_aplicada in linhas:
+                # 0. Descarta as doses que já saíram da duração de ação (em toda linha,
+                #    senão doses sem refeição válida ficariam na fila para sempre)
+                while doses and doses[0][0] <= ts - duracao_s:
+                    doses.popleft()
+
+                # 1. Refeições pendentes: fecha as vencidas e oferece a glicemia desta linha
+                while pendentes and ts > pendentes[0]['ts'] + JANELA_POS_FIM:
+                    _finalizar(pendentes.popleft(), resultados)
+                if valor is not None:
+                    for refeicao in pendentes:
+                        decorrido = ts - refeicao['ts']
+                        if JANELA_POS_INICIO <= decorrido <= JANELA_POS_FIM and (
+                            refeicao['gc_pos'] is None or abs(decorrido - ALVO_POS) < refeicao['dist_pos']
+                        ):
+                            refeicao['gc_pos'], refeicao['dist_pos'] = valor, abs(decorrido - ALVO_POS)
+
+                # 2. Refeição: sugestão com o estado ANTES das doses desta linha
+                if carbs:
+                    contadores['refeicoes'] += 1
+                    gc_pre = valor
+                    if gc_pre is None and ultima_glicemia and ts - ultima_glicemia[0] <= JANELA_GLICEMIA_PRE:
+                        gc_pre = ultima_glicemia[1]
+                    aplicada = dose_aplicada if dose_aplicada is not None else dose_insulina
+                    if gc_pre is None:
+                        contadores['sem_glicemia_pre'] += 1
+                    elif aplicada is None:
+                        contadores['sem_dose_registrada'] += 1
+                    else:
+                        ia = round(insulina_ativa(curva, [d[0] for d in doses], [d[1] for d in doses], ts), 1) if doses else 0.0
+                        vigentes = agenda.parametros_em(ts)
+                        sugestao, erro = BolusService.compor_bolus(
+                            gc_pre, carbs, vigentes['ric'], vigentes['fsi'], vigentes['glicemia_alvo'], ia
+                        )
+                        if erro:
+                            contadores['parametros_invalidos'] += 1
+                        else:
+                            pendentes.append({
+                                'ts': ts, 'sugerida': sugestao['bolus_total'], 'aplicada': aplicada,
+                                'gc_pre': gc_pre, 'gc_pos': None, 'dist_pos': None,
+                            })
+
+                # 3. Atualiza o estado com esta linha
+                if valor is not None:
+                    ultima_glicemia = (ts, valor)
+                dose = dose_aplicada if dose_aplicada is not None else dose_insulina
+                if dose and dose > 0:
+                    doses.append((ts, dose))
+                    contadores['doses_max'] = max(contadores['doses_max'], len(doses))
+    finally:
+        conn.close()
+
+    while pendentes:
+        _finalizar(pendentes.popleft(), resultados)
+    return user_id, np.array(resultados, dtype=np.float64).reshape(-1, 5), contadores
+
+
+def _distribuicao(erros):
+    if not erros.size:
+        return {'n': 0}
+    p5, p25, p50, p75, p95 = np.percentile(erros, [5, 25, 50, 75, 95])
+    absolutos = np.abs(erros)
+    return {
+        'n': int(erros.size),
+        'media': round(float(erros.mean()), 2),
+        'eam': round(float(absolutos.mean()), 2),           # erro absoluto médio
+        'p5': round(float(p5), 2), 'p25': round(float(p25), 2), 'mediana': round(float(p50), 2),
+        'p75': round(float(p75), 2), 'p95': round(float(p95), 2),
+        'dentro_0_5_ui': round(float(np.mean(absolutos <= 0.5)) * 100, 1),
+        'dentro_1_ui': round(float(np.mean(absolutos <= 1.0)) * 100, 1),
+    }
+
+
+def resumir(dados):
+    """
+    Relatório das distribuições a partir da matriz [ts, sugerida, aplicada, gc_pre, gc_pos].
+    erro = sugerida - aplicada (positivo: a calculadora daria MAIS insulina).
+    """
+    erros = dados[:, 1] - dados[:, 2]
+    gc_pos = dados[:, 4]
+    com_pos = ~np.isnan(gc_pos)
+    hipo = com_pos & (gc_pos < ALVO_MIN)
+    hiper = com_pos & (gc_pos > ALVO_MAX)
+    alvo = com_pos & ~hipo & ~hiper
+    return {
+        'erro_sugerida_menos_aplicada': _distribuicao(erros),
+        # Com desfecho conhecido: em hiper, erro > 0 indica que a sugestão teria ajudado;
+        # em hipo, erro < 0 indica que a sugestão teria evitado parte da insulina
+        'por_desfecho_pos_prandial': {
+            'hipo (<70)': _distribuicao(erros[hipo]),
+            'alvo (70-180)': _distribuicao(erros[alvo]),
+            'hiper (>180)': _distribuicao(erros[hiper]),
+        },
+        'refeicoes_com_glicemia_pos': int(com_pos.sum()),
+        'delta_glicemia_pos_menos_pre': _distribuicao(gc_pos[com_pos] - dados[com_pos, 3]),
+    }
+
+
+def executar_backtest(db_path='glicemia.db', pacientes=None, processos=None, nome_curva=None, tamanho_lote=5000):
+    """Roda o back-test (um processo por paciente) e devolve o relatório consolidado."""
+    db = DatabaseManager(db_path)
+    nome_curva = nome_curva or BolusService.CURVA_PADRAO
+    obter_curva(nome_curva)  # valida o nome antes de abrir os processos
+
+    if not pacientes:
+        with db.get_db_connection(somente_leitura=True) as conn:
+            pacientes = [linha[0] for linha in conn.execute(
+                "SELECT DISTINCT user_id FROM registros WHERE total_carbs > 0 "
+                "UNION SELECT r.user_id FROM registros r JOIN detalhes_refeicao dr ON dr.registro_id = r.id"
+            )]
+    agendas = db.obter_agendas_parametros_lote(pacientes)
+
+    inicio = time.perf_counter()
+    partes, por_paciente = [], {}
+    contadores = {}
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        tarefas = [
+            executor.submit(backtest_paciente, db.db_path, pid, agendas[pid], nome_curva, tamanho_lote)
+            for pid in pacientes if pid in agendas
+        ]
+        for tarefa in tarefas:
+            user_id, dados, cont = tarefa.result()
+            partes.append(dados)
+            por_paciente[user_id] = _distribuicao(dados[:, 1] - dados[:, 2])
+            for chave, valor in cont.items():
+                if chave == 'doses_max':  # pico por paciente, não soma
+                    contadores[chave] = max(contadores.get(chave, 0), valor)
+                else:
+                    contadores[chave] = contadores.get(chave, 0) + valor
+
+    dados = np.vstack(partes) if partes else np.empty((0, 5))
+    relatorio = {
+        'curva': nome_curva,
+        'pacientes': len(por_paciente),
+        'pacientes_sem_parametros': [pid for pid in pacientes if pid not in agendas],
+        'tempo_s': round(time.perf_counter() - inicio, 2),
+        **contadores,
+        **resumir(dados),
+        'por_paciente': por_paciente,
+    }
+    return relatorio
+
+
+def _imprimir(relatorio):
+    print(f"Back-test do Bolus (curva '{relatorio['curva']}'): {relatorio['pacientes']} pacientes, "
+          f"{relatorio.get('linhas', 0):,} linhas em {relatorio['tempo_s']} s")
+    print(f"  Refeições: {relatorio.get('refeicoes', 0)} | sem glicemia pré: {relatorio.get('sem_glicemia_pre', 0)} | "
+          f"sem dose registrada: {relatorio.get('sem_dose_registrada', 0)} | "
+          f"com glicemia pós: {relatorio['refeicoes_com_glicemia_pos']}")
+
+    def linha(rotulo, d):
+        if not d['n']:
+            print(f"  {rotulo:<22}: sem dados")
+            return
+        print(f"  {rotulo:<22}: n={d['n']:<6} média {d['media']:+6.2f} | EAM {d['eam']:5.2f} | "
+              f"p5 {d['p5']:+6.2f} p50 {d['mediana']:+6.2f} p95 {d['p95']:+6.2f} | "
+              f"±0,5 UI {d['dentro_0_5_ui']:5.1f}% | ±1 UI {d['dentro_1_ui']:5.1f}%")
+
+    print("Erro (sugerida - aplicada, UI):")
+    linha('todas', relatorio['erro_sugerida_menos_aplicada'])
+    for rotulo, d in relatorio['por_desfecho_pos_prandial'].items():
+        linha(rotulo, d)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Back-test da calculadora de Bolus sobre o histórico.')
+    parser.add_argument('--db', default='glicemia.db', help='Arquivo do banco (relativo a data/ ou caminho absoluto).')
+    parser.add_argument('--pacientes', type=int, nargs='*', help='IDs dos pacientes (padrão: todos com refeições).')
+    parser.add_argument('--processos', type=int, default=None, help='Processos paralelos (padrão: núcleos da CPU).')
+    parser.add_argument('--curva', default=None, help='Curva de insulina ativa (ver insulina_ativa.CURVAS).')
+    parser.add_argument('--lote', type=int, default=5000, help='Linhas por fetchmany.')
+    parser.add_argument('--json', help='Grava o relatório completo neste arquivo.')
+    args = parser.parse_args()
+
+    relatorio = executar_backtest(args.db, args.pacientes, args.processos, args.curva, args.lote)
+    _imprimir(relatorio)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+        print(f"Relatório salvo em {os.path.abspath(args.json)}")
@@ -0,0 +1,483 @@
+# benchmarks.py
+"""
+Benchmarks de desempenho da camada de dados.
+
+Os benchmarks trabalham sempre sobre uma CÓPIA temporária de data/glicemia.db
+(o banco real nunca é alterado).
+
+Uso:
+    python benchmarks.py concorrencia [--segundos 5] [--leitores 8] [--escritores 2]
+    python benchmarks.py planos
+    python benchmarks.py metricas [--leituras 1000000]
+    python benchmarks.py insulina [--dias 90]
+    python benchmarks.py bolus [--cenarios 2000] [--pacientes 50]
+    python benchmarks.py alimentos [--linhas 100000]
+    python benchmarks.py auditoria [--acoes 5000] [--threads 8]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from busca_alimentos import IndiceAlimentos, consulta_fts
+from database_manager import DatabaseManager
+from service_manager import BolusService
+from insulina_ativa import CURVAS, insulina_ativa, serie_insulina_ativa
+from metricas_glicemicas import SerieGlicemica
+from migracoes import _m010_alimentos_fts, _m011_nutricao_pre_calculada, aplicar_migracoes, preencher_ts_epoch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_MODELO = os.path.join(BASE_DIR, 'data', 'glicemia.db')
+
+MEDICO_ID = 900000
+PRIMEIRO_PACIENTE_ID = 900001
+
+
+def preparar_banco_temporario(diretorio, nome='bench.db', pacientes=50, registros_por_paciente=500):
+    """Copia o banco modelo e adiciona um médico com N pacientes e registros sintéticos."""
+    caminho = os.path.join(diretorio, nome)
+    shutil.copy(DB_MODELO, caminho)
+
+    # Garante o esquema atual (colunas/índices) na cópia antes de popular
+    conn = sqlite3.connect(caminho)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            aplicar_migracoes(conn)
+            preencher_ts_epoch(conn)
+    finally:
+        conn.close()
+
+    conn = sqlite3.connect(caminho)
+    try:
+        conn.execute(
+            "INSERT INTO users (id, username, password_hash, role, nome_completo) VALUES (?, ?, ?, 'medico', ?)",
+            (MEDICO_ID, 'bench_medico', 'x', 'Médico Benchmark')
+        )
+        agora = datetime.now()
+        for i in range(pacientes):
+            paciente_id = PRIMEIRO_PACIENTE_ID + i
+            conn.execute(
+                "INSERT INTO users (id, username, password_hash, role, nome_completo, medico_id, ric_manha, fator_sensibilidade, meta_glicemia) "
+                "VALUES (?, ?, ?, 'paciente', ?, ?, 10, 50, 120)",
+                (paciente_id, f'bench_paciente_{i}', 'x', f'Paciente {i:03d}', MEDICO_ID)
+            )
+            conn.execute(
+                "INSERT INTO vinculos_medico_paciente (medico_id, paciente_id) VALUES (?, ?)",
+                (MEDICO_ID, paciente_id)
+            )
+            conn.executemany(
+                "INSERT INTO registros (user_id, data_hora, tipo, valor) VALUES (?, ?, 'Glicemia', ?)",
+                [
+                    (paciente_id,
+                     (agora - timedelta(minutes=30 * j)).isoformat(timespec='seconds'),
+                     random.uniform(50, 300))
+                    for j in range(registros_por_paciente)
+                ]
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return caminho
+
+
+def _medir_concorrencia(caminho, modo_servidor, segundos, leitores, escritores, pacientes):
+    db = DatabaseManager(caminho, tamanho_pool=leitores + escritores, modo_servidor=modo_servidor)
+    parar = threading.Event()
+    leituras = [0] * leitores
+    escritas = [0] * escritores
+
+    def leitor(indice):
+        while not parar.is_set():
+            db.obter_pacientes_do_medico(MEDICO_ID)
+            db.obter_resumo_paciente(PRIMEIRO_PACIENTE_ID + random.randrange(pacientes))
+            leituras[indice] += 1
+
+    def escritor(indice):
+        while not parar.is_set():
+            db.salvar_glicemia(
+                PRIMEIRO_PACIENTE_ID + random.randrange(pacientes),
+                random.uniform(50, 300),
+                datetime.now().isoformat(timespec='seconds'),
+                'Outros'
+            )
+            escritas[indice] += 1
+
+    threads = [threading.Thread(target=leitor, args=(i,)) for i in range(leitores)]
+    threads += [threading.Thread(target=escritor, args=(i,)) for i in range(escritores)]
+
+    # Os métodos do DatabaseManager imprimem mensagens de DEBUG; silencia durante a medição
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in threads:
+            t.start()
+        time.sleep(segundos)
+        parar.set()
+        for t in threads:
+            t.join()
+
+    return {
+        'leituras_por_s': sum(leituras) / segundos,
+        'escritas_por_s': sum(escritas) / segundos,
+        'pool': db.estatisticas_pool(),
+    }
+
+
+def benchmark_concorrencia(segundos=5, leitores=8, escritores=2, pacientes=50):
+    """
+    Compara a vazão de leitores sob carga mista (leituras + escritas simultâneas)
+    entre o modo padrão (rollback journal) e o modo servidor (WAL + escritor único).
+    """
+    with tempfile.TemporaryDirectory() as diretorio:
+        resultados = {}
+        for modo_servidor in (False, True):
+            caminho = preparar_banco_temporario(
+                diretorio, nome=f'bench_{int(modo_servidor)}.db', pacientes=pacientes
+            )
+            resultados[modo_servidor] = _medir_concorrencia(
+                caminho, modo_servidor, segundos, leitores, escritores, pacientes
+            )
+
+    padrao, servidor = resultados[False], resultados[True]
+    print(f"Carga mista: {leitores} leitores, {escritores} escritores, {segundos}s por modo")
+    print(f"  Modo padrão   : {padrao['leituras_por_s']:8.1f} leituras/s | {padrao['escritas_por_s']:8.1f} escritas/s")
+    print(f"  Modo servidor : {servidor['leituras_por_s']:8.1f} leituras/s | {servidor['escritas_por_s']:8.1f} escritas/s")
+    if padrao['leituras_por_s']:
+        print(f"  Ganho de vazão dos leitores: {servidor['leituras_por_s'] / padrao['leituras_por_s']:.2f}x")
+    return resultados
+
+
+def verificar_planos():
+    """
+    Regressão de planos de consulta: falha (retorna False) se alguma leitura
+    quente sobre registros fizer full table scan ou ordenar numa B-tree
+    temporária. A mesma checagem roda no pytest (tests/test_planos_consulta.py).
+    """
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = preparar_banco_temporario(diretorio, pacientes=5, registros_por_paciente=200)
+        db = DatabaseManager(caminho)
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultados = db.verificar_planos_consulta(PRIMEIRO_PACIENTE_ID)
+
+    ok = True
+    for r in resultados:
+        status = 'OK   ' if r['usa_indice'] else 'FALHA'
+        print(f"{status} {r['metodo']}: {' | '.join(r['plano'])}")
+        ok = ok and r['usa_indice']
+    return ok
+
+
+def benchmark_metricas(leituras=1_000_000):
+    """
+    Métricas de consenso sobre um histórico sintético de N leituras (uma a cada
+    5 min, como um CGM): montagem da série a partir de linhas (ts, valor),
+    cálculo completo e janelas de 7/14/30/90 dias, comparados com o laço em
+    Python que o dashboard usava (média + contagem de hipo/hiper).
+    """
+    rng = np.random.default_rng(42)
+    fim_ts = int(time.time())
+    ts = fim_ts - 300 * np.arange(leituras, 0, -1, dtype=np.int64)
+    valores = np.clip(140 + np.cumsum(rng.normal(0, 4, leituras)) % 200 - 60 + rng.normal(0, 15, leituras), 40, 400)
+    linhas = list(zip(ts.tolist(), valores.tolist()))
+
+    def medir(funcao, repeticoes=3):
+        melhor = float('inf')
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            resultado = funcao()
+            melhor = min(melhor, time.perf_counter() - inicio)
+        return melhor * 1000, resultado
+
+    t_serie, serie = medir(lambda: SerieGlicemica.de_linhas(linhas))
+    t_total, metricas = medir(lambda: serie.metricas())
+    t_janelas, _ = medir(lambda: serie.metricas_por_dias(fim_ts))
+
+    def laco_python():
+        soma = hipo = hiper = 0
+        for _, valor in linhas:
+            soma += valor
+            if valor < 70:
+                hipo += 1
+            elif valor > 180:
+                hiper += 1
+        return soma / len(linhas), hipo, hiper
+
+    t_laco, _ = medir(laco_python)
+
+    print(f"Métricas glicêmicas: {leituras:,} leituras")
+    print(f"  Montagem da série (linhas -> NumPy)   : {t_serie:9.1f} ms")
+    print(f"  Todas as métricas (série inteira)     : {t_total:9.1f} ms")
+    print(f"  Janelas 7/14/30/90 dias (searchsorted): {t_janelas:9.1f} ms")
+    print(f"  Laço Python (só média + hipo/hiper)   : {t_laco:9.1f} ms")
+    print(f"  Resultado: TIR {metricas['tir']}% | CV {metricas['cv']}% | GMI {metricas['gmi']}% | MAGE {metricas['mage']}")
+    return metricas
+
+
+def benchmark_insulina(dias=90):
+    """
+    Insulina ativa com curvas pré-calculadas: IA pontual (N consultas à tabela)
+    e série completa a cada 5 min (uma convolução), comparadas com o laço em
+    Python que somava dose a dose em cada instante da série.
+    """
+    rng = np.random.default_rng(7)
+    fim_ts = int(time.time())
+    inicio_ts = fim_ts - dias * 86400
+    # ~5 doses por dia em horários aleatórios
+    ts_doses = np.sort(rng.integers(inicio_ts - 86400, fim_ts, dias * 5))
+    doses = np.round(rng.uniform(1, 12, ts_doses.size) * 2) / 2
+
+    print(f"Insulina ativa: {dias} dias, {ts_doses.size} doses, série a cada 5 min")
+    for nome, curva in CURVAS.items():
+        inicio = time.perf_counter()
+        for _ in range(1000):
+            insulina_ativa(curva, ts_doses, doses, fim_ts)
+        t_pontual = (time.perf_counter() - inicio) * 1000 / 1000
+
+        inicio = time.perf_counter()
+        ts_grade, ia = serie_insulina_ativa(curva, ts_doses, doses, inicio_ts, fim_ts)
+        t_serie = (time.perf_counter() - inicio) * 1000
+
+        print(f"  {nome:<13}: IA pontual {t_pontual * 1000:7.1f} µs | série ({ts_grade.size} pontos) {t_serie:7.1f} ms")
+
+    # Referência: laço Python (modelo linear) sobre uma amostra da série
+    curva = CURVAS['linear']
+    duracao_s = curva.duracao_minutos * 60
+    amostra = ts_grade[:2000]
+    inicio = time.perf_counter()
+    for agora in amostra.tolist():
+        total = 0.0
+        for t, d in zip(ts_doses.tolist(), doses.tolist()):
+            if 0 <= agora - t < duracao_s:
+                total += d * (duracao_s - (agora - t)) / duracao_s
+    t_laco = (time.perf_counter() - inicio) * 1000 * ts_grade.size / amostra.size
+    print(f"  Laço Python (linear, estimado p/ série inteira): {t_laco:9.1f} ms")
+
+
+def benchmark_bolus(cenarios=2000, pacientes=50):
+    """
+    Sugestões de Bolus para muitos cenários (paciente, GC, carboidratos, momento):
+    uma chamada de calcular_bolus_total por cenário x calcular_bolus_lote.
+    Confere também que as duas formas dão o mesmo resultado.
+    """
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = preparar_banco_temporario(diretorio, pacientes=pacientes, registros_por_paciente=50)
+        agora = datetime.now()
+        conn = sqlite3.connect(caminho)
+        conn.executemany(
+            "INSERT INTO registros (user_id, data_hora, tipo, dose_insulina) VALUES (?, ?, 'Insulina', ?)",
+            [
+                (PRIMEIRO_PACIENTE_ID + i,
+                 (agora - timedelta(minutes=random.randrange(1, 600))).isoformat(timespec='seconds'),
+                 random.randrange(1, 20) / 2)
+                for i in range(pacientes) for _ in range(4)
+            ]
+        )
+        conn.commit()
+        conn.close()
+
+        db = DatabaseManager(caminho)
+        servico = BolusService(db)
+        # Momento fixo: com None cada chamada individual leria o relógio de novo
+        # e a IA mudaria entre elas, diferindo do lote sem ser erro
+        lista = [
+            (PRIMEIRO_PACIENTE_ID + random.randrange(pacientes), random.uniform(60, 300), random.uniform(0, 90), agora)
+            for _ in range(cenarios)
+        ]
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            individuais = [servico.calcular_bolus_total(gc, carbs, pid) for pid, gc, carbs, _ in lista]
+            t_individual = (time.perf_counter() - inicio) * 1000
+
+            inicio = time.perf_counter()
+            lote = servico.calcular_bolus_lote(lista)
+            t_lote = (time.perf_counter() - inicio) * 1000
+
+    iguais = sum(a == b for a, b in zip(individuais, lote))
+    print(f"Bolus: {cenarios} cenários, {pacientes} pacientes")
+    print(f"  Uma chamada por cenário: {t_individual:9.1f} ms")
+    print(f"  calcular_bolus_lote    : {t_lote:9.1f} ms ({t_individual / t_lote:.1f}x)")
+    print(f"  Resultados idênticos   : {iguais}/{cenarios}")
+    return iguais == cenarios
+
+
+CONSULTAS_ALIMENTOS = (
+    'pao', 'Pão', 'arr', 'arroz', 'arroz int', 'feij', 'feijão preto', 'leite', 'queijo minas',
+    'banana', 'car', 'fra', 'frango grelhado', 'suco de laranja', 'maca', 'ab', 'bolo de', 'xyz',
+)
+
+
+def benchmark_alimentos(linhas=100_000, limite=50):
+    """
+    Latência da busca de alimentos (p50/p99 de um mix de termos digitados) no
+    índice em memória e no FTS5, sobre a tabela real e sobre um catálogo
+    sintético de N linhas, comparada com o LIKE '%termo%' que a rota usava.
+    """
+    conn = sqlite3.connect(DB_MODELO)
+    conn.row_factory = sqlite3.Row
+    reais = [dict(r) for r in conn.execute("SELECT id, alimento, medida_caseira, peso, kcal, carbs FROM alimentos")]
+    conn.close()
+
+    # Catálogo sintético: nomes reais combinados com variações (marca, preparo)
+    sufixos = ('cozido', 'assado', 'grelhado', 'light', 'integral', 'caseiro', 'congelado', 'orgânico', 'diet', 'frito')
+    sinteticos = [
+        dict(reais[i % len(reais)], id=i + 1,
+             alimento=f"{reais[i % len(reais)]['alimento']} {sufixos[(i // len(reais)) % len(sufixos)]} {i // (len(reais) * len(sufixos))}")
+        for i in range(linhas)
+    ]
+
+    def medir(indice, repeticoes=200):
+        tempos = []
+        for _ in range(repeticoes):
+            for termo in CONSULTAS_ALIMENTOS:
+                inicio = time.perf_counter()
+                indice.buscar(termo, limite)
+                tempos.append(time.perf_counter() - inicio)
+        return np.percentile(np.array(tempos) * 1000, [50, 99])
+
+    def medir_sql(catalogo, repeticoes=20):
+        """LIKE '%termo%' (rota antiga) e FTS5 (alimentos_fts, migrações 010/011) num banco em memória."""
+        memoria = sqlite3.connect(':memory:')
+        memoria.execute("CREATE TABLE alimentos (id INTEGER PRIMARY KEY, alimento TEXT, medida_caseira TEXT, peso REAL, kcal REAL, carbs REAL)")
+        memoria.executemany("INSERT INTO alimentos VALUES (:id, :alimento, :medida_caseira, :peso, :kcal, :carbs)", catalogo)
+        _m010_alimentos_fts(memoria)
+        _m011_nutricao_pre_calculada(memoria)
+        consultas = {
+            'like': lambda termo: memoria.execute(
+                "SELECT * FROM alimentos WHERE alimento LIKE ? ORDER BY alimento", ('%' + termo + '%',)).fetchall(),
+            'fts': lambda termo: memoria.execute(
+                DatabaseManager.SQL_BUSCA_ALIMENTOS_FTS, (consulta_fts(termo), limite)).fetchall(),
+        }
+        percentis = {}
+        for nome, consulta in consultas.items():
+            tempos = []
+            for _ in range(repeticoes):
+                for termo in CONSULTAS_ALIMENTOS:
+                    inicio = time.perf_counter()
+                    consulta(termo)
+                    tempos.append(time.perf_counter() - inicio)
+            percentis[nome] = np.percentile(np.array(tempos) * 1000, [50, 99])
+        memoria.close()
+        return percentis
+
+    print(f"Busca de alimentos ({len(CONSULTAS_ALIMENTOS)} termos, limite {limite})")
+    for rotulo, catalogo in (('tabela real', reais), (f'{linhas:,} linhas', sinteticos)):
+        inicio = time.perf_counter()
+        indice = IndiceAlimentos(catalogo)
+        t_montagem = (time.perf_counter() - inicio) * 1000
+        p50, p99 = medir(indice)
+        sql = medir_sql(catalogo)
+        print(f"  {rotulo:<14}: montagem do índice {t_montagem:8.1f} ms")
+        print(f"      índice em memória: p50 {p50:7.3f} ms | p99 {p99:7.3f} ms")
+        print(f"      FTS5 (bm25)      : p50 {sql['fts'][0]:7.3f} ms | p99 {sql['fts'][1]:7.3f} ms")
+        print(f"      LIKE '%termo%'   : p50 {sql['like'][0]:7.3f} ms | p99 {sql['like'][1]:7.3f} ms")
+
+
+def benchmark_auditoria(acoes=5000, threads=8):
+    """
+    Latência de salvar_log_acao vista por quem chama (p50/p99), com N threads
+    registrando ao mesmo tempo: INSERT + commit na hora (como antes) x fila
+    com gravação em lotes. Confere que nenhuma ação se perdeu após a drenagem.
+    """
+    def medir(registrar):
+        tempos = [[] for _ in range(threads)]
+
+        def trabalhador(i):
+            for k in range(acoes // threads):
+                inicio = time.perf_counter()
+                registrar(f'Ação de teste {k}', f'bench{i}')
+                tempos[i].append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        ts = [threading.Thread(target=trabalhador, args=(i,)) for i in range(threads)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        total = time.perf_counter() - inicio
+        return np.percentile(np.concatenate(tempos) * 1000, [50, 99]), total
+
+    def contar(db):
+        with db.get_db_connection(somente_leitura=True) as conn:
+            return conn.execute("SELECT COUNT(*) FROM logs_acao WHERE usuario LIKE 'bench%'").fetchone()[0]
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = preparar_banco_temporario(diretorio, pacientes=1, registros_por_paciente=1)
+        db = DatabaseManager(caminho)
+        n = (acoes // threads) * threads
+
+        def sincrono(acao, usuario):
+            db.gravar_logs_acao([(datetime.now().isoformat(), acao, usuario)])
+
+        (p50_s, p99_s), total_s = medir(sincrono)
+        (p50_a, p99_a), total_a = medir(db.salvar_log_acao)
+        inicio = time.perf_counter()
+        db.auditoria.encerrar()
+        drenagem = (time.perf_counter() - inicio) * 1000
+        gravadas = contar(db)
+        estat = db.auditoria.estatisticas()
+
+    print(f"Auditoria ({n} ações, {threads} threads)")
+    print(f"  INSERT + commit por ação: p50 {p50_s:7.3f} ms | p99 {p99_s:7.3f} ms | total {total_s:6.2f} s")
+    print(f"  fila + lotes            : p50 {p50_a:7.3f} ms | p99 {p99_a:7.3f} ms | total {total_a:6.2f} s"
+          f" | drenagem {drenagem:.1f} ms")
+    print(f"  lotes gravados: {estat['lotes']} | gravação síncrona (fila cheia): {estat['sincronos']}"
+          f" | descartadas: {estat['descartados']} | perdidas após retentativas: {estat['perdidos']}")
+    ok = gravadas == 2 * n
+    print(f"  Ações no banco: {gravadas}/{2 * n} {'OK' if ok else 'DIVERGÊNCIA'}")
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks da camada de dados.')
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+
+    p_conc = sub.add_parser('concorrencia', help='Vazão de leitores sob carga mista (padrão x modo servidor).')
+    p_conc.add_argument('--segundos', type=float, default=5)
+    p_conc.add_argument('--leitores', type=int, default=8)
+    p_conc.add_argument('--escritores', type=int, default=2)
+    p_conc.add_argument('--pacientes', type=int, default=50)
+
+    sub.add_parser('planos', help='Verifica se as leituras quentes sobre registros usam índice.')
+
+    p_met = sub.add_parser('metricas', help='Tempo das métricas glicêmicas vetorizadas em históricos longos.')
+    p_met.add_argument('--leituras', type=int, default=1_000_000)
+
+    p_ins = sub.add_parser('insulina', help='IA pontual e série completa com as curvas pré-calculadas.')
+    p_ins.add_argument('--dias', type=int, default=90)
+
+    p_bol = sub.add_parser('bolus', help='Sugestões de Bolus uma a uma x em lote.')
+    p_bol.add_argument('--cenarios', type=int, default=2000)
+    p_bol.add_argument('--pacientes', type=int, default=50)
+
+    p_ali = sub.add_parser('alimentos', help='Latência da busca de alimentos (índice em memória x FTS5 x LIKE).')
+    p_ali.add_argument('--linhas', type=int, default=100_000)
+
+    p_aud = sub.add_parser('auditoria', help='Latência do log de auditoria: gravação na hora x fila em lotes.')
+    p_aud.add_argument('--acoes', type=int, default=5000)
+    p_aud.add_argument('--threads', type=int, default=8)
+
+    args = parser.parse_args()
+    if args.benchmark == 'concorrencia':
+        benchmark_concorrencia(args.segundos, args.leitores, args.escritores, args.pacientes)
+    elif args.benchmark == 'planos':
+        sys.exit(0 if verificar_planos() else 1)
+    elif args.benchmark == 'metricas':
+        benchmark_metricas(args.leituras)
+    elif args.benchmark == 'insulina':
+        benchmark_insulina(args.dias)
+    elif args.benchmark == 'bolus':
+        sys.exit(0 if benchmark_bolus(args.cenarios, args.pacientes) else 1)
+    elif args.benchmark == 'alimentos':
+        benchmark_alimentos(args.linhas)
+    elif args.benchmark == 'auditoria':
+        sys.exit(0 if benchmark_auditoria(args.acoes, args.threads) else 1)
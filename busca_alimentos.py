@@ -0,0 +1,339 @@
+# busca_alimentos.py
+"""
+Índice em memória para a busca de alimentos (/buscar_alimentos).
+
+Os nomes são normalizados (sem acentos, minúsculos, só letras/dígitos), então
+"Pão", "pao" e "PÃO" são o mesmo termo. A busca combina:
+
+- trigramas: cada trigrama aponta para um array ordenado de documentos; um termo
+  de 3+ letras é a interseção das listas dos seus trigramas (depois conferida
+  com 'in'), o que dá busca por substring sem varrer a tabela;
+- prefixo de palavra: os tokens distintos ficam numa lista ordenada e o
+  intervalo que começa com o termo sai por busca binária (termos de 1-2 letras
+  usam só isso).
+
+Ranking (menor é melhor): nome igual ao termo, nome que começa com o termo,
+todas as palavras do termo no início de palavras do nome, substring no meio.
+Empates: nome mais curto, depois ordem alfabética.
+
+O índice é imutável; recarregar monta um novo e troca a referência, então
+buscas concorrentes nunca veem um estado pela metade.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+_NAO_ALFANUMERICO = re.compile(r'[^0-9a-z]+')
+
+# Faixas do ranking
+EXATO, INICIO_NOME, INICIO_PALAVRAS, SUBSTRING = 0, 1, 2, 3
+
+
+def normalizar(texto):
+    """'Pão de Queijo®' -> 'pao de queijo'."""
+    sem_acento = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii')
+    return _NAO_ALFANUMERICO.sub(' ', sem_acento.lower()).strip()
+
+
+def consulta_fts(termo):
+    """
+    Expressão MATCH do FTS5 para o termo digitado: cada palavra vira um prefixo
+    entre aspas ("arr"*) e o espaço entre elas é AND. '' se não sobrar palavra.
+    """
+    return ' '.join(f'"{token}"*' for token in normalizar(termo).split())
+
+
+def _trigramas(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def _fim_prefixo(prefixo):
+    # Menor string maior que todas as que começam com 'prefixo'
+    return prefixo + '￿'
+
+
+class IndiceAlimentos:
+    """Índice imutável sobre as linhas de 'alimentos'."""
+
+    def __init__(self, linhas):
+        """linhas: dicionários com id, alimento, medida_caseira, peso, kcal, carbs."""
+        self.itens = [dict(linha) for linha in linhas]
+        self.nomes = [normalizar(item['alimento']) for item in self.itens]
+        n = len(self.itens)
+
+        # Chave de desempate: comprimento do nome e posição alfabética
+        ordem = sorted(range(n), key=lambda i: (self.nomes[i], self.itens[i]['alimento']))
+        posicao = np.empty(n, dtype=np.int64)
+        posicao[ordem] = np.arange(n)
+        comprimento = np.array([len(nome) for nome in self.nomes], dtype=np.int64)
+        self._desempate = (comprimento << 20) | posicao
+
+        # Nomes completos ordenados (igualdade e "começa com")
+        self._nomes_ordenados = [self.nomes[i] for i in ordem]
+        self._ordem_nomes = np.array(ordem, dtype=np.int32)
+
+        # Tokens distintos ordenados -> documentos (prefixo de palavra) e trigramas -> documentos
+        por_token, por_trigrama = {}, {}
+        for doc, nome in enumerate(self.nomes):
+            tokens = set(nome.split())
+            for token in tokens:
+                por_token.setdefault(token, []).append(doc)
+            for trigrama in set().union(*(_trigramas(t) for t in tokens)) if tokens else ():
+                por_trigrama.setdefault(trigrama, []).append(doc)
+        self._tokens = sorted(por_token)
+        self._docs_token = [np.array(por_token[t], dtype=np.int32) for t in self._tokens]
+        self._docs_trigrama = {t: np.array(docs, dtype=np.int32) for t, docs in por_trigrama.items()}
+        self._vazio = np.empty(0, dtype=np.int32)
+        self._corretor = None
+
+    def __len__(self):
+        return len(self.itens)
+
+    @property
+    def corretor(self):
+        # Montado só na primeira correção (a maioria das buscas não precisa)
+        if self._corretor is None:
+            self._corretor = CorretorOrtografico(
+                {token: len(docs) for token, docs in zip(self._tokens, self._docs_token)}
+            )
+        return self._corretor
+
+    def corrigir_termo(self, termo):
+        """
+        Troca as palavras do termo que não aparecem em nenhum nome do catálogo,
+        nem como trecho de palavra, pela mais próxima do vocabulário ("arros" ->
+        "arroz", "macarao" -> "macarrao"; "cao" fica, pois está em "coracao").
+        Retorna o termo normalizado corrigido, ou None se nada mudou.
+        """
+        palavras = normalizar(termo).split()
+        corrigidas = []
+        for palavra in palavras:
+            if len(palavra) >= 3 and not self._palavra_conhecida(palavra):
+                palavra = self.corretor.corrigir(palavra) or palavra
+            corrigidas.append(palavra)
+        return ' '.join(corrigidas) if corrigidas != palavras else None
+
+    def _palavra_conhecida(self, palavra):
+        """True se a palavra começa uma palavra do catálogo ou aparece dentro de algum nome."""
+        if self._listas_prefixo_palavra(palavra):
+            return True
+        nomes = self.nomes
+        return any(palavra in nomes[d] for d in self._docs_trigramas(palavra).tolist())
+
+    # --- Candidatos ---
+
+    def _marcar(self, listas):
+        """Máscara booleana (por documento) da união de listas de documentos."""
+        mascara = np.zeros(len(self.itens), dtype=bool)
+        if listas:
+            mascara[np.concatenate(listas) if len(listas) > 1 else listas[0]] = True
+        return mascara
+
+    def _listas_prefixo_palavra(self, prefixo):
+        """Listas de documentos dos tokens que começam com 'prefixo' (busca binária)."""
+        inicio = bisect_left(self._tokens, prefixo)
+        fim = bisect_left(self._tokens, _fim_prefixo(prefixo), inicio)
+        return self._docs_token[inicio:fim]
+
+    def _docs_trigramas(self, token):
+        """
+        Documentos que têm todos os trigramas do token (ordenados). É um
+        superconjunto dos que contêm o token; a confirmação fica para o fim.
+        """
+        listas = []
+        for trigrama in _trigramas(token):
+            docs = self._docs_trigrama.get(trigrama)
+            if docs is None:
+                return self._vazio
+            listas.append(docs)
+        listas.sort(key=len)
+        docs = listas[0]
+        for outra in listas[1:]:
+            docs = np.intersect1d(docs, outra, assume_unique=True)
+            if not docs.size:
+                break
+        return docs
+
+    def _docs_inicio_nome(self, termo):
+        """(docs cujo nome começa com o termo, docs com nome igual ao termo)."""
+        inicio = bisect_left(self._nomes_ordenados, termo)
+        fim = bisect_left(self._nomes_ordenados, _fim_prefixo(termo), inicio)
+        # Na lista ordenada, os nomes iguais ao termo vêm primeiro no intervalo
+        fim_iguais = bisect_right(self._nomes_ordenados, termo, inicio, fim)
+        return self._ordem_nomes[inicio:fim], self._ordem_nomes[inicio:fim_iguais]
+
+    # --- Busca ---
+
+    def buscar(self, termo, limite=None):
+        """
+        Alimentos cujo nome contém TODAS as palavras do termo (sem acento/caixa;
+        palavras de 1-2 letras só no início de palavra), ordenados por qualidade.
+        Retorna cópias dos dicionários das linhas.
+        """
+        termo = normalizar(termo)
+        tokens = sorted(set(termo.split()), key=len, reverse=True)
+        if not tokens or not self.itens:
+            return []
+        longos = [t for t in tokens if len(t) >= 3]
+        curtos = [t for t in tokens if len(t) < 3]
+
+        # 1. Candidatos: trigramas dos termos longos (do mais seletivo), filtrados
+        #    pelas máscaras de prefixo de palavra dos termos curtos
+        candidatos = None
+        for token in longos:
+            docs = self._docs_trigramas(token)
+            candidatos = docs if candidatos is None else np.intersect1d(candidatos, docs, assume_unique=True)
+            if not candidatos.size:
+                return []
+        for token in curtos:
+            listas = self._listas_prefixo_palavra(token)
+            if candidatos is None:
+                candidatos = np.flatnonzero(self._marcar(listas))
+            else:
+                candidatos = candidatos[self._marcar(listas)[candidatos]]
+            if not candidatos.size:
+                return []
+
+        # 2. Faixa de ranking de cada candidato
+        faixa = np.full(candidatos.size, SUBSTRING, dtype=np.int64)
+        inicio_palavras = np.ones(candidatos.size, dtype=bool)
+        for token in longos:  # os curtos já são início de palavra por construção
+            inicio_palavras &= self._marcar(self._listas_prefixo_palavra(token))[candidatos]
+        faixa[inicio_palavras] = INICIO_PALAVRAS
+        comeca, iguais = self._docs_inicio_nome(termo)
+        if comeca.size:
+            faixa[self._marcar([comeca])[candidatos]] = INICIO_NOME
+            if iguais.size:
+                faixa[self._marcar([iguais])[candidatos]] = EXATO
+        chave = (faixa << 50) | self._desempate[candidatos]
+
+        # 3. Percorre na ordem do ranking confirmando as substrings (trigramas
+        #    podem dar falso positivo) até completar o limite
+        nomes = self.nomes
+        resultado = []
+        for d in candidatos[np.argsort(chave)].tolist():
+            nome = nomes[d]
+            if all(token in nome for token in longos):
+                resultado.append(dict(self.itens[d]))
+                if limite is not None and len(resultado) >= limite:
+                    break
+        return resultado
+
+
+def _delecoes(palavra, distancia):
+    """Todas as variantes de 'palavra' com até 'distancia' letras removidas (inclui a própria)."""
+    variantes = {palavra}
+    fronteira = {palavra}
+    for _ in range(distancia):
+        fronteira = {p[:i] + p[i + 1:] for p in fronteira for i in range(len(p))} - variantes
+        variantes |= fronteira
+    return variantes
+
+
+def distancia_edicao(a, b, limite):
+    """
+    Distância de Damerau-Levenshtein (transposição de vizinhas) entre a e b,
+    ou limite + 1 se passar do limite (corta cedo).
+    """
+    if abs(len(a) - len(b)) > limite:
+        return limite + 1
+    anterior2 = None
+    anterior = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        atual = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            custo = 0 if a[i - 1] == b[j - 1] else 1
+            atual[j] = min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + custo)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                atual[j] = min(atual[j], anterior2[j - 2] + 1)
+        if min(atual) > limite:
+            return limite + 1
+        anterior2, anterior = anterior, atual
+    return anterior[-1]
+
+
+class CorretorOrtografico:
+    """
+    Correção de palavras pelo vocabulário do catálogo (estilo SymSpell): cada
+    palavra é indexada por todas as suas deleções até DISTANCIA_MAXIMA; uma
+    consulta gera as próprias deleções e só compara (Damerau-Levenshtein) com
+    as palavras que compartilham alguma delas.
+    """
+
+    DISTANCIA_MAXIMA = 2
+
+    def __init__(self, frequencias):
+        """frequencias: {palavra normalizada: nº de alimentos que a contêm}."""
+        self.frequencias = frequencias
+        self._por_delecao = {}
+        for palavra in frequencias:
+            if len(palavra) < 3:
+                continue
+            for variante in _delecoes(palavra, self._distancia_para(palavra)):
+                self._por_delecao.setdefault(variante, []).append(palavra)
+
+    def _distancia_para(self, palavra):
+        # Palavras curtas toleram só 1 erro; senão "arroz" viraria qualquer coisa
+        return 1 if len(palavra) <= 4 else self.DISTANCIA_MAXIMA
+
+    def corrigir(self, palavra):
+        """Palavra do vocabulário mais próxima (menor distância, depois mais frequente) ou None."""
+        limite = self._distancia_para(palavra)
+        candidatas = set()
+        for variante in _delecoes(palavra, limite):
+            candidatas.update(self._por_delecao.get(variante, ()))
+        melhor, melhor_chave = None, None
+        for candidata in candidatas:
+            distancia = distancia_edicao(palavra, candidata, limite)
+            if distancia > limite:
+                continue
+            chave = (distancia, -self.frequencias[candidata], candidata)
+            if melhor_chave is None or chave < melhor_chave:
+                melhor, melhor_chave = candidata, chave
+        return melhor
+
+
+class BuscaAlimentos:
+    """
+    Mantém o IndiceAlimentos atual de um DatabaseManager.
+
+    O índice é montado no primeiro uso e recarregado após gravações feitas por
+    este processo (invalidar()). Gravações de outros processos aparecem quando
+    o índice passa de 'ttl' segundos.
+    """
+
+    def __init__(self, carregar_linhas, ttl=300.0):
+        self._carregar_linhas = carregar_linhas
+        self.ttl = ttl
+        self._indice = None
+        self._montado_em = 0.0
+        self._lock = threading.Lock()
+        self.metricas = {'reconstrucoes': 0, 'ultima_reconstrucao_ms': None}
+
+    def indice(self):
+        indice = self._indice
+        if indice is None or time.monotonic() - self._montado_em > self.ttl:
+            with self._lock:
+                if self._indice is None or time.monotonic() - self._montado_em > self.ttl:
+                    inicio = time.perf_counter()
+                    self._indice = IndiceAlimentos(self._carregar_linhas())
+                    self._montado_em = time.monotonic()
+                    self.metricas['reconstrucoes'] += 1
+                    self.metricas['ultima_reconstrucao_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+                indice = self._indice
+        return indice
+
+    def invalidar(self):
+        """Descarta o índice; o próximo uso recarrega da tabela."""
+        self._indice = None
+
+    def buscar(self, termo, limite=None):
+        return self.indice().buscar(termo, limite)
+
+    def corrigir_termo(self, termo):
+        return self.indice().corrigir_termo(termo)
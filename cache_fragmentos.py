@@ -0,0 +1,86 @@
+# cache_fragmentos.py
+"""
+Cache de fragmentos de HTML por paciente (snippets dos painéis médicos).
+
+O HTML renderizado de um snippet fica guardado com a chave
+(template, paciente_id, versão dos dados do paciente). A versão
+(versao_dados_paciente) é incrementada por triggers a cada escrita em
+registros, ficha médica, agendamentos, exames e parâmetros (migrações 008 e
+012). Então o fragmento é reaproveitado até os dados do paciente mudarem, e
+qualquer escrita, de qualquer processo, força uma nova renderização.
+
+Nos templates:
+    {{ fragmento_paciente('ficha_medica_snippet.html', paciente.id) }}
+    {{ fragmento_paciente('paciente_linha_snippet.html', paciente.id, paciente=paciente) }}
+
+O snippet é renderizado com o contexto do template que o chama (como um
+{% include %}) mais os argumentos extras. Por isso ele deve depender só dos
+dados do paciente, não de quem está logado.
+
+O objeto Template também entra na chave: com auto_reload (debug), um snippet
+editado gera outro objeto Template e deixa de reaproveitar o HTML antigo.
+"""
+
+from flask import g
+from jinja2 import pass_context
+from markupsafe import Markup
+
+from cache_ttl import CacheTTL
+
+
+class CacheFragmentos:
+    """HTML de snippets por (template, paciente, versão dos dados)."""
+
+    def __init__(self, obter_versoes, tamanho_maximo=4096, ttl=300.0):
+        """
+        obter_versoes: função [paciente_id] -> {paciente_id: versao}
+        (DatabaseManager.obter_versoes_dados).
+        ttl: limite de idade do HTML. As métricas por janela de dias (TIR/CV
+        dos últimos 14 dias) mudam com o tempo mesmo sem escrita nova.
+        """
+        self.obter_versoes = obter_versoes
+        self.cache = CacheTTL(tamanho_maximo=tamanho_maximo, ttl=ttl, nome='fragmentos')
+
+    def _versoes_requisicao(self):
+        # Versões lidas uma vez por requisição (flask.g), para todos os fragmentos da página
+        if 'versoes_fragmentos' not in g:
+            g.versoes_fragmentos = {}
+        return g.versoes_fragmentos
+
+    def precarregar_versoes(self, paciente_ids):
+        """Lê numa única consulta as versões dos pacientes que a página vai mostrar."""
+        versoes = self._versoes_requisicao()
+        faltantes = [pid for pid in paciente_ids if pid not in versoes]
+        if faltantes:
+            versoes.update(self.obter_versoes(faltantes))
+
+    def versao(self, paciente_id):
+        versoes = self._versoes_requisicao()
+        if paciente_id not in versoes:
+            versoes.update(self.obter_versoes([paciente_id]))
+        return versoes[paciente_id]
+
+    def renderizar(self, template, paciente_id, renderizar):
+        """HTML do fragmento: do cache ou de renderizar(), guardado com a versão atual."""
+        chave = (template, paciente_id, self.versao(paciente_id))
+        return Markup(self.cache.obter_ou_calcular(chave, renderizar))
+
+    def estatisticas(self):
+        return self.cache.estatisticas()
+
+
+def init_app(app, obter_versoes, **opcoes):
+    """Cria o cache (app.extensions['cache_fragmentos']) e a função de template fragmento_paciente."""
+    cache = CacheFragmentos(obter_versoes, **opcoes)
+    app.extensions['cache_fragmentos'] = cache
+
+    @pass_context
+    def fragmento_paciente(contexto, nome_template, paciente_id, **extras):
+        template = contexto.environment.get_template(nome_template)
+        return cache.renderizar(
+            template, paciente_id,
+            lambda: template.render(contexto.get_all(), **extras),
+        )
+
+    app.jinja_env.globals['fragmento_paciente'] = fragmento_paciente
+    return cache
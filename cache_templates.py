@@ -0,0 +1,95 @@
+# cache_templates.py
+"""
+Configuração do cache de templates Jinja conforme o ambiente.
+
+Produção (padrão):
+    - cache LRU limitado de templates compilados (TAMANHO_CACHE_TEMPLATES);
+    - sem auto_reload (o arquivo não é conferido a cada render);
+    - FileSystemBytecodeCache num diretório compartilhado pelos workers: o
+      template é compilado uma vez e os outros processos carregam o bytecode.
+
+Debug (app.debug, FLASK_DEBUG=1 ou GLICEMIA_DEBUG=1):
+    - comportamento antigo: cache em dicionário com auto_reload, de modo que
+      qualquer alteração no HTML aparece no próximo acesso; sem bytecode em disco.
+
+Pré-compilação no deploy (preenche o cache de bytecode antes da primeira requisição):
+    flask --app app precompilar-templates
+"""
+
+import os
+import time
+
+import click
+from jinja2 import FileSystemBytecodeCache
+from jinja2.utils import LRUCache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DIRETORIO_BYTECODE_PADRAO = os.path.join(BASE_DIR, 'data', 'cache_templates')
+TAMANHO_CACHE_TEMPLATES = 200  # o app tem ~55 templates; sobra espaço para os dos blueprints
+
+
+def _ambiente_debug(app):
+    if app.debug:
+        return True
+    return any(
+        os.environ.get(variavel, '').lower() in ('1', 'true', 'sim')
+        for variavel in ('FLASK_DEBUG', 'GLICEMIA_DEBUG')
+    )
+
+
+def configurar_templates(app, debug=None):
+    """Aplica a configuração de cache de templates de produção ou de debug."""
+    if debug is None:
+        debug = _ambiente_debug(app)
+    ambiente = app.jinja_env
+
+    if debug:
+        ambiente.cache = {}
+        ambiente.auto_reload = True
+        ambiente.bytecode_cache = None
+        return
+
+    diretorio = os.environ.get('GLICEMIA_CACHE_TEMPLATES', DIRETORIO_BYTECODE_PADRAO)
+    try:
+        os.makedirs(diretorio, exist_ok=True)
+        ambiente.bytecode_cache = FileSystemBytecodeCache(diretorio)
+    except OSError as e:
+        # Sem diretório gravável, segue só com o cache em memória
+        print(f"Aviso: cache de bytecode de templates desativado ({diretorio}): {e}")
+        ambiente.bytecode_cache = None
+    ambiente.cache = LRUCache(TAMANHO_CACHE_TEMPLATES)
+    ambiente.auto_reload = False
+
+
+def precompilar_templates(app):
+    """
+    Compila todos os templates do app e dos blueprints, gravando o bytecode.
+    Retorna (compilados, falhas), sendo falhas uma lista de (template, erro).
+    """
+    ambiente = app.jinja_env
+    compilados, falhas = 0, []
+    for nome in ambiente.list_templates():
+        try:
+            ambiente.get_template(nome)
+            compilados += 1
+        except Exception as e:
+            falhas.append((nome, e))
+    return compilados, falhas
+
+
+def init_app(app):
+    """Configura o cache de templates e registra o comando 'flask precompilar-templates'."""
+    configurar_templates(app)
+
+    @app.cli.command('precompilar-templates')
+    def precompilar_templates_comando():
+        """Compila todos os templates e grava o cache de bytecode (rodar no deploy)."""
+        configurar_templates(app, debug=False)
+        inicio = time.perf_counter()
+        compilados, falhas = precompilar_templates(app)
+        tempo_ms = (time.perf_counter() - inicio) * 1000
+        cache = app.jinja_env.bytecode_cache
+        destino = f"bytecode em {cache.directory}" if cache is not None else "sem cache de bytecode"
+        click.echo(f"{compilados} templates compilados em {tempo_ms:.0f} ms ({destino}).")
+        for nome, erro in falhas:
+            click.echo(f"  Falha em {nome}: {erro}")
@@ -0,0 +1,106 @@
+# cache_ttl.py
+
+import threading
+import time
+from collections import OrderedDict
+
+_AUSENTE = object()
+
+
+class CacheTTL:
+    """
+    Cache em memória, thread-safe, com expiração (TTL) e limite de tamanho (LRU).
+
+    - Entradas vencidas são descartadas na leitura.
+    - Ao passar de 'tamanho_maximo', sai a entrada usada há mais tempo.
+    - estatisticas() expõe acertos/falhas para monitoramento.
+    """
+
+    def __init__(self, tamanho_maximo=256, ttl=300.0, nome='cache'):
+        self.nome = nome
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self._dados = OrderedDict()  # chave -> (instante de expiração, valor)
+        self._lock = threading.Lock()
+
+        # Métricas
+        self._acertos = 0
+        self._falhas = 0
+        self._expirados = 0
+        self._remocoes = 0
+        self._invalidacoes = 0
+
+    def obter(self, chave, padrao=None):
+        agora = time.monotonic()
+        with self._lock:
+            item = self._dados.get(chave, _AUSENTE)
+            if item is _AUSENTE:
+                self._falhas += 1
+                return padrao
+            expira_em, valor = item
+            if expira_em <= agora:
+                del self._dados[chave]
+                self._expirados += 1
+                self._falhas += 1
+                return padrao
+            self._dados.move_to_end(chave)
+            self._acertos += 1
+            return valor
+
+    def definir(self, chave, valor, ttl=None):
+        expira_em = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._dados[chave] = (expira_em, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.tamanho_maximo:
+                self._dados.popitem(last=False)
+                self._remocoes += 1
+
+    def obter_ou_calcular(self, chave, funcao, ttl=None):
+        """
+        Retorna o valor em cache ou calcula com funcao() e guarda.
+        O cálculo roda fora do lock (duas threads podem calcular a mesma chave
+        ao mesmo tempo; a última escrita vence, o que é inofensivo aqui).
+        """
+        valor = self.obter(chave, _AUSENTE)
+        if valor is _AUSENTE:
+            valor = funcao()
+            self.definir(chave, valor, ttl)
+        return valor
+
+    def invalidar(self, chave):
+        with self._lock:
+            if self._dados.pop(chave, _AUSENTE) is not _AUSENTE:
+                self._invalidacoes += 1
+
+    def invalidar_se(self, predicado):
+        """Remove todas as entradas cuja chave satisfaz predicado(chave)."""
+        with self._lock:
+            chaves = [c for c in self._dados if predicado(c)]
+            for chave in chaves:
+                del self._dados[chave]
+            self._invalidacoes += len(chaves)
+
+    def limpar(self):
+        with self._lock:
+            self._invalidacoes += len(self._dados)
+            self._dados.clear()
+
+    def __len__(self):
+        return len(self._dados)
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self._acertos + self._falhas
+            return {
+                'nome': self.nome,
+                'tamanho': len(self._dados),
+                'tamanho_maximo': self.tamanho_maximo,
+                'ttl_s': self.ttl,
+                'acertos': self._acertos,
+                'falhas': self._falhas,
+                'expirados': self._expirados,
+                'remocoes_lru': self._remocoes,
+                'invalidacoes': self._invalidacoes,
+                'taxa_acerto': round(self._acertos / consultas, 4) if consultas else 0.0,
+            }
@@ -1,270 +1,296 @@
 import os
 import sqlite3
-import json
+from dataclasses import dataclass, field
 from sqlite3 import Row 
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta 
+from datetime import datetime, timedelta
+from urllib.request import pathname2url
+from pool_conexoes import PoolConexoes
+from metricas_glicemicas import SerieGlicemica, metricas_por_paciente, calcular_agp, indices_lttb, SEGUNDOS_DIA
+from cache_ttl import CacheTTL
+from agenda_parametros import AgendaParametros
+from busca_alimentos import BuscaAlimentos, consulta_fts, normalizar
+from auditoria import FilaAuditoria
+from models import User
+from migracoes import (VERSAO_ESQUEMA, EsquemaDesatualizado, aplicar_migracoes, exigir_esquema_atual,
+                       preencher_ts_epoch, reconstruir_registros_diarios)
 LIMITE_HIPO = 70
 LIMITE_HIPER = 180
 
+# registros.ts_epoch guarda o horário de parede de data_hora como segundos desde
+# 1970 "como se fosse UTC" (ver migracoes.SQL_TS_EPOCH). As duas funções abaixo
+# fazem a conversão nos dois sentidos sem depender do fuso do servidor.
+_EPOCH = datetime(1970, 1, 1)
+
+def datetime_para_epoch(dt):
+    """datetime (ingênuo, horário local) -> inteiro comparável com registros.ts_epoch."""
+    return int((dt - _EPOCH).total_seconds())
+
+def epoch_para_datetime(ts):
+    """Valor de registros.ts_epoch -> datetime ingênuo (horário local gravado)."""
+    return _EPOCH + timedelta(seconds=ts)
+
+
+def caminho_banco(db_path='glicemia.db'):
+    """Caminho do arquivo do banco: relativo à pasta data/ do projeto, ou absoluto."""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    db_folder = os.path.join(base_dir, 'data')
+    os.makedirs(db_folder, exist_ok=True)
+    return os.path.join(db_folder, db_path)
+
+
+@dataclass
+class PainelMedico:
+    """
+    Dados do painel do médico, carregados de uma vez por
+    DatabaseManager.carregar_painel_medico (número fixo de consultas).
+    """
+    medico_id: int
+    pacientes: list                     # dicionários de obter_pacientes_do_medico + 'metricas'
+    pacientes_pendentes: int            # sem RIC da manhã, FSI ou meta glicêmica
+    registros_hoje: int
+    media_glicemia: float | None        # média das medições de glicemia (rollup diário, medicao_*)
+    tir_medio: float | None             # média do TIR de 14 dias dos pacientes com leituras
+    pacientes_em_alerta: int            # TIR < 70% ou TBR > 4% (metas do consenso internacional)
+    metricas_pacientes: dict = field(default_factory=dict)       # {paciente_id: métricas de 14 dias}
+    registros_hoje_por_paciente: dict = field(default_factory=dict)
+    media_glicemia_por_paciente: dict = field(default_factory=dict)
+
+    @property
+    def total_pacientes_vinculados(self):
+        return len(self.pacientes)
+
+    def resumo(self):
+        """Dicionário no formato usado por dashboard_medico.html (o de obter_resumo_medico_filtrado)."""
+        return {
+            'total_pacientes_vinculados': self.total_pacientes_vinculados,
+            'pacientes_pendentes': self.pacientes_pendentes,
+            'registros_hoje': self.registros_hoje,
+            'media_glicemia': f"{self.media_glicemia:.1f}" if self.media_glicemia else 'N/A',
+            'tir_medio': f"{self.tir_medio:.1f}" if self.tir_medio is not None else 'N/A',
+            'pacientes_em_alerta': self.pacientes_em_alerta,
+            'metricas_pacientes': self.metricas_pacientes,
+        }
+
+# PRAGMAs aplicados a cada conexão no "modo servidor" (WAL + leitores/escritor separados)
+PRAGMAS_MODO_SERVIDOR = {
+    'synchronous': 'NORMAL',    # Seguro em WAL; evita um fsync por commit
+    'cache_size': -20000,       # ~20 MB de page cache por conexão (valor negativo = KiB)
+    'mmap_size': 268435456,     # 256 MB de leitura via memory-map
+    'temp_store': 'MEMORY',     # Tabelas temporárias (ORDER BY/GROUP BY) em memória
+    'busy_timeout': 5000,       # ms esperando o lock antes de falhar
+}
+
+# Leituras frequentes sobre registros (todas recebem o id do paciente).
+# verificar_planos_consulta() garante que nenhuma delas faz full table scan.
+CONSULTAS_QUENTES_REGISTROS = (
+    'carregar_registros',
+    'obter_resumo_paciente',
+    'buscar_ultima_glicemia',
+    'buscar_doses_insulina_recentes',
+    'calcular_dose_media_aplicada',
+    'carregar_registros_glicemia_nutricao',
+    'obter_dados_glicemia_para_grafico',
+    'obter_carbs_diarios_para_grafico',
+    'obter_calorias_diarias_para_grafico',
+)
+
+
+def etapas_sem_indice(plano):
+    """
+    Etapas de um EXPLAIN QUERY PLAN que indicam falta de índice: SCAN sem
+    'USING' (full table scan) e 'USE TEMP B-TREE' (ORDER BY/GROUP BY/DISTINCT
+    ordenado em memória em vez de seguir um índice).
+    """
+    return [
+        etapa for etapa in plano
+        if (etapa.startswith('SCAN ') and 'USING' not in etapa) or 'USE TEMP B-TREE' in etapa
+    ]
+
+
 class DatabaseManager:
-    def __init__(self, db_path='glicemia.db'):
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        db_folder = os.path.join(base_dir, 'data')
-        os.makedirs(db_folder, exist_ok=True)
-        self.db_path = os.path.join(db_folder, db_path)
-        
-        # Chamadas agora devem funcionar:
-        self.inicializar_db() 
-        self.add_new_columns() # Certifique-se que esta função também esteja dentro da classe.
-        self._migrate_json_to_sqlite() # Certifique-se que esta função também esteja dentro da classe.
+    def __init__(self, db_path='glicemia.db', tamanho_pool=8, modo_servidor=None, motor_busca_alimentos=None,
+                 exigir_esquema=True):
+        self.db_path = caminho_banco(db_path)
+
+        # Modo servidor é opt-in: parâmetro explícito ou variável de ambiente
+        if modo_servidor is None:
+            modo_servidor = os.environ.get('GLICEMIA_MODO_SERVIDOR', '').lower() in ('1', 'true', 'sim')
+        self.modo_servidor = modo_servidor
+
+        if self.modo_servidor:
+            self._ativar_wal()
+            # Um único escritor serializado (pool de tamanho 1) e um pool de leitores somente-leitura
+            self.pool = PoolConexoes(self._abrir_conexao, tamanho_maximo=1)
+            self.pool_leitura = PoolConexoes(self._abrir_conexao_leitura, tamanho_maximo=tamanho_pool)
+        else:
+            # Pool de conexões: evita abrir/fechar uma conexão (e repetir o PRAGMA) a cada método
+            self.pool = PoolConexoes(self._abrir_conexao, tamanho_maximo=tamanho_pool)
+            self.pool_leitura = self.pool
+
+        # Resultados derivados (AGP) por (paciente, janela, versão dos dados)
+        self.cache_agp = CacheTTL(tamanho_maximo=512, ttl=600.0, nome='agp')
+        # Parâmetros de Bolus e agenda por (paciente, versão dos dados): a migração 012
+        # muda a versão a cada escrita em users/parametros_clinicos/agenda_parametros,
+        # então uma gravação em qualquer processo (modo servidor) vale em todos
+        self.cache_parametros = CacheTTL(tamanho_maximo=1024, ttl=300.0, nome='parametros_clinicos')
+        # Usuário logado (load_user do Flask-Login), por id; invalidado ao alterar/excluir o usuário
+        self.cache_identidades = CacheTTL(tamanho_maximo=4096, ttl=60.0, nome='identidades')
+        # Busca de alimentos: 'fts' (alimentos_fts, migração 010) ou 'indice' (em memória).
+        # Sem a tabela FTS5 no banco, usa o índice em memória.
+        if motor_busca_alimentos is None:
+            motor_busca_alimentos = os.environ.get('GLICEMIA_BUSCA_ALIMENTOS', 'fts').lower()
+        self.motor_busca_alimentos = motor_busca_alimentos
+        self._fts_alimentos_disponivel = None
+        # Índice em memória da tabela alimentos (montado no primeiro uso)
+        self.busca_alimentos = BuscaAlimentos(self._linhas_alimentos_indice)
+        # Resultados das buscas mais frequentes (termo normalizado, limite)
+        self.cache_busca_alimentos = CacheTTL(tamanho_maximo=512, ttl=300.0, nome='busca_alimentos')
+
+        # Log de auditoria: fila limitada gravada em lotes por uma thread de fundo.
+        # Com a fila cheia, a política padrão ('sincrono') grava na hora.
+        self.auditoria = FilaAuditoria(
+            self.gravar_logs_acao,
+            politica=os.environ.get('GLICEMIA_AUDITORIA_POLITICA', 'sincrono').lower(),
+        )
 
-    def get_db_connection(self):
+        # O esquema é criado/atualizado por 'python migracoes.py'; aqui só conferimos a versão.
+        # Com migrações pendentes, falha já na construção (exigir_esquema=False só para o próprio migrador).
+        self.verificar_esquema(exigir=exigir_esquema)
+
+    def _ativar_wal(self):
+        """Coloca o banco em journal_mode=WAL (persistente no arquivo)."""
         conn = sqlite3.connect(self.db_path)
+        try:
+            modo = conn.execute("PRAGMA journal_mode = WAL;").fetchone()[0]
+            if modo.lower() != 'wal':
+                print(f"Aviso: não foi possível ativar WAL (journal_mode atual: {modo}).")
+        finally:
+            conn.close()
+
+    def _aplicar_pragmas_servidor(self, conn):
+        for nome, valor in PRAGMAS_MODO_SERVIDOR.items():
+            conn.execute(f"PRAGMA {nome} = {valor};")
+
+    def _abrir_conexao(self):
+        """Abre uma conexão física nova. Usada apenas pelo pool."""
+        # check_same_thread=False: a conexão pode ser reutilizada por outra thread
+        # depois de devolvida ao pool (nunca por duas threads ao mesmo tempo).
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.execute("PRAGMA foreign_keys = ON;")
+        if self.modo_servidor:
+            self._aplicar_pragmas_servidor(conn)
         conn.row_factory = sqlite3.Row
         return conn
-        
-    def _load_json_data(self) -> dict:
-        """Carrega os dados de um arquivo JSON (modelo antigo) para migração."""
-        json_path = os.path.join(os.path.dirname(self.db_path), 'data.json')
-        if os.path.exists(json_path):
-            try:
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                print("Aviso: Arquivo data.json está corrompido ou vazio.")
-                return {}
-        return {}
-
-    def inicializar_db(self): 
-        """Cria as tabelas do banco de dados se elas não existirem."""
-        
-        with sqlite3.connect(self.db_path) as conn: 
-            cursor = conn.cursor()
-            
-            # --- 1. Tabela de Usuários (usuarios) ---
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL UNIQUE,
-                    password_hash TEXT NOT NULL,
-                    email TEXT,
-                    role TEXT NOT NULL DEFAULT 'simples',
-                    data_nascimento TEXT,
-                    sexo TEXT,
-                    razao_ic REAL,
-                    fator_sensibilidade REAL,
-                    meta_glicemia REAL,
-                    is_active INTEGER DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            
-            # --- 2. Tabela de Registros (registros) ---
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS registros (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    data_hora TIMESTAMP NOT NULL,
-                    tipo TEXT,
-                    valor REAL,
-                    carboidratos REAL,
-                    observacoes TEXT,
-                    alimentos_refeicao TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                );
-            """)
-            
-            # --- 3. Outras Tabelas (log_acoes, fichas_medicas, agendamentos) ---
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS log_acoes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL,
-                    acao TEXT NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS fichas_medicas (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    paciente_id INTEGER NOT NULL UNIQUE,
-                    condicao_atual TEXT,
-                    alergias TEXT,
-                    historico_familiar TEXT,
-                    medicamentos_uso TEXT,
-                    FOREIGN KEY (paciente_id) REFERENCES users(id)
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS detalhes_refeicao (
-                    registro_id INTEGER PRIMARY KEY,
-                    tipo_refeicao TEXT NOT NULL,
-                    carboidratos REAL,
-                    calorias REAL,
-                    alimentos_json TEXT,
-                    FOREIGN KEY (registro_id) REFERENCES registros (id)
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS agendamentos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    paciente_id INTEGER NOT NULL,
-                    medico_id INTEGER NOT NULL,
-                    data_hora TEXT NOT NULL,
-                    observacoes TEXT,
-                    status TEXT NOT NULL DEFAULT 'agendado',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (paciente_id) REFERENCES users(id),
-                    FOREIGN KEY (medico_id) REFERENCES users(id)
-                );
-            """)
-            
-            conn.commit()
-            
 
-    def adicionar_colunas_calculo(self):
-            """Adiciona colunas de cálculo de Bolus se elas não existirem."""
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # Lista de colunas a serem adicionadas, evitando repetição
-            colunas_a_adicionar = [
-                ('ric_manha', 'REAL'), 
-                ('ric_almoco', 'REAL'), 
-                ('ric_jantar', 'REAL'),
-                ('fsi_manha', 'REAL'), 
-                ('fsi_almoco', 'REAL'), 
-                ('fsi_jantar', 'REAL')
-            ]
-            
-            for nome, tipo in colunas_a_adicionar:
-                try:
-                    # Tenta adicionar a coluna
-                    cursor.execute(f"ALTER TABLE users ADD COLUMN {nome} {tipo}")
-                    print(f"Coluna '{nome}' adicionada com sucesso.")
-                except sqlite3.OperationalError as e:
-                    # Se a coluna já existir (erro: "duplicate column name"), ignora
-                    if 'duplicate column name' in str(e):
-                        pass
-                    else:
-                        print(f"Erro ao adicionar coluna {nome}: {e}")
-            
-            conn.commit()
-            conn.close()
+    def _abrir_conexao_leitura(self):
+        """Abre uma conexão somente-leitura (modo servidor)."""
+        uri = f"file:{pathname2url(self.db_path)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._aplicar_pragmas_servidor(conn)
+        conn.row_factory = sqlite3.Row
+        return conn
 
+    def get_db_connection(self, somente_leitura=False):
+        """
+        Retira uma conexão do pool. conn.close() (ou o fim do bloco 'with')
+        devolve a conexão ao pool em vez de fechá-la.
 
+        Com somente_leitura=True, no modo servidor a conexão vem do pool de
+        leitores; caso contrário, vem do escritor único (serializado).
+        Fora do modo servidor os dois pools são o mesmo.
 
-    def add_new_columns(self):
-        """Adiciona novas colunas necessárias ao esquema do DB (migration)."""
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-        
-        # Lista de colunas a tentar adicionar: (coluna, tipo)
-        columns_to_add = [
-            ('nome_completo', 'TEXT'),
-            ('telefone', 'TEXT'),
-            ('medico_id', 'INTEGER')
-        ]
-        
-        for col_name, col_type in columns_to_add:
-            try:
-                cursor.execute(f"ALTER TABLE users ADD COLUMN {col_name} {col_type};")
-                print(f"Coluna '{col_name}' adicionada à tabela users.")
-            except sqlite3.OperationalError as e:
-                if 'duplicate column name' in str(e):
-                    pass # Coluna já existe, ignora
-                else:
-                    raise 
-                    
-        conn.commit()
-        conn.close()
+        Exceção: se a thread já está com o escritor (leitura chamada de dentro
+        de um método de escrita), a leitura usa essa mesma conexão. Uma
+        conexão de leitura separada não enxergaria as linhas ainda não
+        commitadas da transação em andamento.
 
-    def _migrate_json_to_sqlite(self):
-        json_data = self._load_json_data()
-        if not json_data:
-            return
+        Use sempre 'with' (ou close() num finally): no modo servidor há um
+        único escritor, e um handle esquecido bloqueia as outras escritas até
+        o timeout do pool.
+        """
+        if somente_leitura and not self.pool.em_uso_nesta_thread():
+            return self.pool_leitura.obter()
+        return self.pool.obter()
+
+    def estatisticas_pool(self):
+        """Métricas do pool de conexões (checkouts, tempo de espera, tamanho, etc.)."""
+        if self.pool_leitura is self.pool:
+            return self.pool.estatisticas()
+        return {
+            'escrita': self.pool.estatisticas(),
+            'leitura': self.pool_leitura.estatisticas(),
+        }
 
-        print("Iniciando a migração dos dados do JSON para o SQLite...")
-        
-        # Certifique-se de importar o módulo 'json' e 'datetime' se ainda não o fez.
-        # import json
-        # from datetime import datetime 
-        
+    def verificar_esquema(self, exigir=True):
+        """
+        Compara a versão do esquema gravada no banco com VERSAO_ESQUEMA, sem
+        alterar o banco. Com migrações pendentes levanta EsquemaDesatualizado
+        (ou, com exigir=False, apenas avisa e retorna False).
+        Retorna True se o esquema está atualizado.
+        """
+        try:
+            with self.get_db_connection(somente_leitura=True) as conn:
+                versao = exigir_esquema_atual(conn)
+        except EsquemaDesatualizado as e:
+            if exigir:
+                raise
+            print(f"Aviso: {e}")
+            return False
+        if versao > VERSAO_ESQUEMA:
+            print(f"Aviso: esquema do banco (versão {versao}) é mais novo que o código (versão {VERSAO_ESQUEMA}).")
+        return True
+
+    def migrar(self, tamanho_lote=5000):
+        """
+        Aplica as migrações pendentes (ver migracoes.py) e o backfill de
+        registros.ts_epoch das linhas gravadas antes da migração 006 (sem ele,
+        essas linhas ficam fora das consultas por ts_epoch e do recálculo dos
+        dias do rollup). Retorna as versões aplicadas.
+        """
         with self.get_db_connection() as conn:
-            cursor = conn.cursor()
+            aplicadas = aplicar_migracoes(conn)
+            # Idempotente: em bancos já preenchidos só percorre as faixas de id
+            preenchidas = preencher_ts_epoch(conn, tamanho_lote)
+        if preenchidas:
+            print(f"Backfill de ts_epoch: {preenchidas} registros preenchidos.")
+        return aplicadas
+
+    def verificar_planos_consulta(self, user_id):
+        """
+        Executa cada método de CONSULTAS_QUENTES_REGISTROS, captura o SQL enviado
+        ao SQLite e roda EXPLAIN QUERY PLAN em cada SELECT sobre registros.
 
-            # Migrar usuários (AJUSTADO para TODAS as 17 colunas)
-            users_migrated_count = 0
-            for user in json_data.get('users', []):
-                # O bloco try/except é sugerido para capturar erros de integridade (e.g., username duplicado)
-                try:
-                    cursor.execute("SELECT id FROM users WHERE username = ?", (user['username'],))
-                    if cursor.fetchone():
-                        continue
-                    
-                    # 1. Ajuste a lista de colunas para incluir TODAS as 17 colunas
-                    cursor.execute("""
-                        INSERT INTO users (
-                            id, username, password_hash, role, email, nome_completo, 
-                            razao_ic, fator_sensibilidade, data_nascimento, sexo, 
-                            telefone, medico_id, meta_glicemia, documento, 
-                            crm, cns, especialidade
-                        )
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        # 2. Forneça 17 valores na ORDEM EXATA
-                        user['id'], 
-                        user['username'], 
-                        user['password_hash'], 
-                        user.get('role', 'paciente'), 
-                        user.get('email'), 
-                        user.get('nome'), # Mapeia 'nome' do JSON para 'nome_completo'
-                        user.get('razao_ic'), 
-                        user.get('fator_sensibilidade'), 
-                        user.get('data_nascimento'), 
-                        user.get('sexo'),
-                        user.get('telefone'), 
-                        user.get('medico_id'), 
-                        # Novos campos, preenchidos com None se não estiverem no JSON
-                        user.get('meta_glicemia'), 
-                        user.get('documento'),
-                        user.get('crm'),
-                        user.get('cns'),
-                        user.get('especialidade') 
-                    ))
-                    users_migrated_count += 1
-                except sqlite3.Error as e:
-                    print(f"Erro ao migrar usuário {user.get('username')}: {e}")
-            
-            # Migrar registros (Sem alteração, está correto)
-            registros_migrated_count = 0
-            # ... (O restante da sua lógica de migração de registros está correta e inalterada)
-            for registro in json_data.get('registros_glicemia_refeicao', []):
-                cursor.execute("SELECT id FROM registros WHERE id = ?", (registro.get('id',-1),))
-                if cursor.fetchone():
-                    continue
-                
-                # Importação de datetime e json é necessária aqui se o código estiver fora do escopo
+        Retorna uma lista de dicionários {'metodo', 'sql', 'plano', 'usa_indice'}.
+        'usa_indice' é False quando alguma etapa do plano é um SCAN sem índice
+        ou uma ordenação em B-tree temporária (ver etapas_sem_indice).
+        """
+        resultados = []
+        # Segura a conexão da thread: as chamadas aninhadas reutilizam a mesma
+        # conexão do pool, então o trace captura exatamente o SQL dos métodos.
+        conn = self.get_db_connection(somente_leitura=True)
+        try:
+            for metodo in CONSULTAS_QUENTES_REGISTROS:
+                instrucoes = []
+                conn.set_trace_callback(instrucoes.append)
                 try:
-                    from datetime import datetime
-                except ImportError:
-                    pass # Assumindo que já está importado ou não é estritamente necessário para o exemplo.
-
-                data_hora = registro.get('data_hora') or datetime.now().isoformat()
-                tipo = registro.get('tipo') or 'Desconhecido'
-
-                alimentos_json_str = json.dumps(registro.get('alimentos')) if registro.get('alimentos') else None
-                
-                cursor.execute("""
-                    INSERT INTO registros (id, user_id, data_hora, tipo, valor, observacoes, alimentos_json, total_calorias, total_carbs)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (registro.get('id'), registro['user_id'], data_hora, tipo, registro.get('valor'), registro.get('observacoes'), alimentos_json_str, registro.get('total_calorias'), registro.get('total_carbs')))
-                registros_migrated_count += 1
+                    getattr(self, metodo)(user_id)
+                finally:
+                    conn.set_trace_callback(None)
 
-            conn.commit()
-            print(f"Migração concluída! {users_migrated_count} usuários e {registros_migrated_count} registros migrados.")
+                for sql in instrucoes:
+                    if 'registros' not in sql or not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    plano = [linha['detail'] for linha in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+                    resultados.append({
+                        'metodo': metodo,
+                        'sql': ' '.join(sql.split()),
+                        'plano': plano,
+                        'usa_indice': not etapas_sem_indice(plano),
+                    })
+        finally:
+            conn.close()
+        return resultados
 
     def criar_paciente_e_ficha_inicial(self, paciente_data, medico_id, anamnese_data):
         """
@@ -345,7 +371,7 @@ class DatabaseManager:
         """
         Busca um único usuário por ID, retornando todas as colunas necessárias para edição.
         """
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(somente_leitura=True)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -397,6 +423,8 @@ class DatabaseManager:
                 paciente_id
             ))
             conn.commit()
+            self.invalidar_parametros_clinicos(paciente_id)
+            self.invalidar_identidade(paciente_id)  # fator_sensibilidade/meta_glicemia estão no User
             return True
             
         except Exception as e:
@@ -410,17 +438,16 @@ class DatabaseManager:
         na tabela users, que você já preencheu em criar_paciente_e_ficha_inicial).
         """
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT 1 
-                FROM users 
-                WHERE id = ? AND medico_id = ?
-            """, (paciente_id, medico_id))
-            
-            # Se fetchone() retornar um resultado, o vínculo existe (True).
-            vinculo_existe = cursor.fetchone() is not None
-            conn.close()
+            with self.get_db_connection(somente_leitura=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT 1 
+                    FROM users 
+                    WHERE id = ? AND medico_id = ?
+                """, (paciente_id, medico_id))
+                
+                # Se fetchone() retornar um resultado, o vínculo existe (True).
+                vinculo_existe = cursor.fetchone() is not None
             return vinculo_existe
             
         except Exception as e:
@@ -428,7 +455,7 @@ class DatabaseManager:
             return False
 
     def carregar_usuario(self, username):
-        with self.get_db_connection() as conn:
+        with self.get_db_connection(somente_leitura=True) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
             user_data = cursor.fetchone()
@@ -436,13 +463,12 @@ class DatabaseManager:
         
     def carregar_usuario_por_username(self, username):
         """Busca um usuário pelo nome de usuário e retorna um objeto User."""
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-        
-        # 1. Busca o usuário pelo username
-        cursor.execute("SELECT id, username, password_hash, role FROM usuarios WHERE username = ?", (username,))
-        user_data = cursor.fetchone()
-        conn.close()
+        with self.get_db_connection(somente_leitura=True) as conn:
+            cursor = conn.cursor()
+            
+            # 1. Busca o usuário pelo username
+            cursor.execute("SELECT id, username, password_hash, role FROM usuarios WHERE username = ?", (username,))
+            user_data = cursor.fetchone()
         
         if user_data:
             # 2. Desempacota os dados
@@ -458,33 +484,57 @@ class DatabaseManager:
         return None
 
     def carregar_usuario_por_id(self, user_id):
-        conn = self.get_db_connection()
-        user_data = conn.execute(
-            "SELECT id, username, role, email, nome_completo, razao_ic, fator_sensibilidade, data_nascimento, sexo, telefone, medico_id FROM users WHERE id = ?", 
-            (user_id,)
-        ).fetchone()
-        conn.close()
+        with self.get_db_connection(somente_leitura=True) as conn:
+            user_data = conn.execute(
+                "SELECT id, username, role, email, nome_completo, razao_ic, fator_sensibilidade, data_nascimento, sexo, telefone, medico_id FROM users WHERE id = ?", 
+                (user_id,)
+            ).fetchone()
         return dict(user_data) if user_data else None
             
+    _SQL_IDENTIDADE = """
+        SELECT id, username, role, email, nome_completo, razao_ic, fator_sensibilidade,
+               data_nascimento, sexo, meta_glicemia, telefone, documento, crm, cns, especialidade
+        FROM users WHERE id = ?
+    """
+
+    def carregar_identidade(self, user_id):
+        """
+        User (models.User) do usuário logado, para o user_loader do Flask-Login.
+        Fica em cache por alguns segundos: a mesma instância é devolvida a
+        todas as requisições do usuário, então deve ser tratada como somente
+        leitura. Sem password_hash (a autenticação usa carregar_usuario).
+        """
+        return self.cache_identidades.obter_ou_calcular(user_id, lambda: self._carregar_identidade(user_id))
+
+    def _carregar_identidade(self, user_id):
+        with self.get_db_connection(somente_leitura=True) as conn:
+            linha = conn.execute(self._SQL_IDENTIDADE, (user_id,)).fetchone()
+        if linha is None:
+            return None
+        dados = dict(linha)
+        dados['role'] = (dados['role'] or 'user').lower()
+        return User(password_hash=None, **dados)
+
+    def invalidar_identidade(self, user_id):
+        """Descarta o usuário em cache (chamar após alterar dados, papel ou senha)."""
+        self.cache_identidades.invalidar(user_id)
+
     def carregar_todos_os_usuarios(self, perfil=None):
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
         query = "SELECT id, username, role FROM users"
         params = ()
         if perfil:
             query += " WHERE role = ?" # Corrigi para 'role' ao invés de 'perfil'
             params = (perfil,)
         
-        cursor.execute(query, params)
-        usuarios = cursor.fetchall()
-        conn.close()
+        with self.get_db_connection(somente_leitura=True) as conn:
+            usuarios = conn.execute(query, params).fetchall()
         return [{'id': row['id'], 'username': row['username'], 'role': row['role']} for row in usuarios]
     
     def contar_usuarios(self, role=None):
         """
         Conta o número total de usuários, opcionalmente filtrando por função (role).
         """
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(somente_leitura=True)
         cursor = conn.cursor()
         
         try:
@@ -512,7 +562,7 @@ class DatabaseManager:
             Conta o número de pacientes que ainda não tiveram seus parâmetros de Bolus (RIC e Meta) configurados.
             Considera sem parâmetro se o RIC da manhã ou a Meta de Glicemia for NULL ou 0.
             """
-            conn = self.get_db_connection()
+            conn = self.get_db_connection(somente_leitura=True)
             cursor = conn.cursor()
             
             try:
@@ -541,7 +591,7 @@ class DatabaseManager:
             Conta o número de pacientes que tiveram uma glicemia fora da zona de segurança 
             (Hiper ou Hipoglicemia) nas últimas 48 horas.
             """
-            conn = self.get_db_connection()
+            conn = self.get_db_connection(somente_leitura=True)
             cursor = conn.cursor()
         
             # 1. Definir o limite de tempo (48 horas atrás)
@@ -576,7 +626,7 @@ class DatabaseManager:
             """
             Conta o número total de registros (glicemia, bolus, etc.) feitos nas últimas 24 horas.
             """
-            conn = self.get_db_connection()
+            conn = self.get_db_connection(somente_leitura=True)
             cursor = conn.cursor()
             
             # 1. Definir o limite de tempo (24 horas atrás)
@@ -605,7 +655,7 @@ class DatabaseManager:
             """
             Retorna a lista de pacientes (role='paciente') com seus parâmetros clínicos.
             """
-            conn = self.get_db_connection()
+            conn = self.get_db_connection(somente_leitura=True)
             # Usamos Row para retornar os dados como um dicionário (acessível por nome da coluna)
             conn.row_factory = Row 
             cursor = conn.cursor()
@@ -630,19 +680,22 @@ class DatabaseManager:
                 conn.close()
 
     def salvar_log_acao(self, acao, usuario):
+        """
+        Registra uma ação no log de auditoria (logs_acao). A gravação é
+        assíncrona e em lotes (auditoria.FilaAuditoria); a data_hora é a do
+        momento da chamada.
+        """
+        return self.auditoria.registrar(acao, usuario)
+
+    def gravar_logs_acao(self, lote):
+        """Grava um lote de (data_hora, acao, usuario) numa única transação."""
         with self.get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO logs_acao (data_hora, acao, usuario) VALUES (?, ?, ?)", 
-                            (datetime.now().isoformat(), acao, usuario))
+            conn.executemany("INSERT INTO logs_acao (data_hora, acao, usuario) VALUES (?, ?, ?)", lote)
             conn.commit()
-            return True
 
     def get_user_id_by_username(self, username):
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-        user_id = cursor.fetchone()
-        conn.close()
+        with self.get_db_connection(somente_leitura=True) as conn:
+            user_id = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
         return user_id[0] if user_id else None
 
     def salvar_usuario(self, user_data):
@@ -728,6 +781,8 @@ class DatabaseManager:
                 cursor = conn.cursor()
                 cursor.execute(query, valores) 
                 conn.commit()
+                self.invalidar_parametros_clinicos(user_data.get('id'))
+                self.invalidar_identidade(user_data.get('id'))
                 return cursor.rowcount > 0 # Retorna True se a linha foi atualizada
                 
         except sqlite3.IntegrityError as e:
@@ -805,11 +860,16 @@ class DatabaseManager:
                 # Agendamentos criados pelo Paciente, ou Agendamentos onde ele é o Médico
                 cursor.execute("DELETE FROM agendamentos WHERE paciente_id = ? OR medico_id = ?", (user_id, user_id))
                 
+                # D2. Agenda de parâmetros de Bolus
+                cursor.execute("DELETE FROM agenda_parametros WHERE user_id = ?", (user_id,))
+                
                 # E. Finalmente, excluir o próprio usuário
                 cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
                 
                 # 3. Se tudo correu bem, confirma as alterações
                 conn.commit()
+                self.invalidar_parametros_clinicos(user_id)
+                self.invalidar_identidade(user_id)
                 return True
                 
             except Exception as e:
@@ -820,7 +880,7 @@ class DatabaseManager:
     
     def carregar_resumo_geral(self):
         """Carrega as métricas gerais do sistema (Admin/Secretário)."""
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(somente_leitura=True)
         cursor = conn.cursor()
         resumo = {
             'total_pacientes': 0,
@@ -840,16 +900,19 @@ class DatabaseManager:
             cursor.execute("SELECT COUNT(id) FROM usuarios WHERE role = 'medico'")
             resumo['total_medicos'] = cursor.fetchone()[0]
 
-            # 2. Registros de Glicemia Hoje
+            # 2. Registros Hoje (rollup diário: uma linha por paciente)
             cursor.execute("""
-                SELECT COUNT(id) 
-                FROM registros 
-                WHERE DATE(data_hora) = ?
+                SELECT COALESCE(SUM(total_registros), 0) 
+                FROM registros_diarios 
+                WHERE dia = ?
             """, (hoje,))
             resumo['registros_hoje'] = cursor.fetchone()[0]
 
-            # 3. Média Global de Glicemia (de todos os registros)
-            cursor.execute("SELECT AVG(valor) FROM registros")
+            # 3. Média Global de Glicemia (soma / contagem acumuladas por dia)
+            cursor.execute("""
+                SELECT SUM(glicemia_soma) / NULLIF(SUM(glicemia_count), 0) 
+                FROM registros_diarios
+            """)
             media = cursor.fetchone()[0]
             
             if media is not None:
@@ -866,7 +929,7 @@ class DatabaseManager:
     def carregar_alimentos(self):
         """Carrega todos os alimentos da tabela 'alimentos'. (Presumindo que essa tabela exista, embora não esteja no CREATE TABLE)"""
         try:
-             with self.get_db_connection() as conn:
+             with self.get_db_connection(somente_leitura=True) as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT * FROM alimentos ORDER BY alimento ASC")
                 alimentos = cursor.fetchall()
@@ -928,50 +991,213 @@ class DatabaseManager:
                     VALUES (?, ?, ?, ?, ?)
                 """, (alimento_data['alimento'], alimento_data['medida_caseira'], alimento_data['peso'], alimento_data['kcal'], alimento_data['carbs']))
                 conn.commit()
+                self._invalidar_busca_alimentos()
                 return True
         except Exception as e:
+            print(f"Erro ao salvar alimento: {e}")
             return False
-    def buscar_alimentos_por_nome(self, termo):
-            try:
-                with self.get_db_connection() as conn:
-                    cursor = conn.cursor()
-                    
-                    # A ORDEM É CRÍTICA: As colunas devem seguir a ordem que o Python espera
-                    # 0: id, 1: ALIMENTO, 2: MEDIDA CASEIRA, 3: PESO (g/ml), 4: Kcal, 5: CHO (g)
-                    cursor.execute(
-                        """
-                        SELECT 
-                            id, 
-                            ALIMENTO, 
-                            MEDIDA_CASEIRA, 
-                            PESO,    
-                            Kcal, 
-                            CARBS        -- ESTE É O ÍNDICE 5 QUE O PYTHON VAI LER
-                        FROM alimentos 
-                        WHERE ALIMENTO LIKE ? 
-                        ORDER BY ALIMENTO ASC
-                        """,
-                        ('%' + termo + '%',)
-                    )
-                    alimentos_tuplas = cursor.fetchall()
-                    
-                    # Mapeamento do índice do SQL para a chave do Python:
-                    alimentos_dict = []
-                    for item in alimentos_tuplas:
-                        # Garantindo que o 'cho' lê o valor do índice 5 (CHO (g))
-                        alimentos_dict.append({
-                            'id': item[0],                 
-                            'alimento': item[1],           
-                            'medida_caseira': item[2],     
-                            'peso': item[3],               
-                            'kcal': item[4],               
-                            'carbs': item[5]                 
-                        })
-                    
-                    return alimentos_dict
-            except Exception as e:
-                print(f"Erro CRÍTICO na busca de alimentos: {e}")
-                return []
+
+    def carregar_alimento_por_id(self, alimento_id):
+        """Um alimento pelo id (dicionário) ou None."""
+        try:
+            with self.get_db_connection(somente_leitura=True) as conn:
+                linha = conn.execute("SELECT * FROM alimentos WHERE id = ?", (alimento_id,)).fetchone()
+                return dict(linha) if linha else None
+        except sqlite3.Error as e:
+            print(f"Erro ao carregar alimento {alimento_id}: {e}")
+            return None
+
+    def atualizar_alimento(self, alimento_data):
+        """Atualiza nome, medida, peso, kcal e carbs de um alimento existente."""
+        try:
+            with self.get_db_connection() as conn:
+                cursor = conn.execute("""
+                    UPDATE alimentos
+                    SET alimento = ?, medida_caseira = ?, peso = ?, kcal = ?, carbs = ?
+                    WHERE id = ?
+                """, (alimento_data['alimento'], alimento_data['medida_caseira'], alimento_data['peso'],
+                      alimento_data['kcal'], alimento_data['carbs'], alimento_data['id']))
+                conn.commit()
+                self._invalidar_busca_alimentos()
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            print(f"Erro ao atualizar alimento {alimento_data.get('id')}: {e}")
+            return False
+
+    def excluir_alimento(self, alimento_id):
+        try:
+            with self.get_db_connection() as conn:
+                cursor = conn.execute("DELETE FROM alimentos WHERE id = ?", (alimento_id,))
+                conn.commit()
+                self._invalidar_busca_alimentos()
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            print(f"Erro ao excluir alimento {alimento_id}: {e}")
+            return False
+
+    def listar_medidas_caseiras(self, alimento_id):
+        """Medidas caseiras de um alimento (a principal primeiro), com carbs/kcal já calculados."""
+        try:
+            with self.get_db_connection(somente_leitura=True) as conn:
+                return [dict(linha) for linha in conn.execute("""
+                    SELECT id, descricao, peso, carbs, kcal, principal
+                    FROM medidas_caseiras
+                    WHERE alimento_id = ?
+                    ORDER BY principal DESC, peso
+                """, (alimento_id,))]
+        except sqlite3.Error as e:
+            print(f"Erro ao listar medidas caseiras do alimento {alimento_id}: {e}")
+            return []
+
+    def salvar_medida_caseira(self, alimento_id, descricao, peso):
+        """
+        Acrescenta uma medida caseira (ex.: '1 xícara', 200 g) a um alimento.
+        carbs/kcal saem dos valores base do alimento e são recalculados pelo
+        trigger quando o alimento é editado. Retorna o id da medida ou None.
+        """
+        try:
+            with self.get_db_connection() as conn:
+                cursor = conn.execute("""
+                    INSERT INTO medidas_caseiras (alimento_id, descricao, peso, carbs, kcal, principal)
+                    SELECT id, ?, ?, COALESCE(carbs, 0) * ? / 100.0, COALESCE(kcal, 0) * ? / 100.0, 0
+                    FROM alimentos WHERE id = ?
+                """, (descricao, peso, peso, peso, alimento_id))
+                conn.commit()
+                return cursor.lastrowid if cursor.rowcount else None
+        except sqlite3.Error as e:
+            print(f"Erro ao salvar medida caseira do alimento {alimento_id}: {e}")
+            return None
+
+    def excluir_medida_caseira(self, medida_id):
+        """Exclui uma medida adicional (a principal acompanha o alimento e não é excluída aqui)."""
+        try:
+            with self.get_db_connection() as conn:
+                cursor = conn.execute(
+                    "DELETE FROM medidas_caseiras WHERE id = ? AND principal = 0", (medida_id,)
+                )
+                conn.commit()
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            print(f"Erro ao excluir medida caseira {medida_id}: {e}")
+            return False
+
+    # Colunas dos resultados da busca, já no formato da resposta de /buscar_alimentos
+    # (nome, medida_caseira, peso_g, carbs_porcao, kcal_porcao): os valores por porção
+    # são calculados na gravação (migração 011), não a cada busca.
+    COLUNAS_BUSCA_ALIMENTOS = """
+        a.id, a.alimento, a.alimento AS nome, a.medida_caseira, COALESCE(a.peso, 100) AS peso_g,
+        a.carbs_porcao, a.kcal_porcao, a.carbs_por_grama, a.kcal_por_grama
+    """
+
+    def _linhas_alimentos_indice(self):
+        """Linhas usadas para montar o índice de busca de alimentos."""
+        try:
+            with self.get_db_connection(somente_leitura=True) as conn:
+                return [dict(linha) for linha in conn.execute(
+                    f"SELECT {self.COLUNAS_BUSCA_ALIMENTOS} FROM alimentos a"
+                )]
+        except sqlite3.OperationalError:
+            # Caso a tabela 'alimentos' ainda não tenha sido criada
+            return []
+
+    def _usar_fts_alimentos(self):
+        if self.motor_busca_alimentos != 'fts':
+            return False
+        if self._fts_alimentos_disponivel is None:
+            with self.get_db_connection(somente_leitura=True) as conn:
+                self._fts_alimentos_disponivel = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'alimentos_fts'"
+                ).fetchone() is not None
+        return self._fts_alimentos_disponivel
+
+    def _invalidar_busca_alimentos(self):
+        """Após gravar em alimentos: descarta o índice em memória e as buscas em cache."""
+        self.busca_alimentos.invalidar()
+        self.cache_busca_alimentos.limpar()
+
+    def buscar_alimentos_por_nome(self, termo, limite=None):
+        """
+        Busca alimentos pelo nome, sem acento/caixa, ordenados por relevância.
+        Retorna dicionários com as colunas de COLUNAS_BUSCA_ALIMENTOS.
+        Ver buscar_alimentos_com_correcao (tolerância a erros de digitação).
+        """
+        return self.buscar_alimentos_com_correcao(termo, limite)[0]
+
+    def buscar_alimentos_com_correcao(self, termo, limite=None):
+        """
+        Busca de alimentos tolerante a erros de digitação.
+
+        Motor 'fts': prefixo de palavra em alimentos_fts, ranking bm25,
+        completado pelas substrings no meio da palavra do índice em memória.
+        Motor 'indice': só o índice em memória (busca_alimentos.py), que casa
+        prefixos e substrings.
+
+        Se o termo não encontra nada, as palavras desconhecidas são corrigidas
+        pelo vocabulário do catálogo (distância de edição, busca_alimentos.
+        CorretorOrtografico) e a busca é refeita. Resultados ficam em cache por
+        (termo normalizado, limite).
+
+        Retorna (resultados, termo_corrigido), com termo_corrigido None quando
+        a busca original já encontrou resultados.
+        """
+        chave = (normalizar(termo), limite)
+        try:
+            resultados, corrigido = self.cache_busca_alimentos.obter_ou_calcular(
+                chave, lambda: self._buscar_alimentos_sem_cache(termo, limite)
+            )
+        except Exception as e:
+            print(f"Erro CRÍTICO na busca de alimentos: {e}")
+            return [], None
+        # Cópias: quem chama pode alterar os dicionários sem afetar o cache
+        return [dict(item) for item in resultados], corrigido
+
+    def _buscar_alimentos_sem_cache(self, termo, limite):
+        buscar = self._buscar_alimentos_fts_com_substring if self._usar_fts_alimentos() else self.busca_alimentos.buscar
+        resultados = buscar(termo, limite)
+        if resultados:
+            return resultados, None
+        corrigido = self.busca_alimentos.corrigir_termo(termo)
+        if corrigido is None:
+            return [], None
+        resultados = buscar(corrigido, limite)
+        return resultados, (corrigido if resultados else None)
+
+    def _buscar_alimentos_fts_com_substring(self, termo, limite=None):
+        """
+        FTS (prefixo de palavra, bm25) completado pelo índice em memória, que
+        casa trechos no meio da palavra ("rroz" -> arroz, "ção" -> coração),
+        como o antigo LIKE '%termo%'. Os resultados do FTS vêm primeiro; o
+        índice só é consultado quando o FTS não preenche o limite.
+        """
+        resultados = self._buscar_alimentos_fts(termo, limite)
+        if limite is not None and len(resultados) >= limite:
+            return resultados
+        vistos = {item['id'] for item in resultados}
+        for item in self.busca_alimentos.buscar(termo):
+            if item['id'] not in vistos:
+                resultados.append(item)
+                if limite is not None and len(resultados) >= limite:
+                    break
+        return resultados
+
+    SQL_BUSCA_ALIMENTOS_FTS = f"""
+        SELECT {COLUNAS_BUSCA_ALIMENTOS}
+        FROM alimentos_fts
+        JOIN alimentos a ON a.id = alimentos_fts.rowid
+        WHERE alimentos_fts MATCH ?
+        ORDER BY bm25(alimentos_fts), length(a.alimento), a.alimento
+        LIMIT ?
+    """
+
+    def _buscar_alimentos_fts(self, termo, limite=None):
+        consulta = consulta_fts(termo)
+        if not consulta:
+            return []
+        with self.get_db_connection(somente_leitura=True) as conn:
+            linhas = conn.execute(
+                self.SQL_BUSCA_ALIMENTOS_FTS, (consulta, -1 if limite is None else int(limite))
+            ).fetchall()
+        return [dict(linha) for linha in linhas]
 
     def salvar_registro(self, registro_data):
         try:
@@ -1005,6 +1231,7 @@ class DatabaseManager:
             SELECT 
                 r.id, 
                 r.data_hora, 
+                r.ts_epoch,
                 r.tipo, 
                 r.valor, 
                 r.observacoes, 
@@ -1017,15 +1244,13 @@ class DatabaseManager:
             FROM registros r
             LEFT JOIN detalhes_refeicao dr ON r.id = dr.registro_id
             WHERE r.user_id = ?
-            ORDER BY r.data_hora DESC
+            ORDER BY r.ts_epoch DESC
         """
-        with self.get_db_connection() as conn:
-            # Garante que as colunas sejam acessíveis por nome
-            conn.row_factory = sqlite3.Row 
-            cursor = conn.cursor() 
         try:
-            cursor.execute(sql, (user_id,)) 
-            registros = cursor.fetchall()
+            with self.get_db_connection(somente_leitura=True) as conn:
+                cursor = conn.cursor() 
+                cursor.execute(sql, (user_id,)) 
+                registros = cursor.fetchall()
             
             # Retorna a lista de dicionários
             return [dict(row) for row in registros]
@@ -1115,7 +1340,7 @@ class DatabaseManager:
         Busca um registro principal pelo ID na tabela 'registros', incluindo 
         detalhes de refeição. Inclui LOG de diagnóstico.
         """
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(somente_leitura=True)
         # Garante que as colunas sejam retornadas como chaves de dicionário.
         conn.row_factory = sqlite3.Row 
         cursor = conn.cursor()
@@ -1287,7 +1512,7 @@ class DatabaseManager:
             conn.close()
 
     def medico_tem_acesso_a_paciente(self, medico_id, paciente_id):
-        with self.get_db_connection() as conn:
+        with self.get_db_connection(somente_leitura=True) as conn:
             cursor = conn.cursor()
             # Verifica se o paciente foi criado por esse médico ou se há um vínculo manual
             cursor.execute("""
@@ -1328,15 +1553,14 @@ class DatabaseManager:
             conn.close()
 
     def buscar_exames_paciente(self, paciente_id: int) -> list:
-        conn = self.get_db_connection()
-        exames = conn.execute("""
-            SELECT * FROM exames_laboratoriais
-            WHERE paciente_id = ?
-            ORDER BY data_exame DESC
-        """, (paciente_id,)).fetchall()
+        with self.get_db_connection(somente_leitura=True) as conn:
+            exames = conn.execute("""
+                SELECT * FROM exames_laboratoriais
+                WHERE paciente_id = ?
+                ORDER BY data_exame DESC
+            """, (paciente_id,)).fetchall()
         
         result = [dict(row) for row in exames]
-        conn.close()
         
         for exame in result:
             try:
@@ -1380,7 +1604,7 @@ class DatabaseManager:
             return True
 
     def carregar_ficha_medica(self, paciente_id):
-        with self.get_db_connection() as conn:
+        with self.get_db_connection(somente_leitura=True) as conn:
             cursor = conn.cursor()
             
             # 1. Seleciona as colunas na ordem correta
@@ -1404,21 +1628,21 @@ class DatabaseManager:
             
     # Funções de Agendamento, Vínculos, etc. (Mantidas como no código original)
     def carregar_agendamentos_medico(self, medico_id):
-        with self.get_db_connection() as conn:
+        with self.get_db_connection(somente_leitura=True) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM agendamentos WHERE medico_id = ? ORDER BY data_hora", (medico_id,))
             agendamentos = cursor.fetchall()
             return [dict(row) for row in agendamentos]
 
     def carregar_agendamentos_paciente(self, paciente_id):
-        with self.get_db_connection() as conn:
+        with self.get_db_connection(somente_leitura=True) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM agendamentos WHERE paciente_id = ? ORDER BY data_hora", (paciente_id,))
             agendamentos = cursor.fetchall()
             return [dict(row) for row in agendamentos]
             
     def carregar_medicos(self):
-        with self.get_db_connection() as conn:
+        with self.get_db_connection(somente_leitura=True) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users WHERE role = 'medico'")
             medicos = cursor.fetchall()
@@ -1435,7 +1659,7 @@ class DatabaseManager:
             return True
 
     def carregar_cuidadores(self):
-        with self.get_db_connection() as conn:
+        with self.get_db_connection(somente_leitura=True) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users WHERE role = 'cuidador'")
             cuidadores = cursor.fetchall()
@@ -1457,7 +1681,7 @@ class DatabaseManager:
         Busca todos os pacientes monitorados por um cuidador específico
         usando a tabela de vínculos.
         """
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(somente_leitura=True)
         cursor = conn.cursor()
         pacientes = []
         
@@ -1514,6 +1738,7 @@ class DatabaseManager:
                 )
                 
                 conn.commit()
+                self.invalidar_identidade(paciente_id)
                 return cursor.rowcount > 0
                 
             except Exception as e:
@@ -1522,16 +1747,14 @@ class DatabaseManager:
                 return False
 
     def buscar_agendamentos_paciente(self, user_id):
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT a.id, a.data_hora, a.status, a.observacoes, m.username as medico_username
-            FROM agendamentos a
-            JOIN users m ON a.medico_id = m.id
-            WHERE a.paciente_id = ?
-            ORDER BY a.data_hora DESC
-        """, (user_id,))
+        with self.get_db_connection(somente_leitura=True) as conn:
+            linhas = conn.execute("""
+                SELECT a.id, a.data_hora, a.status, a.observacoes, m.username as medico_username
+                FROM agendamentos a
+                JOIN users m ON a.medico_id = m.id
+                WHERE a.paciente_id = ?
+                ORDER BY a.data_hora DESC
+            """, (user_id,)).fetchall()
         
         agendamentos = [
             {'id': row[0], 
@@ -1539,9 +1762,8 @@ class DatabaseManager:
              'status': row[2], 
              'observacoes': row[3], 
              'medico_username': row[4]} 
-            for row in cursor.fetchall()
+            for row in linhas
         ]
-        conn.close()
         return agendamentos
     
 # No seu database_manager.py, adicione:
@@ -1564,7 +1786,7 @@ class DatabaseManager:
         ORDER BY a.data_hora DESC
         """
         try:
-            with self.get_db_connection() as conn:
+            with self.get_db_connection(somente_leitura=True) as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute(query, (medico_id,))
@@ -1586,7 +1808,7 @@ class DatabaseManager:
         )
         """
         try:
-            with self.get_db_connection() as conn:
+            with self.get_db_connection(somente_leitura=True) as conn:
                 cursor = conn.cursor()
                 # Passa o ID do Paciente (u.id=?) e o ID do Médico (duas vezes)
                 cursor.execute(query, (paciente_id, medico_id, medico_id))
@@ -1624,7 +1846,7 @@ class DatabaseManager:
         ORDER BY a.data_hora DESC
         """
         try:
-            with self.get_db_connection() as conn:
+            with self.get_db_connection(somente_leitura=True) as conn:
                 # Garante que as colunas sejam acessíveis por nome (paciente_nome, medico_nome)
                 conn.row_factory = sqlite3.Row 
                 cursor = conn.cursor()
@@ -1644,7 +1866,7 @@ class DatabaseManager:
         Retorna a lista de pacientes vinculados a um médico específico, 
         usando a tabela de ligação 'vinculo_medico_paciente'.
         """
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(somente_leitura=True)
         conn.row_factory = sqlite3.Row 
         cursor = conn.cursor()
         
@@ -1704,6 +1926,7 @@ class DatabaseManager:
                 parametros['fsi_jantar'],
             ))
             conn.commit()
+            self.invalidar_parametros_clinicos(paciente_id)
             return True
         except Exception as e:
             # É crucial ter a tabela 'parametros_clinicos' criada com 'paciente_id' como UNIQUE/PRIMARY KEY
@@ -1718,7 +1941,7 @@ class DatabaseManager:
             Carrega os últimos N registros de glicemia, carboidratos e calorias 
             para um paciente, ordenados por data e hora.
             """
-            conn = self.get_db_connection() # <--- CORRIGIDO
+            conn = self.get_db_connection(somente_leitura=True) # <--- CORRIGIDO
             cursor = conn.cursor()
             
             try:
@@ -1735,7 +1958,7 @@ class DatabaseManager:
                 WHERE 
                     user_id = ?
                 ORDER BY 
-                    data_hora DESC
+                    ts_epoch DESC
                 LIMIT ?
                 """
                 
@@ -1762,125 +1985,94 @@ class DatabaseManager:
         """
         Retorna o dicionário de resumo para o Dashboard do Médico.
         """
-        
-        # 1. Total de Pacientes e Cálculo de Pendentes (Reaproveita o método que já funciona)
-        pacientes = self.obter_pacientes_do_medico(medico_id)
-        total_pacientes_vinculados = len(pacientes)
-        
-        pacientes_pendentes = sum(
-            1 for p in pacientes 
-            if not (p.get('ric_manha') and p.get('fator_sensibilidade') and p.get('meta_glicemia'))
-        )
-
-        # 2. Média de Glicemia (Chama o novo método)
-        media_glicemia = self.calcular_media_glicemia_por_medico(medico_id)
-        
-        # 3. Registros Hoje (Chama o novo método)
-        registros_hoje = self.contar_registros_hoje_por_medico(medico_id)
-        
-        return {
-            'total_pacientes_vinculados': total_pacientes_vinculados, # CORRIGIDO: nome da chave para consistência
-            'pacientes_pendentes': pacientes_pendentes,              # NOVO: Chave essencial para o Jinja2
-            'registros_hoje': registros_hoje,
-            'media_glicemia': f"{media_glicemia:.1f}" if media_glicemia else 'N/A'
-        }
+        return self.carregar_painel_medico(medico_id).resumo()
 
-    def calcular_media_glicemia_por_medico(self, medico_id):
+    def carregar_painel_medico(self, medico_id, dias_metricas=14):
         """
-        Calcula a média de todos os registros de glicemia (tipo='Glicemia' ou valor IS NOT NULL)
-        dos pacientes vinculados a um médico.
+        Painel do médico em uma passada, numa única conexão e com número fixo
+        de consultas, qualquer que seja o número de pacientes:
+          1. lista de pacientes (obter_pacientes_do_medico);
+          2. rollup diário agrupado por paciente: média das medições de glicemia
+             (tipos Glicemia/Pre_Refeicao/Pos_Refeicao) e registros de hoje;
+          3. leituras dos últimos 'dias_metricas' para TIR/TBR/CV/GMI (obter_metricas_pacientes).
+        Retorna PainelMedico; cada paciente já vem com a chave 'metricas'.
         """
-        conn = self.get_db_connection()
-        try:
-            cursor = conn.cursor()
-            
-            # 1. Busca os IDs dos pacientes do médico
-            # Reutilizando a função que você já tem (obter_pacientes_por_medico)
+        with self.get_db_connection(somente_leitura=True) as conn:
             pacientes = self.obter_pacientes_do_medico(medico_id)
-            if not pacientes:
-                return 0.0
-
             paciente_ids = [p['id'] for p in pacientes]
-            
-            # Cria uma string de placeholders (?, ?, ?) para a cláusula IN do SQL
-            placeholders = ','.join('?' for _ in paciente_ids)
-            
-            # 2. Executa a média nos registros desses pacientes
-            sql = f"""
-                SELECT AVG(valor) 
-                FROM registros 
-                WHERE user_id IN ({placeholders}) 
-                AND valor IS NOT NULL 
-                AND tipo IN ('Glicemia', 'Pre_Refeicao', 'Pos_Refeicao') 
-            """
-            
-            cursor.execute(sql, paciente_ids)
-            media = cursor.fetchone()[0]
-            
-            # Retorna a média ou 0.0 se for None (sem registros)
-            return round(media, 1) if media is not None else 0.0
-            
-        except Exception as e:
-            print(f"Erro ao calcular média de glicemia por médico {medico_id}: {e}")
-            return 0.0
-        finally:
-            conn.close()
 
+            registros_hoje_por_paciente, media_por_paciente = {}, {}
+            soma_total, contagem_total = 0.0, 0
+            if paciente_ids:
+                placeholders = ','.join('?' for _ in paciente_ids)
+                try:
+                    linhas = conn.execute(f"""
+                        SELECT user_id,
+                               TOTAL(medicao_soma),
+                               TOTAL(medicao_count),
+                               TOTAL(CASE WHEN dia = ? THEN total_registros ELSE 0 END)
+                        FROM registros_diarios
+                        WHERE user_id IN ({placeholders})
+                        GROUP BY user_id
+                    """, [datetime.now().strftime('%Y-%m-%d')] + paciente_ids).fetchall()
+                except sqlite3.Error as e:
+                    print(f"Erro ao agregar registros dos pacientes do médico {medico_id}: {e}")
+                    linhas = []
+                for user_id, soma, contagem, hoje in linhas:
+                    registros_hoje_por_paciente[user_id] = int(hoje)
+                    if contagem:
+                        media_por_paciente[user_id] = round(soma / contagem, 1)
+                    soma_total += soma
+                    contagem_total += int(contagem)
+
+            metricas_pacientes = self.obter_metricas_pacientes(paciente_ids, dias=dias_metricas)
+
+        for paciente in pacientes:
+            paciente['metricas'] = metricas_pacientes.get(paciente['id'])
+        tirs = [m['tir'] for m in metricas_pacientes.values()]
+
+        return PainelMedico(
+            medico_id=medico_id,
+            pacientes=pacientes,
+            # Mesmo critério do "Status Bolus" do painel (paciente.fsi vem de fator_sensibilidade)
+            pacientes_pendentes=sum(
+                1 for p in pacientes if not (p.get('ric_manha') and p.get('fsi') and p.get('meta_glicemia'))
+            ),
+            registros_hoje=sum(registros_hoje_por_paciente.values()),
+            media_glicemia=round(soma_total / contagem_total, 1) if contagem_total else None,
+            tir_medio=sum(tirs) / len(tirs) if tirs else None,
+            pacientes_em_alerta=sum(1 for m in metricas_pacientes.values() if m['tir'] < 70 or m['tbr'] > 4),
+            metricas_pacientes=metricas_pacientes,
+            registros_hoje_por_paciente=registros_hoje_por_paciente,
+            media_glicemia_por_paciente=media_por_paciente,
+        )
 
-    def contar_registros_hoje_por_medico(self, medico_id):
+    def calcular_media_glicemia_por_medico(self, medico_id):
         """
-        Conta o total de registros (glicemia, refeição, etc.) feitos HOJE 
-        por todos os pacientes vinculados a um médico.
+        Média das medições de glicemia (tipos Glicemia, Pre_Refeicao e
+        Pos_Refeicao) dos pacientes vinculados ao médico; 0.0 sem medições.
+        Mesmo cálculo do painel (carregar_painel_medico).
         """
-        conn = self.get_db_connection()
-        try:
-            cursor = conn.cursor()
-            
-            # 1. Busca os IDs dos pacientes do médico
-            pacientes = self.obter_pacientes_do_medico(medico_id)
-            if not pacientes:
-                return 0
+        media = self.carregar_painel_medico(medico_id).media_glicemia
+        return media if media is not None else 0.0
 
-            paciente_ids = [p['id'] for p in pacientes]
-            
-            # 2. Define o início do dia de hoje (em formato string SQL)
-            hoje_str = datetime.now().strftime('%Y-%m-%d')
-            
-            # Cria uma string de placeholders (?, ?, ?) para a cláusula IN
-            placeholders = ','.join('?' for _ in paciente_ids)
-            
-            # 3. Executa a contagem
-            # Usamos GLOB para verificar se a data_hora começa com a data de hoje
-            sql = f"""
-                SELECT COUNT(*) 
-                FROM registros 
-                WHERE user_id IN ({placeholders}) 
-                AND data_hora LIKE ? || '%'
-            """
-            
-            # O último parâmetro é o filtro de data (hoje_str)
-            params = paciente_ids + [hoje_str]
-            
-            cursor.execute(sql, params)
-            contagem = cursor.fetchone()[0]
-            
-            return contagem
-            
-        except Exception as e:
-            print(f"Erro ao contar registros de hoje por médico {medico_id}: {e}")
-            return 0
-        finally:
-            conn.close()
+    def contar_registros_hoje_por_medico(self, medico_id):
+        """
+        Total de registros (glicemia, refeição, etc.) feitos HOJE por todos os
+        pacientes vinculados ao médico. Mesmo cálculo do painel (carregar_painel_medico).
+        """
+        return self.carregar_painel_medico(medico_id).registros_hoje
 
     def obter_resumo_paciente(self, paciente_id):
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(somente_leitura=True)
         cursor = conn.cursor()
         resumo = {
             'ultimo_registro': None,
             'tempo_desde_ultimo': 'Nunca registrado',
             'media_ultima_semana': 'N/A',
             'hiperglicemia_count': 0,
-            'hipoglicemia_count': 0
+            'hipoglicemia_count': 0,
+            'metricas': None
         }
         
         # Importante: LIMITE_HIPO e LIMITE_HIPER devem estar definidos no arquivo!
@@ -1888,23 +2080,24 @@ class DatabaseManager:
         # LIMITE_HIPO = 70
         # LIMITE_HIPER = 180
         
-        hoje = datetime.now()
-        data_semana_atras = hoje - timedelta(days=7)
+        agora = datetime.now()
+        agora_ts = datetime_para_epoch(agora)
+        # Últimos 7 dias do calendário (hoje incluído), no formato da chave do rollup
+        inicio_semana = (agora - timedelta(days=6)).strftime('%Y-%m-%d')
 
         try:
-            # 1. Último Registro (CORRETO)
+            # 1. Último Registro (ts_epoch já vem pronto: sem parse de data em Python)
             cursor.execute("""
-                SELECT valor, data_hora 
+                SELECT valor, ts_epoch 
                 FROM registros 
-                WHERE user_id = ? 
-                ORDER BY data_hora DESC 
+                WHERE user_id = ? AND valor IS NOT NULL 
+                ORDER BY ts_epoch DESC 
                 LIMIT 1
             """, (paciente_id,))
             ultimo = cursor.fetchone()
 
             if ultimo:
-                valor, data_hora_str = ultimo
-                data_hora_reg = datetime.strptime(data_hora_str.replace('T', ' '), '%Y-%m-%d %H:%M:%S')
+                valor, ts_registro = ultimo
                 
                 # Cálculo de status (depende de LIMITE_HIPO e LIMITE_HIPER)
                 if valor < LIMITE_HIPO:
@@ -1915,7 +2108,7 @@ class DatabaseManager:
                     status = 'success'
                     
                 # Cálculo do tempo
-                delta = hoje - data_hora_reg
+                delta = timedelta(seconds=agora_ts - ts_registro)
                 if delta.total_seconds() < 3600:
                     tempo_str = f"{int(delta.total_seconds() // 60)} min atrás"
                 elif delta.days < 1:
@@ -1928,10 +2121,10 @@ class DatabaseManager:
 
             # 2. Média da Última Semana (CORRIGIDO: 'paciente_id' mudou para 'user_id')
             cursor.execute("""
-                SELECT AVG(valor) 
-                FROM registros 
-                WHERE user_id = ? AND data_hora >= ? 
-            """, (paciente_id, data_semana_atras.strftime('%Y-%m-%d %H:%M:%S')))
+                SELECT SUM(glicemia_soma) / NULLIF(SUM(glicemia_count), 0) 
+                FROM registros_diarios 
+                WHERE user_id = ? AND dia >= ? 
+            """, (paciente_id, inicio_semana))
             media = cursor.fetchone()[0]
             
             if media is not None:
@@ -1940,16 +2133,20 @@ class DatabaseManager:
             # 3. Contagem de Eventos Extremos (CORRIGIDO: 'paciente_id' mudou para 'user_id')
             cursor.execute("""
                 SELECT 
-                    SUM(CASE WHEN valor < ? THEN 1 ELSE 0 END) as hipo,
-                    SUM(CASE WHEN valor > ? THEN 1 ELSE 0 END) as hiper
-                FROM registros 
-                WHERE user_id = ? AND data_hora >= ?
-            """, (LIMITE_HIPO, LIMITE_HIPER, paciente_id, data_semana_atras.strftime('%Y-%m-%d %H:%M:%S')))
+                    COALESCE(SUM(hipo_count), 0) as hipo,
+                    COALESCE(SUM(hiper_count), 0) as hiper
+                FROM registros_diarios 
+                WHERE user_id = ? AND dia >= ?
+            """, (paciente_id, inicio_semana))
             
             contagens = cursor.fetchone()
             if contagens:
                 resumo['hipoglicemia_count'] = contagens[0]
                 resumo['hiperglicemia_count'] = contagens[1]
+
+            # 4. Métricas de consenso (TIR/TAR/TBR, CV, GMI...) dos últimos 14 dias
+            serie = self.carregar_serie_glicemica(paciente_id, agora_ts - 14 * SEGUNDOS_DIA)
+            resumo['metricas'] = serie.metricas()
                 
         except Exception as e:
             print(f"Erro ao carregar resumo do paciente: {e}")
@@ -1961,50 +2158,245 @@ class DatabaseManager:
         print(f"DEBUG: Resumo Final Paciente {paciente_id}: {resumo}")
         return resumo
 
+    def carregar_serie_glicemica(self, user_id, inicio_ts=None, fim_ts=None):
+        """
+        Carrega as glicemias do paciente (opcionalmente só [inicio_ts, fim_ts))
+        em uma SerieGlicemica (arrays NumPy ordenados por ts_epoch).
+        """
+        filtros, params = '', [user_id]
+        if inicio_ts is not None:
+            filtros += ' AND ts_epoch >= ?'
+            params.append(inicio_ts)
+        if fim_ts is not None:
+            filtros += ' AND ts_epoch < ?'
+            params.append(fim_ts)
+        with self.get_db_connection(somente_leitura=True) as conn:
+            cursor = conn.execute(f"""
+                SELECT ts_epoch, valor 
+                FROM registros 
+                WHERE user_id = ? AND valor IS NOT NULL AND ts_epoch IS NOT NULL{filtros} 
+                ORDER BY ts_epoch
+            """, params)
+            return SerieGlicemica.de_linhas(cursor)
+
+    def obter_versao_dados(self, user_id):
+        """
+        Versão dos dados do paciente (incrementada por trigger a cada escrita em
+        registros, ficha médica, agendamentos, exames e parâmetros). Usada na
+        chave de caches derivados.
+        """
+        with self.get_db_connection(somente_leitura=True) as conn:
+            linha = conn.execute(
+                "SELECT versao FROM versao_dados_paciente WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return linha[0] if linha else 0
+
+    def obter_versoes_dados(self, user_ids):
+        """Versões dos dados de vários pacientes numa consulta: {user_id: versao} (0 se nunca mudou)."""
+        ids = list(dict.fromkeys(user_ids))
+        if not ids:
+            return {}
+        versoes = dict.fromkeys(ids, 0)
+        placeholders = ', '.join('?' * len(ids))
+        with self.get_db_connection(somente_leitura=True) as conn:
+            for user_id, versao in conn.execute(
+                f"SELECT user_id, versao FROM versao_dados_paciente WHERE user_id IN ({placeholders})", ids
+            ):
+                versoes[user_id] = versao
+        return versoes
+
+    def obter_agp(self, paciente_id, dias=14, minutos_por_faixa=15):
+        """
+        Perfil ambulatorial de glicose (percentis 5/25/50/75/95 por horário do dia)
+        dos últimos 'dias'. O resultado fica em cache por (paciente, janela,
+        versão dos dados): uma nova leitura muda a versão e força o recálculo.
+        """
+        versao = self.obter_versao_dados(paciente_id)
+        chave = (paciente_id, dias, minutos_por_faixa, versao)
+
+        def calcular():
+            inicio_ts = datetime_para_epoch(datetime.now()) - dias * SEGUNDOS_DIA
+            serie = self.carregar_serie_glicemica(paciente_id, inicio_ts)
+            agp = calcular_agp(serie.ts, serie.valores, minutos_por_faixa=minutos_por_faixa)
+            agp['dias'] = dias
+            agp['total_leituras'] = len(serie)
+            return agp
+
+        return self.cache_agp.obter_ou_calcular(chave, calcular)
+
+    def estatisticas_cache(self):
+        """Métricas dos caches em memória do DatabaseManager."""
+        return {
+            'agp': self.cache_agp.estatisticas(),
+            'parametros_clinicos': self.cache_parametros.estatisticas(),
+            'busca_alimentos': self.cache_busca_alimentos.estatisticas(),
+            'identidades': self.cache_identidades.estatisticas(),
+        }
+
+    def invalidar_parametros_clinicos(self, user_id):
+        """
+        Descarta os parâmetros de Bolus (e a agenda) em cache do paciente (chamar após gravá-los).
+        A versão dos dados já muda a chave; isto só libera as entradas antigas deste processo.
+        """
+        self.cache_parametros.invalidar_se(lambda chave: chave[1] == user_id)
+
+    def obter_agenda_parametros(self, user_id):
+        """
+        AgendaParametros do paciente (segmentos de agenda_parametros sobre os
+        parâmetros gerais). None se o paciente não existir. Fica em cache.
+        """
+        return self.obter_agendas_parametros_lote([user_id]).get(user_id)
+
+    def obter_agendas_parametros_lote(self, user_ids):
+        """Agendas de vários pacientes: {user_id: AgendaParametros}, uma consulta para os ausentes do cache."""
+        agendas = {}
+        faltantes = []
+        versoes = self.obter_versoes_dados(user_ids)
+        for user_id, versao in versoes.items():
+            agenda = self.cache_parametros.obter(('agenda', user_id, versao))
+            if agenda is not None:
+                agendas[user_id] = agenda
+            else:
+                faltantes.append(user_id)
+        if not faltantes:
+            return agendas
+
+        parametros = self.obter_parametros_clinicos_lote(faltantes, versoes)
+        segmentos = {}
+        if parametros:
+            placeholders = ','.join('?' for _ in parametros)
+            conn = self.get_db_connection(somente_leitura=True)
+            try:
+                for linha in conn.execute(f"""
+                    SELECT user_id, inicio_minuto, ric, fsi, glicemia_alvo
+                    FROM agenda_parametros
+                    WHERE user_id IN ({placeholders})
+                    ORDER BY user_id, inicio_minuto
+                """, list(parametros)):
+                    segmentos.setdefault(linha['user_id'], []).append(tuple(linha)[1:])
+            except sqlite3.Error as e:
+                print(f"Erro ao carregar agenda de parâmetros: {e}")
+            finally:
+                conn.close()
+
+        for user_id, dados in parametros.items():
+            agenda = AgendaParametros.de_parametros(dados, segmentos.get(user_id, ()))
+            self.cache_parametros.definir(('agenda', user_id, versoes[user_id]), agenda)
+            agendas[user_id] = agenda
+        return agendas
+
+    def salvar_agenda_parametros(self, user_id, segmentos):
+        """
+        Substitui a agenda do paciente. segmentos: lista de
+        (inicio_minuto, ric, fsi, glicemia_alvo); None herda o parâmetro geral.
+        Lista vazia volta aos turnos fixos. Lança ValueError se a agenda for inválida.
+        """
+        segmentos = [tuple(s) for s in segmentos]
+        if segmentos:
+            # Valida estrutura (minutos, duplicatas) antes de gravar
+            AgendaParametros([(s[0], 1, 1, 1) for s in segmentos])
+            if any(v is not None and v <= 0 for s in segmentos for v in s[1:]):
+                raise ValueError("RIC, FSI e glicemia alvo devem ser positivos.")
+
+        conn = self.get_db_connection()
+        try:
+            conn.execute("DELETE FROM agenda_parametros WHERE user_id = ?", (user_id,))
+            conn.executemany(
+                "INSERT INTO agenda_parametros (user_id, inicio_minuto, ric, fsi, glicemia_alvo) VALUES (?, ?, ?, ?, ?)",
+                [(user_id,) + s for s in segmentos]
+            )
+            conn.commit()
+            self.invalidar_parametros_clinicos(user_id)
+            return True
+        except sqlite3.Error as e:
+            print(f"Erro ao salvar agenda de parâmetros do paciente {user_id}: {e}")
+            conn.rollback()
+            return False
+        finally:
+            conn.close()
+
+    def obter_metricas_pacientes(self, paciente_ids, dias=14):
+        """
+        Métricas de consenso dos últimos 'dias' para vários pacientes com UMA
+        consulta. Retorna {paciente_id: métricas} (só pacientes com leituras).
+        """
+        if not paciente_ids:
+            return {}
+        inicio_ts = datetime_para_epoch(datetime.now()) - dias * SEGUNDOS_DIA
+        placeholders = ','.join('?' for _ in paciente_ids)
+        try:
+            with self.get_db_connection(somente_leitura=True) as conn:
+                linhas = conn.execute(f"""
+                    SELECT user_id, ts_epoch, valor 
+                    FROM registros 
+                    WHERE user_id IN ({placeholders}) AND valor IS NOT NULL AND ts_epoch >= ? 
+                    ORDER BY user_id, ts_epoch
+                """, list(paciente_ids) + [inicio_ts]).fetchall()
+        except sqlite3.Error as e:
+            print(f"Erro ao carregar métricas dos pacientes: {e}")
+            return {}
+        if not linhas:
+            return {}
+        user_ids, ts, valores = zip(*linhas)
+        return metricas_por_paciente(user_ids, ts, valores)
+
+    # Parâmetros do cálculo de Bolus (ver _unificar_parametros_clinicos)
+    _SQL_PARAMETROS_CLINICOS = """
+        SELECT 
+            id,
+            meta_glicemia AS glicemia_alvo, 
+            
+            razao_ic AS ric_geral, 
+            fator_sensibilidade AS fsi_geral,
+            
+            ric_manha, ric_almoco, ric_jantar,
+            fsi_manha, fsi_almoco, fsi_jantar
+        FROM users 
+    """
+
+    @staticmethod
+    def _unificar_parametros_clinicos(parametros):
+        # Unificação: Usa o valor específico por horário, se existir. 
+        # Caso contrário, usa o valor geral (ric_geral ou fsi_geral).
+        # Garante que os valores necessários para o BolusService existam.
+        return {
+            'glicemia_alvo': parametros['glicemia_alvo'] or 120.0,
+            # RIC
+            'ric_manha': parametros['ric_manha'] or parametros['ric_geral'] or 10.0,
+            'ric_almoco': parametros['ric_almoco'] or parametros['ric_geral'] or 10.0,
+            'ric_jantar': parametros['ric_jantar'] or parametros['ric_geral'] or 10.0,
+            'ric': parametros['ric_geral'] or 10.0, # Valor padrão para o Bolus Nutricional (caso o serviço use apenas 1)
+            
+            # FSI
+            'fsi_manha': parametros['fsi_manha'] or parametros['fsi_geral'] or 50.0,
+            'fsi_almoco': parametros['fsi_almoco'] or parametros['fsi_geral'] or 50.0,
+            'fsi_jantar': parametros['fsi_jantar'] or parametros['fsi_geral'] or 50.0,
+        }
+
     def obter_parametros_clinicos(self, user_id):
         """
         Busca todos os parâmetros necessários para o cálculo do Bolus.
         Se parâmetros específicos por horário (fsi/ric) não existirem, 
         usa os valores gerais (razao_ic/fator_sensibilidade).
+        Resultado em cache (cache_parametros) por versão dos dados do paciente.
         """
-        sql = """
-            SELECT 
-                meta_glicemia AS glicemia_alvo, 
-                
-                razao_ic AS ric_geral, 
-                fator_sensibilidade AS fsi_geral,
-                
-                ric_manha, ric_almoco, ric_jantar,
-                fsi_manha, fsi_almoco, fsi_jantar
-            FROM users 
-            WHERE id = ?
-        """
-        conn = self.get_db_connection()
+        chave = ('parametros', user_id, self.obter_versao_dados(user_id))
+        em_cache = self.cache_parametros.obter(chave)
+        if em_cache is not None:
+            return dict(em_cache)
+
+        conn = self.get_db_connection(somente_leitura=True)
         try:
             cursor = conn.cursor()
-            cursor.execute(sql, (user_id,))
+            cursor.execute(self._SQL_PARAMETROS_CLINICOS + " WHERE id = ?", (user_id,))
             parametros = cursor.fetchone()
             
             if not parametros:
                 return None
 
-            # Unificação: Usa o valor específico por horário, se existir. 
-            # Caso contrário, usa o valor geral (ric_geral ou fsi_geral).
-            # Garante que os valores necessários para o BolusService existam.
-            dados_calculo = {
-                'glicemia_alvo': parametros['glicemia_alvo'] or 120.0,
-                # RIC
-                'ric_manha': parametros['ric_manha'] or parametros['ric_geral'] or 10.0,
-                'ric_almoco': parametros['ric_almoco'] or parametros['ric_geral'] or 10.0,
-                'ric_jantar': parametros['ric_jantar'] or parametros['ric_geral'] or 10.0,
-                'ric': parametros['ric_geral'] or 10.0, # Valor padrão para o Bolus Nutricional (caso o serviço use apenas 1)
-                
-                # FSI
-                'fsi_manha': parametros['fsi_manha'] or parametros['fsi_geral'] or 50.0,
-                'fsi_almoco': parametros['fsi_almoco'] or parametros['fsi_geral'] or 50.0,
-                'fsi_jantar': parametros['fsi_jantar'] or parametros['fsi_geral'] or 50.0,
-            }
-            return dados_calculo
+            dados_calculo = self._unificar_parametros_clinicos(parametros)
+            self.cache_parametros.definir(chave, dados_calculo)
+            return dict(dados_calculo)
 
         except sqlite3.Error as e:
             print(f"Erro de DB ao obter parâmetros clínicos: {e}")
@@ -2012,33 +2404,70 @@ class DatabaseManager:
         finally:
             conn.close()
 
+    def obter_parametros_clinicos_lote(self, user_ids, versoes=None):
+        """
+        Parâmetros de Bolus de vários pacientes com UMA consulta.
+        Retorna {user_id: parâmetros} (pacientes inexistentes ficam de fora).
+        Usa o cache_parametros; só os ausentes vão ao banco.
+        versoes: {user_id: versao} já lidas (obter_versoes_dados); se None, são lidas aqui.
+        """
+        if versoes is None:
+            versoes = self.obter_versoes_dados(user_ids)
+        resultado = {}
+        faltantes = []
+        for user_id in dict.fromkeys(user_ids):
+            em_cache = self.cache_parametros.obter(('parametros', user_id, versoes[user_id]))
+            if em_cache is not None:
+                resultado[user_id] = dict(em_cache)
+            else:
+                faltantes.append(user_id)
+        if not faltantes:
+            return resultado
+        placeholders = ','.join('?' for _ in faltantes)
+        conn = self.get_db_connection(somente_leitura=True)
+        try:
+            linhas = conn.execute(
+                self._SQL_PARAMETROS_CLINICOS + f" WHERE id IN ({placeholders})", faltantes
+            ).fetchall()
+            for linha in linhas:
+                dados_calculo = self._unificar_parametros_clinicos(linha)
+                self.cache_parametros.definir(('parametros', linha['id'], versoes[linha['id']]), dados_calculo)
+                resultado[linha['id']] = dict(dados_calculo)
+            return resultado
+        except sqlite3.Error as e:
+            print(f"Erro de DB ao obter parâmetros clínicos em lote: {e}")
+            return resultado
+        finally:
+            conn.close()
+
 
     def buscar_doses_insulina_recentes(self, user_id, horas_limite=5):
             """
             Busca todos os registros de doses de insulina aplicadas pelo paciente
             dentro do limite de tempo (ex: últimas 5 horas).
             
-            Retorna uma lista de dicionários: [{'dose': X, 'data_hora': Y}, ...]
+            Retorna uma lista de dicionários:
+            [{'data_hora': ..., 'ts_epoch': ..., 'dose_insulina': X}, ...]
             """
             # 1. Calcular o ponto de corte no tempo
-            hora_limite = datetime.now() - timedelta(hours=horas_limite)
+            limite_ts = datetime_para_epoch(datetime.now() - timedelta(hours=horas_limite))
             
             sql = """
                 SELECT 
                     data_hora, 
+                    ts_epoch, 
                     dose_insulina
                 FROM registros 
                 WHERE 
                     user_id = ? 
                     AND dose_insulina IS NOT NULL 
-                    AND data_hora >= ?
-                ORDER BY data_hora DESC
+                    AND ts_epoch >= ?
+                ORDER BY ts_epoch DESC
             """
-            conn = self.get_db_connection()
+            conn = self.get_db_connection(somente_leitura=True)
             try:
                 cursor = conn.cursor()
-                # O SQLite compara strings ISO 8601 corretamente
-                cursor.execute(sql, (user_id, hora_limite.isoformat()))
+                cursor.execute(sql, (user_id, limite_ts))
                 
                 # Retorna como dicionários
                 doses = [dict(row) for row in cursor.fetchall()]
@@ -2049,7 +2478,58 @@ class DatabaseManager:
                 return []
             finally:
                 conn.close()
-                
+
+    def buscar_doses_insulina_periodo(self, user_id, inicio_ts, fim_ts):
+            """
+            Doses de insulina do paciente com ts_epoch entre inicio_ts e fim_ts
+            (inclusive), em ordem cronológica. Usa idx_registros_insulina_ts.
+            """
+            sql = """
+                SELECT ts_epoch, dose_insulina
+                FROM registros
+                WHERE user_id = ?
+                  AND dose_insulina IS NOT NULL
+                  AND ts_epoch BETWEEN ? AND ?
+                ORDER BY ts_epoch
+            """
+            conn = self.get_db_connection(somente_leitura=True)
+            try:
+                cursor = conn.cursor()
+                cursor.execute(sql, (user_id, int(inicio_ts), int(fim_ts)))
+                return [dict(row) for row in cursor.fetchall()]
+            except sqlite3.Error as e:
+                print(f"Erro ao buscar doses de insulina do período: {e}")
+                return []
+            finally:
+                conn.close()
+
+    def buscar_doses_insulina_lote(self, user_ids, inicio_ts, fim_ts):
+            """
+            Doses positivas de insulina de vários pacientes entre inicio_ts e
+            fim_ts (ts_epoch), com UMA consulta, ordenadas por (user_id, ts_epoch).
+            Retorna lista de tuplas (user_id, ts_epoch, dose_insulina).
+            """
+            user_ids = list(dict.fromkeys(user_ids))
+            if not user_ids:
+                return []
+            placeholders = ','.join('?' for _ in user_ids)
+            sql = f"""
+                SELECT user_id, ts_epoch, dose_insulina
+                FROM registros
+                WHERE user_id IN ({placeholders})
+                  AND dose_insulina IS NOT NULL AND dose_insulina > 0
+                  AND ts_epoch BETWEEN ? AND ?
+                ORDER BY user_id, ts_epoch
+            """
+            conn = self.get_db_connection(somente_leitura=True)
+            try:
+                return [tuple(linha) for linha in conn.execute(sql, user_ids + [int(inicio_ts), int(fim_ts)])]
+            except sqlite3.Error as e:
+                print(f"Erro ao buscar doses de insulina em lote: {e}")
+                return []
+            finally:
+                conn.close()
+
     def buscar_ultima_glicemia(self, user_id):
             """
             Busca a última Glicemia Capilar (GC) registrada pelo paciente.
@@ -2061,10 +2541,10 @@ class DatabaseManager:
                 WHERE user_id = ? 
                 -- Filtra registros que são glicemia ou que contêm um valor de glicemia
                 AND valor IS NOT NULL 
-                ORDER BY data_hora DESC 
+                ORDER BY ts_epoch DESC 
                 LIMIT 1
             """
-            conn = self.get_db_connection() # Use o seu método de conexão
+            conn = self.get_db_connection(somente_leitura=True) # Use o seu método de conexão
             try:
                 cursor = conn.cursor()
                 cursor.execute(sql, (user_id,))
@@ -2115,24 +2595,24 @@ class DatabaseManager:
         Calcula a dose média de insulina aplicada pelo paciente nos últimos 'dias'.
         Usamos o campo 'dose_aplicada' da tabela 'registros'.
         """
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(somente_leitura=True)
         try:
             cursor = conn.cursor()
             
             # Calcula a data de início do período (ex: 14 dias atrás)
-            data_inicio = (datetime.now() - timedelta(days=dias)).strftime('%Y-%m-%d %H:%M:%S')
+            inicio_ts = datetime_para_epoch(datetime.now() - timedelta(days=dias))
             
             # A condição chave é que a dose_aplicada seja maior que zero
             sql = """
                 SELECT AVG(dose_aplicada) 
                 FROM registros 
                 WHERE user_id = ?
-                AND data_hora >= ?
+                AND ts_epoch >= ?
                 AND dose_aplicada IS NOT NULL 
                 AND dose_aplicada > 0
             """
             
-            cursor.execute(sql, (user_id, data_inicio))
+            cursor.execute(sql, (user_id, inicio_ts))
             media = cursor.fetchone()[0]
             
             # Linha de DEBUG (deve ser identada)
@@ -2153,75 +2633,84 @@ class DatabaseManager:
             conn.close()
 # ---------------------- NOVAS FUNÇÕES DE GRÁFICOS ----------------------
 
-    def obter_dados_glicemia_para_grafico(self, paciente_id):
-            """Retorna dados de glicemia (data e valor) ordenados por data."""
-            # Sua lógica de conexão aqui, talvez self.get_db_connection()
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+    def obter_dados_glicemia_para_grafico(self, paciente_id, inicio_ts=None, fim_ts=None, max_pontos=None):
+            """
+            Retorna dados de glicemia (data e valor) ordenados por data.
+            inicio_ts/fim_ts (ts_epoch) limitam o período; com max_pontos a série é
+            reduzida no servidor por LTTB, mantendo picos e vales.
+            """
+            filtros, params = '', [paciente_id]
+            if inicio_ts is not None:
+                filtros += ' AND ts_epoch >= ?'
+                params.append(inicio_ts)
+            if fim_ts is not None:
+                filtros += ' AND ts_epoch < ?'
+                params.append(fim_ts)
+            with self.get_db_connection(somente_leitura=True) as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT 
                         strftime('%Y-%m-%d %H:%M', data_hora) as data_hora, 
-                        valor 
+                        valor,
+                        ts_epoch
                     FROM 
                         registros 
                     WHERE 
                         user_id = ? 
                         AND valor IS NOT NULL 
-                        AND tipo != 'Refeição'
+                        AND tipo != 'Refeição'{filtros}
                     ORDER BY 
-                        data_hora ASC
-                """, (paciente_id,))
-                return [dict(row) for row in cursor.fetchall()]
+                        ts_epoch ASC
+                """, params)
+                linhas = cursor.fetchall()
+
+            if max_pontos and len(linhas) > max_pontos:
+                ts = [l['ts_epoch'] if l['ts_epoch'] is not None else 0 for l in linhas]
+                linhas = [linhas[i] for i in indices_lttb(ts, [l['valor'] for l in linhas], max_pontos)]
+            return [{'data_hora': l['data_hora'], 'valor': l['valor']} for l in linhas]
 
     def obter_carbs_diarios_para_grafico(self, paciente_id):
-            """Retorna a soma total de carboidratos por dia (apenas Refeições)."""
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            """Retorna a soma total de carboidratos por dia, apenas Refeições (rollup registros_diarios)."""
+            with self.get_db_connection(somente_leitura=True) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT 
-                        strftime('%Y-%m-%d', data_hora) as data, 
-                        SUM(total_carbs) as total_carbs
+                        dia as data, 
+                        carbs_refeicao as total_carbs
                     FROM 
-                        registros 
+                        registros_diarios 
                     WHERE 
                         user_id = ? 
-                        AND tipo = 'Refeição' 
-                        AND total_carbs IS NOT NULL
-                    GROUP BY 
-                        data
+                        AND carbs_refeicao IS NOT NULL
                     ORDER BY 
-                        data ASC
+                        dia ASC
                 """, (paciente_id,))
                 return [dict(row) for row in cursor.fetchall()]
 
     def obter_calorias_diarias_para_grafico(self, paciente_id):
-            """Retorna a soma total de calorias por dia (apenas Refeições)."""
-            # Você não tinha um campo 'total_calorias' no DB, então a consulta deve ser ajustada
-            # para somar a caloria de cada alimento dentro do JSON, ou usar um campo de soma
-            # que você já tenha. Assumindo que você tem um campo 'calorias_totais' ou similar:
-            
-            # 🚨 NOTA: Se você não tiver um campo de soma para calorias, esta função falhará.
-            # Vou usar 'total_calorias' como um placeholder para um campo de soma no registro:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            """Retorna a soma total de calorias por dia, apenas Refeições (rollup registros_diarios)."""
+            with self.get_db_connection(somente_leitura=True) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT 
-                        strftime('%Y-%m-%d', data_hora) as data, 
-                        SUM(total_calorias) as total_calorias
+                        dia as data, 
+                        kcal_refeicao as total_calorias
                     FROM 
-                        registros 
+                        registros_diarios 
                     WHERE 
                         user_id = ? 
-                        AND tipo = 'Refeição'
-                        AND total_calorias IS NOT NULL
-                    GROUP BY 
-                        data
+                        AND kcal_refeicao IS NOT NULL
                     ORDER BY 
-                        data ASC
+                        dia ASC
                 """, (paciente_id,))
                 return [dict(row) for row in cursor.fetchall()]
 
+    def reconstruir_resumo_diario(self, user_id=None):
+            """
+            Recalcula registros_diarios a partir de registros (um paciente ou todos).
+            Os triggers mantêm o rollup em dia; isto serve para reparo/auditoria.
+            """
+            with self.get_db_connection() as conn:
+                reconstruir_registros_diarios(conn, user_id)
+
  # -----------------------------------------------------------------------
\ No newline at end of file
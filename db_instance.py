@@ -1,5 +1,75 @@
 # db_instance.py
+"""
+Instância ÚNICA do DatabaseManager compartilhada pelo app, blueprints e serviços.
 
-from database_manager import DatabaseManager # Assumindo que sua classe está aqui
+A construção é preguiçosa: acontece no primeiro uso de 'db_manager' (e não no
+import), uma única vez por processo, mesmo com várias threads chegando juntas.
+O tempo gasto fica em metricas_inicializacao.
 
-db_manager = DatabaseManager()
\ No newline at end of file
+init_app() confere a versão do esquema já na inicialização do app (sem
+construir o DatabaseManager): com migrações pendentes o app não sobe.
+"""
+
+import sqlite3
+import threading
+import time
+
+from werkzeug.local import LocalProxy
+
+from database_manager import DatabaseManager, caminho_banco
+from migracoes import exigir_esquema_atual
+
+_instancia = None
+_lock = threading.Lock()
+
+# Métricas de inicialização (preenchidas na primeira construção)
+metricas_inicializacao = {
+    'db_manager_inicializado': False,
+    'db_manager_inicializado_em': None,
+    'db_manager_tempo_ms': None,
+}
+
+
+def obter_db_manager():
+    """Retorna o DatabaseManager do processo, criando-o no primeiro uso."""
+    global _instancia
+    if _instancia is None:
+        with _lock:
+            if _instancia is None:
+                inicio = time.perf_counter()
+                instancia = DatabaseManager()
+                tempo_ms = (time.perf_counter() - inicio) * 1000
+                metricas_inicializacao.update({
+                    'db_manager_inicializado': True,
+                    'db_manager_inicializado_em': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'db_manager_tempo_ms': round(tempo_ms, 3),
+                })
+                print(f"DatabaseManager inicializado em {tempo_ms:.1f} ms.")
+                _instancia = instancia
+    return _instancia
+
+
+def verificar_esquema_banco(db_path='glicemia.db'):
+    """
+    Confere a versão do esquema com uma conexão avulsa, sem construir o
+    DatabaseManager. Levanta migracoes.EsquemaDesatualizado se houver
+    migrações pendentes ('python migracoes.py').
+    """
+    conn = sqlite3.connect(caminho_banco(db_path))
+    try:
+        return exigir_esquema_atual(conn)
+    finally:
+        conn.close()
+
+
+def init_app(app):
+    """
+    Registra o gerenciador compartilhado como extensão do Flask
+    (app.extensions['db_manager']), depois de conferir o esquema do banco.
+    """
+    verificar_esquema_banco()
+    app.extensions['db_manager'] = db_manager
+
+
+# Proxy usado por todo o código: 'from db_instance import db_manager'
+db_manager = LocalProxy(obter_db_manager)
@@ -0,0 +1,194 @@
+# insulina_ativa.py
+"""
+Motor de Insulina Ativa (IOB - insulin on board) com curvas plugáveis.
+
+Cada curva é pré-calculada UMA vez como tabela com resolução de 1 minuto:
+tabela[m] = fração da dose ainda ativa m minutos após a aplicação. Assim a IA
+de N doses custa N consultas à tabela, e a série temporal completa sai de uma
+única convolução.
+
+Curvas registradas (ver CURVAS / registrar_curva):
+    'linear'        decaimento linear (comportamento original, 4 h)
+    'bilinear'      atividade triangular (pico em 75 min para 3 h, escalado pela duração)
+    'rapida'        exponencial, análogos rápidos (lispro/aspart): pico 75 min, 5 h
+    'ultra_rapida'  exponencial, ultrarrápidas (fiasp/lyumjev): pico 55 min, 5 h
+"""
+
+import math
+
+import numpy as np
+
+SEGUNDOS_MINUTO = 60
+
+
+class CurvaInsulina:
+    """Curva de insulina ativa pré-calculada por minuto."""
+
+    __slots__ = ('nome', 'duracao_minutos', 'tabela')
+
+    def __init__(self, nome, duracao_minutos, fracao_restante):
+        """
+        fracao_restante: função vetorizada t (minutos, array) -> fração ativa,
+        com valor 1 em t=0 e 0 em t=duracao_minutos.
+        """
+        self.nome = nome
+        self.duracao_minutos = int(duracao_minutos)
+        minutos = np.arange(self.duracao_minutos + 1, dtype=np.float64)
+        tabela = np.clip(np.asarray(fracao_restante(minutos), dtype=np.float64), 0.0, 1.0)
+        tabela[0] = 1.0
+        tabela[-1] = 0.0
+        tabela.flags.writeable = False
+        self.tabela = tabela
+
+    @property
+    def duracao_horas(self):
+        return self.duracao_minutos / 60.0
+
+    def fracao(self, minutos_decorridos):
+        """
+        Fração ativa para um array de minutos decorridos (consulta à tabela).
+        Antes da aplicação (negativo) a dose conta inteira; depois da duração, zero.
+        """
+        indices = np.clip(np.asarray(minutos_decorridos, dtype=np.int64), 0, self.duracao_minutos)
+        return self.tabela[indices]
+
+
+# --- Modelos de curva ---
+
+def curva_linear(duracao_minutos=240):
+    return CurvaInsulina('linear', duracao_minutos, lambda t: 1.0 - t / duracao_minutos)
+
+
+def curva_bilinear(duracao_minutos=240):
+    """Atividade triangular (modelo de Walsh): sobe até o pico e cai a zero na duração."""
+    pico = 75.0 * duracao_minutos / 180.0
+
+    def fracao_restante(t):
+        atividade = np.where(t <= pico, t / pico, (duracao_minutos - t) / (duracao_minutos - pico))
+        acumulada = np.cumsum(np.clip(atividade, 0.0, None))
+        return 1.0 - acumulada / acumulada[-1]
+
+    return CurvaInsulina('bilinear', duracao_minutos, fracao_restante)
+
+
+def curva_exponencial(nome, pico_minutos, duracao_minutos=300):
+    """
+    Curva exponencial do OpenAPS (oref0) parametrizada por pico e duração:
+    tau = tp(1 - tp/td) / (1 - 2tp/td); a = 2tau/td; S = 1 / (1 - a + (1 + a)e^(-td/tau))
+    IOB(t) = 1 - S(1 - a)[(t²/(tau·td(1 - a)) - t/tau - 1)e^(-t/tau) + 1]
+    """
+    tp, td = float(pico_minutos), float(duracao_minutos)
+    tau = tp * (1 - tp / td) / (1 - 2 * tp / td)
+    a = 2 * tau / td
+    s = 1 / (1 - a + (1 + a) * math.exp(-td / tau))
+
+    def fracao_restante(t):
+        return 1 - s * (1 - a) * ((t ** 2 / (tau * td * (1 - a)) - t / tau - 1) * np.exp(-t / tau) + 1)
+
+    return CurvaInsulina(nome, duracao_minutos, fracao_restante)
+
+
+CURVAS = {
+    'linear': curva_linear(),
+    'bilinear': curva_bilinear(),
+    'rapida': curva_exponencial('rapida', pico_minutos=75),
+    'ultra_rapida': curva_exponencial('ultra_rapida', pico_minutos=55),
+}
+
+CURVA_PADRAO = 'linear'
+
+
+def registrar_curva(curva):
+    """Registra (ou substitui) uma curva pelo nome."""
+    CURVAS[curva.nome] = curva
+    return curva
+
+
+def obter_curva(nome=None):
+    try:
+        return CURVAS[nome or CURVA_PADRAO]
+    except KeyError:
+        raise ValueError(f"Curva de insulina desconhecida: {nome!r}. Disponíveis: {', '.join(sorted(CURVAS))}")
+
+
+# --- Cálculo ---
+
+def insulina_ativa(curva, ts_doses, doses_ui, agora_ts):
+    """IA total (UI) em agora_ts para doses aplicadas em ts_doses (ts_epoch)."""
+    doses = np.asarray(doses_ui, dtype=np.float64)
+    if not doses.size:
+        return 0.0
+    minutos = (agora_ts - np.asarray(ts_doses, dtype=np.int64)) // SEGUNDOS_MINUTO
+    # Doses futuras (minutos < 0) ainda não contam
+    ativas = minutos >= 0
+    return float(np.dot(doses[ativas], curva.fracao(minutos[ativas])))
+
+
+def serie_insulina_ativa(curva, ts_doses, doses_ui, inicio_ts, fim_ts, passo_minutos=5):
+    """
+    Série de IA (UI) de inicio_ts a fim_ts, a cada passo_minutos, em uma passada:
+    as doses são acumuladas numa grade de 1 minuto e convoluídas com a tabela
+    da curva. Doses anteriores a inicio_ts (dentro da duração) são consideradas.
+
+    Retorna (ts_grade, ia) como arrays NumPy.
+    """
+    ts_doses = np.asarray(ts_doses, dtype=np.int64)
+    doses = np.asarray(doses_ui, dtype=np.float64)
+    duracao = curva.duracao_minutos
+
+    origem = int(inicio_ts) - duracao * SEGUNDOS_MINUTO
+    total_minutos = (int(fim_ts) - origem) // SEGUNDOS_MINUTO + 1
+
+    grade = np.zeros(total_minutos, dtype=np.float64)
+    # Arredonda para cima: no primeiro ponto da grade após a dose, os minutos
+    # decorridos batem com os de insulina_ativa() (piso de agora - ts)
+    posicoes = -((origem - ts_doses) // SEGUNDOS_MINUTO)
+    dentro = (posicoes >= 0) & (posicoes < total_minutos)
+    np.add.at(grade, posicoes[dentro], doses[dentro])
+
+    # ia[m] = soma_k grade[m - k] * tabela[k]
+    ia = np.convolve(grade, curva.tabela)[:total_minutos]
+
+    amostras = np.arange(duracao, total_minutos, passo_minutos)
+    return origem + amostras * SEGUNDOS_MINUTO, ia[amostras]
+
+
+def insulina_ativa_lote(curva, grupos_doses, ts_doses, doses_ui, grupos_consulta, ts_consulta):
+    """
+    IA de muitas consultas (grupo, instante) de uma vez, sem laço em Python.
+
+    grupos_doses/ts_doses/doses_ui: doses de todos os grupos (ex.: pacientes),
+    ORDENADAS por (grupo, ts). Grupos são inteiros >= 0 (índices densos).
+    Para cada consulta, só as doses do mesmo grupo em (ts - duração, ts] contam:
+    os intervalos saem de searchsorted e os pares (consulta, dose) são
+    expandidos com np.repeat, então o custo é proporcional ao total de pares.
+
+    Retorna array com a IA (UI) de cada consulta.
+    """
+    ts_consulta = np.asarray(ts_consulta, dtype=np.int64)
+    n = ts_consulta.size
+    ts_doses = np.asarray(ts_doses, dtype=np.int64)
+    if not n or not ts_doses.size:
+        return np.zeros(n, dtype=np.float64)
+
+    # Chave composta (grupo, ts) ordenável numa única dimensão
+    deslocamento = np.int64(1) << 34
+    chave_doses = np.asarray(grupos_doses, dtype=np.int64) * deslocamento + ts_doses
+    chave_consulta = np.asarray(grupos_consulta, dtype=np.int64) * deslocamento + ts_consulta
+
+    duracao_s = curva.duracao_minutos * SEGUNDOS_MINUTO
+    inicio = np.searchsorted(chave_doses, chave_consulta - duracao_s, side='right')
+    fim = np.searchsorted(chave_doses, chave_consulta, side='right')
+
+    contagens = fim - inicio
+    total = int(contagens.sum())
+    if not total:
+        return np.zeros(n, dtype=np.float64)
+
+    idx_consulta = np.repeat(np.arange(n), contagens)
+    desvios = np.arange(total) - np.repeat(np.cumsum(contagens) - contagens, contagens)
+    idx_dose = np.repeat(inicio, contagens) + desvios
+
+    minutos = (ts_consulta[idx_consulta] - ts_doses[idx_dose]) // SEGUNDOS_MINUTO
+    contribuicoes = np.asarray(doses_ui, dtype=np.float64)[idx_dose] * curva.fracao(minutos)
+    return np.bincount(idx_consulta, weights=contribuicoes, minlength=n)
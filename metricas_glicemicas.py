@@ -0,0 +1,299 @@
+# metricas_glicemicas.py
+"""
+Métricas glicêmicas vetorizadas (NumPy) segundo o consenso internacional de
+tempo no alvo / CGM: TIR, TAR, TBR, média, DP, CV, GMI, eA1c, LBGI/HBGI e MAGE.
+
+As leituras de um paciente são carregadas UMA vez em dois arrays ordenados
+(ts_epoch, valor). Qualquer janela de tempo é obtida por busca binária
+(np.searchsorted) como uma fatia (view) desses arrays, sem copiar nem
+percorrer registros em Python.
+"""
+
+from itertools import chain
+
+import numpy as np
+
+# Faixas do consenso (mg/dL)
+ALVO_MIN = 70
+ALVO_MAX = 180
+HIPO_NIVEL_2 = 54
+HIPER_NIVEL_2 = 250
+
+SEGUNDOS_DIA = 86400
+
+
+def _metricas_vazias():
+    return {
+        'n': 0,
+        'media': None, 'dp': None, 'cv': None,
+        'tir': None, 'tar': None, 'tar_nivel2': None, 'tbr': None, 'tbr_nivel2': None,
+        'hipo_count': 0, 'hiper_count': 0,
+        'gmi': None, 'ea1c': None,
+        'lbgi': None, 'hbgi': None,
+        'mage': None,
+    }
+
+
+def calcular_mage(valores, dp=None):
+    """
+    MAGE (Mean Amplitude of Glycemic Excursions): média das amplitudes entre
+    picos e vales consecutivos que excedem 1 DP da série.
+    Picos/vales são os pontos onde a derivada troca de sinal (patamares
+    repetidos são colapsados antes).
+    """
+    v = np.asarray(valores, dtype=np.float64)
+    if v.size < 3:
+        return None
+    if dp is None:
+        dp = v.std()
+    if dp == 0:
+        return None
+
+    # Colapsa valores repetidos consecutivos (patamares não são extremos)
+    v = v[np.concatenate(([True], np.diff(v) != 0))]
+    if v.size < 3:
+        return None
+
+    sinais = np.sign(np.diff(v))
+    viradas = np.flatnonzero(sinais[1:] != sinais[:-1]) + 1
+    extremos = v[np.concatenate(([0], viradas, [v.size - 1]))]
+
+    excursoes = np.abs(np.diff(extremos))
+    validas = excursoes[excursoes > dp]
+    if validas.size == 0:
+        return None
+    return float(validas.mean())
+
+
+def calcular_metricas(valores):
+    """
+    Calcula todas as métricas para um array de glicemias (mg/dL).
+    Percentuais (TIR/TAR/TBR) são frações das leituras, em %.
+    Retorna um dicionário; chaves ficam None quando não há leituras.
+    """
+    v = np.asarray(valores, dtype=np.float64)
+    n = int(v.size)
+    if n == 0:
+        return _metricas_vazias()
+
+    media = float(v.mean())
+    dp = float(v.std(ddof=1)) if n > 1 else 0.0
+
+    abaixo = v < ALVO_MIN
+    acima = v > ALVO_MAX
+    hipo_count = int(np.count_nonzero(abaixo))
+    hiper_count = int(np.count_nonzero(acima))
+    pct = 100.0 / n
+
+    # Índices de risco de Kovatchev: f(BG) = 1.509 * (ln(BG)^1.084 - 5.381)
+    f = 1.509 * (np.log(np.clip(v, 1.0, None)) ** 1.084 - 5.381)
+    risco = 10.0 * f * f
+
+    mage = calcular_mage(v, dp)
+
+    return {
+        'n': n,
+        'media': round(media, 1),
+        'dp': round(dp, 1),
+        'cv': round(100.0 * dp / media, 1) if media else None,
+        'tir': round((n - hipo_count - hiper_count) * pct, 1),
+        'tar': round(hiper_count * pct, 1),
+        'tar_nivel2': round(int(np.count_nonzero(v > HIPER_NIVEL_2)) * pct, 1),
+        'tbr': round(hipo_count * pct, 1),
+        'tbr_nivel2': round(int(np.count_nonzero(v < HIPO_NIVEL_2)) * pct, 1),
+        'hipo_count': hipo_count,
+        'hiper_count': hiper_count,
+        # GMI (%) = 3.31 + 0.02392 x média (Bergenstal 2018)
+        'gmi': round(3.31 + 0.02392 * media, 2),
+        # eA1c (%) = (média + 46.7) / 28.7 (ADAG)
+        'ea1c': round((media + 46.7) / 28.7, 2),
+        'lbgi': round(float(np.where(f < 0, risco, 0.0).mean()), 2),
+        'hbgi': round(float(np.where(f > 0, risco, 0.0).mean()), 2),
+        'mage': round(mage, 1) if mage is not None else None,
+    }
+
+
+class SerieGlicemica:
+    """
+    Leituras de glicemia de um paciente em arrays NumPy ordenados por tempo.
+
+    ts      -> int64, registros.ts_epoch (segundos)
+    valores -> float64, mg/dL
+    """
+    __slots__ = ('ts', 'valores')
+
+    def __init__(self, ts, valores):
+        ts = np.asarray(ts, dtype=np.int64)
+        valores = np.asarray(valores, dtype=np.float64)
+        if ts.size > 1 and np.any(ts[1:] < ts[:-1]):
+            ordem = np.argsort(ts, kind='stable')
+            ts, valores = ts[ordem], valores[ordem]
+        self.ts = ts
+        self.valores = valores
+
+    @classmethod
+    def de_linhas(cls, linhas):
+        """Constrói a série a partir de linhas (ts_epoch, valor), ex.: um cursor SQLite."""
+        # fromiter sobre a sequência achatada evita criar um array de objetos
+        dados = np.fromiter(chain.from_iterable(linhas), dtype=np.float64).reshape(-1, 2)
+        return cls(dados[:, 0].astype(np.int64), dados[:, 1])
+
+    def __len__(self):
+        return int(self.ts.size)
+
+    @property
+    def ultimo(self):
+        """(ts_epoch, valor) da leitura mais recente, ou None."""
+        if not self.ts.size:
+            return None
+        return int(self.ts[-1]), float(self.valores[-1])
+
+    def janela(self, inicio_ts=None, fim_ts=None):
+        """Sub-série com inicio_ts <= ts < fim_ts (fatias, sem cópia)."""
+        i = 0 if inicio_ts is None else int(np.searchsorted(self.ts, inicio_ts, side='left'))
+        j = self.ts.size if fim_ts is None else int(np.searchsorted(self.ts, fim_ts, side='left'))
+        serie = SerieGlicemica.__new__(SerieGlicemica)
+        serie.ts = self.ts[i:j]
+        serie.valores = self.valores[i:j]
+        return serie
+
+    def metricas(self, inicio_ts=None, fim_ts=None):
+        """Métricas da janela [inicio_ts, fim_ts) (série inteira por padrão)."""
+        return calcular_metricas(self.janela(inicio_ts, fim_ts).valores)
+
+    def metricas_por_dias(self, agora_ts, dias=(7, 14, 30, 90)):
+        """Métricas das janelas 'últimos N dias' terminando em agora_ts: {N: {...}}."""
+        return {d: self.metricas(agora_ts - d * SEGUNDOS_DIA, None) for d in dias}
+
+
+def metricas_por_paciente(user_ids, ts, valores, inicio_ts=None):
+    """
+    Métricas de vários pacientes a partir de arrays "empilhados" (uma consulta
+    para todos). user_ids precisa estar agrupado (ORDER BY user_id, ts_epoch).
+    Retorna {user_id: métricas}.
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    ts = np.asarray(ts, dtype=np.int64)
+    valores = np.asarray(valores, dtype=np.float64)
+    if inicio_ts is not None:
+        filtro = ts >= inicio_ts
+        user_ids, valores = user_ids[filtro], valores[filtro]
+    if not user_ids.size:
+        return {}
+
+    # Fronteiras de cada grupo de user_id (array já agrupado)
+    inicios = np.flatnonzero(np.concatenate(([True], user_ids[1:] != user_ids[:-1])))
+    fins = np.concatenate((inicios[1:], [user_ids.size]))
+    return {
+        int(user_ids[i]): calcular_metricas(valores[i:j])
+        for i, j in zip(inicios, fins)
+    }
+
+
+# --- AGP (Ambulatory Glucose Profile) ---
+
+PERCENTIS_AGP = (5, 25, 50, 75, 95)
+
+
+def _suavizar_circular(curva, janela):
+    """Média móvel circular (o fim do dia emenda no começo), ignorando NaN."""
+    if janela <= 1:
+        return curva
+    raio = janela // 2
+    validos = ~np.isnan(curva)
+    valores = np.where(validos, curva, 0.0)
+    estendidos = np.concatenate((valores[-raio:], valores, valores[:raio]))
+    pesos = np.concatenate((validos[-raio:], validos, validos[:raio])).astype(np.float64)
+    nucleo = np.ones(janela)
+    soma = np.convolve(estendidos, nucleo, mode='valid')
+    contagem = np.convolve(pesos, nucleo, mode='valid')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        suavizada = soma / contagem
+    # Faixas sem nenhuma leitura continuam vazias
+    return np.where(validos, suavizada, np.nan)
+
+
+def calcular_agp(ts, valores, minutos_por_faixa=15, percentis=PERCENTIS_AGP, suavizacao=3):
+    """
+    Perfil ambulatorial de glicose: agrupa as leituras pelo minuto do dia
+    (ts_epoch % 86400) em faixas de 'minutos_por_faixa' e calcula, para cada
+    faixa, os percentis pedidos.
+
+    Tudo vetorizado: as leituras são ordenadas por (faixa, valor) uma vez e a
+    posição de cada percentil em cada faixa é obtida por aritmética de índices
+    (interpolação linear, como np.percentile).
+
+    Retorna {'minutos': [...], 'contagem': [...], 'p5': [...], ...}; faixas sem
+    leituras ficam com None.
+    """
+    ts = np.asarray(ts, dtype=np.int64)
+    valores = np.asarray(valores, dtype=np.float64)
+    n_faixas = (24 * 60) // minutos_por_faixa
+
+    faixas = ((ts % SEGUNDOS_DIA) // 60) // minutos_por_faixa
+    ordem = np.lexsort((valores, faixas))
+    ordenados = valores[ordem]
+
+    contagem = np.bincount(faixas, minlength=n_faixas)
+    inicios = np.concatenate(([0], np.cumsum(contagem)[:-1]))
+    com_dados = contagem > 0
+
+    resultado = {
+        'minutos': (np.arange(n_faixas) * minutos_por_faixa).tolist(),
+        'contagem': contagem.tolist(),
+    }
+    for p in percentis:
+        posicao = (contagem - 1).clip(min=0) * (p / 100.0)
+        baixo = np.floor(posicao).astype(np.int64)
+        alto = np.ceil(posicao).astype(np.int64)
+        fracao = posicao - baixo
+        curva = np.full(n_faixas, np.nan)
+        if ordenados.size:
+            i_baixo = (inicios + baixo)[com_dados]
+            i_alto = (inicios + alto)[com_dados]
+            curva[com_dados] = ordenados[i_baixo] + (ordenados[i_alto] - ordenados[i_baixo]) * fracao[com_dados]
+        curva = _suavizar_circular(curva, suavizacao)
+        resultado[f'p{p}'] = [None if np.isnan(x) else round(float(x), 1) for x in curva]
+    return resultado
+
+
+# --- Redução de pontos para gráficos ---
+
+def indices_lttb(x, y, max_pontos):
+    """
+    Largest-Triangle-Three-Buckets: escolhe até 'max_pontos' índices que
+    preservam a forma visual da série (picos e vales). Primeiro e último
+    pontos são sempre mantidos. x precisa estar em ordem crescente.
+
+    O laço é por balde (no máximo max_pontos iterações); dentro de cada balde
+    a escolha é vetorizada.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = x.size
+    if max_pontos >= n or max_pontos < 3:
+        return np.arange(n)
+
+    # Fronteiras dos max_pontos - 2 baldes internos (pontos 1 .. n-2)
+    limites = np.floor(np.linspace(1, n - 1, max_pontos - 1)).astype(np.int64)
+    escolhidos = np.empty(max_pontos, dtype=np.int64)
+    escolhidos[0] = 0
+    escolhidos[-1] = n - 1
+
+    anterior = 0
+    for b in range(max_pontos - 2):
+        inicio, fim = limites[b], limites[b + 1]
+        # Média do próximo balde (ou o último ponto, no último balde)
+        if b + 2 < limites.size:
+            prox_inicio, prox_fim = limites[b + 1], limites[b + 2]
+            media_x = x[prox_inicio:prox_fim].mean()
+            media_y = y[prox_inicio:prox_fim].mean()
+        else:
+            media_x, media_y = x[-1], y[-1]
+
+        ax, ay = x[anterior], y[anterior]
+        areas = np.abs((ax - media_x) * (y[inicio:fim] - ay) - (ax - x[inicio:fim]) * (media_y - ay))
+        anterior = inicio + int(np.argmax(areas))
+        escolhidos[b + 1] = anterior
+
+    return escolhidos
@@ -0,0 +1,929 @@
+# migracoes.py
+"""
+Migrações versionadas do esquema SQLite.
+
+Cada migração é um passo ordenado e idempotente, registrado na tabela
+schema_version depois de aplicado. As migrações só rodam pelo comando abaixo;
+na inicialização o DatabaseManager apenas compara a versão do banco com
+VERSAO_ESQUEMA e se recusa a iniciar (EsquemaDesatualizado) se houver
+migrações pendentes.
+
+Uso:
+    python migracoes.py             # aplica as migrações pendentes em data/glicemia.db
+                                    # (e faz o backfill de registros.ts_epoch, em lotes)
+    python migracoes.py --status    # mostra a versão atual e as migrações pendentes
+    python migracoes.py --db outro.db
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+# Índices de série temporal da tabela registros (conjunto ATUAL, ver migração 006).
+# Quase todas as leituras filtram por user_id + faixa/ordem de ts_epoch; os
+# parciais cobrem as consultas que só olham glicemias (valor) ou doses de insulina.
+INDICES_REGISTROS = {
+    'idx_registros_user_ts': "CREATE INDEX IF NOT EXISTS idx_registros_user_ts ON registros (user_id, ts_epoch)",
+    'idx_registros_glicemia_ts': "CREATE INDEX IF NOT EXISTS idx_registros_glicemia_ts ON registros (user_id, ts_epoch) WHERE valor IS NOT NULL",
+    'idx_registros_insulina_ts': "CREATE INDEX IF NOT EXISTS idx_registros_insulina_ts ON registros (user_id, ts_epoch) WHERE dose_insulina IS NOT NULL",
+    'idx_registros_dose_aplicada_ts': "CREATE INDEX IF NOT EXISTS idx_registros_dose_aplicada_ts ON registros (user_id, ts_epoch) WHERE dose_aplicada IS NOT NULL",
+}
+
+# Expressão que converte data_hora (TEXT em vários formatos: 'T' ou espaço, com
+# ou sem segundos/frações) para segundos desde 1970. O horário de parede é
+# tratado como se fosse UTC, então epoch_para_datetime() devolve exatamente o
+# horário gravado (sem deslocamento de fuso/horário de verão).
+SQL_TS_EPOCH = "CAST(strftime('%s', {coluna}) AS INTEGER)"
+
+
+# --- Funções auxiliares ---
+
+def _colunas(conn, tabela):
+    return {linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela})").fetchall()}
+
+
+def _adicionar_colunas(conn, tabela, colunas):
+    """ALTER TABLE ADD COLUMN apenas para as colunas que ainda não existem."""
+    existentes = _colunas(conn, tabela)
+    for nome, tipo in colunas:
+        if nome not in existentes:
+            conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {nome} {tipo}")
+            print(f"Coluna '{nome}' adicionada à tabela {tabela}.")
+
+
+def _caminho_banco(conn):
+    # PRAGMA database_list -> (seq, nome, arquivo)
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+
+# --- Passos de migração (sempre idempotentes) ---
+
+def _m001_tabelas_base(conn):
+    """Tabelas base do sistema."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            email TEXT,
+            role TEXT NOT NULL DEFAULT 'simples',
+            data_nascimento TEXT,
+            sexo TEXT,
+            razao_ic REAL,
+            fator_sensibilidade REAL,
+            meta_glicemia REAL,
+            is_active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS registros (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            data_hora TIMESTAMP NOT NULL,
+            tipo TEXT,
+            valor REAL,
+            carboidratos REAL,
+            observacoes TEXT,
+            alimentos_refeicao TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS log_acoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            acao TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS logs_acao (
+            id INTEGER PRIMARY KEY,
+            data_hora TEXT,
+            acao TEXT,
+            usuario TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fichas_medicas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            paciente_id INTEGER NOT NULL UNIQUE,
+            condicao_atual TEXT,
+            alergias TEXT,
+            historico_familiar TEXT,
+            medicamentos_uso TEXT,
+            FOREIGN KEY (paciente_id) REFERENCES users(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ficha_medica (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            medico_id INTEGER,
+            data_registro TEXT NOT NULL,
+            tipo_diabetes TEXT,
+            data_diagnostico TEXT,
+            historico_familiar TEXT,
+            outras_comorbidades TEXT,
+            insulina_basal TEXT,
+            insulina_bolus TEXT,
+            dose_basal_manha REAL,
+            dose_basal_noite REAL,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (medico_id) REFERENCES users(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS detalhes_refeicao (
+            registro_id INTEGER PRIMARY KEY,
+            tipo_refeicao TEXT NOT NULL,
+            carboidratos REAL,
+            calorias REAL,
+            alimentos_json TEXT,
+            FOREIGN KEY (registro_id) REFERENCES registros (id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agendamentos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            paciente_id INTEGER NOT NULL,
+            medico_id INTEGER NOT NULL,
+            data_hora TEXT NOT NULL,
+            observacoes TEXT,
+            status TEXT NOT NULL DEFAULT 'agendado',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (paciente_id) REFERENCES users(id),
+            FOREIGN KEY (medico_id) REFERENCES users(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vinculos_medico_paciente (
+            medico_id INTEGER NOT NULL,
+            paciente_id INTEGER NOT NULL,
+            PRIMARY KEY (medico_id, paciente_id),
+            FOREIGN KEY (medico_id) REFERENCES users (id),
+            FOREIGN KEY (paciente_id) REFERENCES users (id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vinculos_cuidador_paciente (
+            cuidador_id INTEGER NOT NULL,
+            paciente_id INTEGER NOT NULL,
+            PRIMARY KEY (cuidador_id, paciente_id),
+            FOREIGN KEY (cuidador_id) REFERENCES users (id),
+            FOREIGN KEY (paciente_id) REFERENCES users (id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS exames_laboratoriais (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            paciente_id INTEGER NOT NULL,
+            data_exame TEXT NOT NULL,
+            hb_a1c REAL,
+            glicose_jejum REAL,
+            colesterol_total REAL,
+            hdl REAL,
+            ldl REAL,
+            triglicerides REAL,
+            tsh REAL,
+            obs_medico TEXT,
+            FOREIGN KEY (paciente_id) REFERENCES users(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS alimentos (
+            id INTEGER PRIMARY KEY,
+            alimento TEXT UNIQUE NOT NULL,
+            medida_caseira TEXT,
+            peso REAL,
+            kcal REAL,
+            carbs REAL
+        )
+    """)
+
+
+def _m002_colunas_users(conn):
+    """Colunas de cadastro, vínculo com médico e parâmetros de Bolus por turno."""
+    _adicionar_colunas(conn, 'users', [
+        ('nome_completo', 'TEXT'),
+        ('telefone', 'TEXT'),
+        ('medico_id', 'INTEGER'),
+        ('meta_glicemia', 'REAL'),
+        ('documento', 'TEXT'),
+        ('crm', 'TEXT'),
+        ('cns', 'TEXT'),
+        ('especialidade', 'TEXT'),
+        ('ric_manha', 'REAL'),
+        ('ric_almoco', 'REAL'),
+        ('ric_jantar', 'REAL'),
+        ('fsi_manha', 'REAL'),
+        ('fsi_almoco', 'REAL'),
+        ('fsi_jantar', 'REAL'),
+    ])
+
+
+def _m003_colunas_registros_fichas(conn):
+    """Colunas de refeição/insulina em registros e campos atuais de fichas_medicas."""
+    _adicionar_colunas(conn, 'registros', [
+        ('alimentos_json', 'TEXT'),
+        ('total_calorias', 'REAL'),
+        ('total_carbs', 'REAL'),
+        ('dose_insulina', 'REAL'),
+        ('dose_aplicada', 'REAL'),
+        ('tipo_medicao', 'TEXT'),
+    ])
+    _adicionar_colunas(conn, 'fichas_medicas', [
+        ('historico_clinico', 'TEXT'),
+        ('medicacoes_atuais', 'TEXT'),
+        ('observacoes_medicas', 'TEXT'),
+    ])
+
+
+def _m004_indices_registros(conn):
+    """Índices de série temporal da tabela registros (sobre data_hora; substituídos na 006)."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_registros_user_data ON registros (user_id, data_hora)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_registros_glicemia ON registros (user_id, data_hora) WHERE valor IS NOT NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_registros_insulina ON registros (user_id, data_hora) WHERE dose_insulina IS NOT NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_registros_dose_aplicada ON registros (user_id, data_hora) WHERE dose_aplicada IS NOT NULL")
+
+
+def _m005_importar_json_legado(conn):
+    """Importa usuários e registros do data.json (modelo antigo), se existir."""
+    json_path = os.path.join(os.path.dirname(_caminho_banco(conn)), 'data.json')
+    if not os.path.exists(json_path):
+        return
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            json_data = json.load(f)
+    except json.JSONDecodeError:
+        print("Aviso: Arquivo data.json está corrompido ou vazio.")
+        return
+
+    print("Iniciando a migração dos dados do JSON para o SQLite...")
+
+    users_migrated_count = 0
+    for user in json_data.get('users', []):
+        if conn.execute("SELECT id FROM users WHERE username = ?", (user['username'],)).fetchone():
+            continue
+        try:
+            conn.execute("""
+                INSERT INTO users (
+                    id, username, password_hash, role, email, nome_completo,
+                    razao_ic, fator_sensibilidade, data_nascimento, sexo,
+                    telefone, medico_id, meta_glicemia, documento,
+                    crm, cns, especialidade
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                user['id'],
+                user['username'],
+                user['password_hash'],
+                user.get('role', 'paciente'),
+                user.get('email'),
+                user.get('nome'), # Mapeia 'nome' do JSON para 'nome_completo'
+                user.get('razao_ic'),
+                user.get('fator_sensibilidade'),
+                user.get('data_nascimento'),
+                user.get('sexo'),
+                user.get('telefone'),
+                user.get('medico_id'),
+                user.get('meta_glicemia'),
+                user.get('documento'),
+                user.get('crm'),
+                user.get('cns'),
+                user.get('especialidade')
+            ))
+            users_migrated_count += 1
+        except sqlite3.Error as e:
+            print(f"Erro ao migrar usuário {user.get('username')}: {e}")
+
+    registros_migrated_count = 0
+    for registro in json_data.get('registros_glicemia_refeicao', []):
+        if conn.execute("SELECT id FROM registros WHERE id = ?", (registro.get('id', -1),)).fetchone():
+            continue
+
+        data_hora = registro.get('data_hora') or datetime.now().isoformat()
+        tipo = registro.get('tipo') or 'Desconhecido'
+        alimentos_json_str = json.dumps(registro.get('alimentos')) if registro.get('alimentos') else None
+
+        conn.execute("""
+            INSERT INTO registros (id, user_id, data_hora, tipo, valor, observacoes, alimentos_json, total_calorias, total_carbs)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (registro.get('id'), registro['user_id'], data_hora, tipo, registro.get('valor'), registro.get('observacoes'), alimentos_json_str, registro.get('total_calorias'), registro.get('total_carbs')))
+        registros_migrated_count += 1
+
+    print(f"Migração concluída! {users_migrated_count} usuários e {registros_migrated_count} registros migrados.")
+
+
+def _m006_ts_epoch(conn):
+    """
+    Coluna canônica ts_epoch (INTEGER) mantida por triggers a partir de data_hora,
+    e troca dos índices de data_hora pelos de ts_epoch. O preenchimento das linhas
+    antigas é feito em lotes por preencher_ts_epoch(), fora desta transação
+    (DatabaseManager.migrar() chama os dois).
+    """
+    _adicionar_colunas(conn, 'registros', [('ts_epoch', 'INTEGER')])
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_registros_ts_epoch_insert
+        AFTER INSERT ON registros
+        BEGIN
+            UPDATE registros SET ts_epoch = {SQL_TS_EPOCH.format(coluna='NEW.data_hora')} WHERE id = NEW.id;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_registros_ts_epoch_update
+        AFTER UPDATE OF data_hora ON registros
+        BEGIN
+            UPDATE registros SET ts_epoch = {SQL_TS_EPOCH.format(coluna='NEW.data_hora')} WHERE id = NEW.id;
+        END
+    """)
+    for nome in ('idx_registros_user_data', 'idx_registros_glicemia', 'idx_registros_insulina', 'idx_registros_dose_aplicada'):
+        conn.execute(f"DROP INDEX IF EXISTS {nome}")
+    for ddl in INDICES_REGISTROS.values():
+        conn.execute(ddl)
+
+
+# --- Rollup diário (registros_diarios) ---
+# Limites de hipo/hiperglicemia gravados nos triggers (mesmos de database_manager).
+_LIMITE_HIPO = 70
+_LIMITE_HIPER = 180
+
+def _soma(coluna):
+    return f"{coluna} = {coluna} + excluded.{coluna}"
+
+
+def _soma_anulavel(coluna):
+    # Coluna que fica NULL enquanto o dia não tem nenhuma linha do tipo (SUM em vez de TOTAL)
+    return f"{coluna} = CASE WHEN excluded.{coluna} IS NULL THEN {coluna} ELSE COALESCE({coluna}, 0) + excluded.{coluna} END"
+
+
+def _minimo(coluna):
+    return f"{coluna} = MIN(COALESCE({coluna}, excluded.{coluna}), COALESCE(excluded.{coluna}, {coluna}))"
+
+
+def _maximo(coluna):
+    return f"{coluna} = MAX(COALESCE({coluna}, excluded.{coluna}), COALESCE(excluded.{coluna}, {coluna}))"
+
+
+# Colunas do rollup: (nome, agregado de um grupo de linhas de registros (r) +
+# detalhes_refeicao (dr), valor de uma única linha NEW no trigger de INSERT,
+# combinação com o valor existente no ON CONFLICT).
+# Conjunto criado pela migração 007 (não alterar: é o que a 007 aplica num banco novo).
+_ROLLUP_007 = (
+    ('total_registros', 'COUNT(*)', '1', _soma),
+    ('glicemia_count', 'COUNT(r.valor)', 'NEW.valor IS NOT NULL', _soma),
+    ('glicemia_soma', 'TOTAL(r.valor)', 'COALESCE(NEW.valor, 0)', _soma),
+    ('glicemia_soma_quadrados', 'TOTAL(r.valor * r.valor)', 'COALESCE(NEW.valor * NEW.valor, 0)', _soma),
+    ('glicemia_min', 'MIN(r.valor)', 'NEW.valor', _minimo),
+    ('glicemia_max', 'MAX(r.valor)', 'NEW.valor', _maximo),
+    ('hipo_count', f'TOTAL(r.valor < {_LIMITE_HIPO})', f'COALESCE(NEW.valor < {_LIMITE_HIPO}, 0)', _soma),
+    ('hiper_count', f'TOTAL(r.valor > {_LIMITE_HIPER})', f'COALESCE(NEW.valor > {_LIMITE_HIPER}, 0)', _soma),
+    ('carbs_total', 'TOTAL(COALESCE(r.total_carbs, dr.carboidratos))',
+     'COALESCE(NEW.total_carbs, (SELECT carboidratos FROM detalhes_refeicao WHERE registro_id = NEW.id), 0)', _soma),
+    ('kcal_total', 'TOTAL(COALESCE(r.total_calorias, dr.calorias))',
+     'COALESCE(NEW.total_calorias, (SELECT calorias FROM detalhes_refeicao WHERE registro_id = NEW.id), 0)', _soma),
+    ('insulina_total', 'TOTAL(COALESCE(r.dose_aplicada, r.dose_insulina))',
+     'COALESCE(NEW.dose_aplicada, NEW.dose_insulina, 0)', _soma),
+)
+
+# Tipos de registro que contam como medição de glicemia nas médias do médico
+# (o mesmo filtro da consulta antiga sobre registros; deixa de fora Antes_Dormir etc.).
+_TIPOS_MEDICAO = "('Glicemia', 'Pre_Refeicao', 'Pos_Refeicao')"
+
+# Migração 013: colunas por tipo de registro. medicao_* só com as medições de
+# _TIPOS_MEDICAO; carbs/kcal_refeicao só com tipo = 'Refeição' e sem o
+# fallback de detalhes_refeicao (NULL no dia sem refeição com o valor preenchido).
+_ROLLUP = _ROLLUP_007 + (
+    ('medicao_count', f'COUNT(CASE WHEN r.tipo IN {_TIPOS_MEDICAO} THEN r.valor END)',
+     f'COALESCE(NEW.tipo IN {_TIPOS_MEDICAO} AND NEW.valor IS NOT NULL, 0)', _soma),
+    ('medicao_soma', f'TOTAL(CASE WHEN r.tipo IN {_TIPOS_MEDICAO} THEN r.valor END)',
+     f'CASE WHEN NEW.tipo IN {_TIPOS_MEDICAO} THEN COALESCE(NEW.valor, 0) ELSE 0 END', _soma),
+    ('carbs_refeicao', "SUM(CASE WHEN r.tipo = 'Refeição' THEN r.total_carbs END)",
+     "CASE WHEN NEW.tipo = 'Refeição' THEN NEW.total_carbs END", _soma_anulavel),
+    ('kcal_refeicao', "SUM(CASE WHEN r.tipo = 'Refeição' THEN r.total_calorias END)",
+     "CASE WHEN NEW.tipo = 'Refeição' THEN NEW.total_calorias END", _soma_anulavel),
+)
+
+
+def _colunas_diarias(rollup):
+    return ', '.join(['user_id', 'dia'] + [nome for nome, _, _, _ in rollup])
+
+
+def _agregados_diarios(rollup):
+    return ', '.join(agregado for _, agregado, _, _ in rollup)
+
+
+def _sql_recalcular_dia(user_id, ts, rollup=_ROLLUP):
+    """
+    SQL (para corpo de trigger) que recalcula do zero o dia que contém o instante
+    'ts' (expressão epoch) do paciente 'user_id'. Usado em UPDATE/DELETE, onde
+    min/max não podem ser desfeitos incrementalmente. Lê só as linhas do dia
+    pelo índice (user_id, ts_epoch).
+    """
+    inicio = f"(({ts}) - ({ts}) % 86400)"
+    return f"""
+            DELETE FROM registros_diarios WHERE user_id = {user_id} AND dia = date({ts}, 'unixepoch');
+            INSERT INTO registros_diarios ({_colunas_diarias(rollup)})
+            SELECT r.user_id, date({ts}, 'unixepoch'), {_agregados_diarios(rollup)}
+            FROM registros r LEFT JOIN detalhes_refeicao dr ON dr.registro_id = r.id
+            WHERE r.user_id = {user_id} AND r.ts_epoch >= {inicio} AND r.ts_epoch < {inicio} + 86400
+            GROUP BY r.user_id;"""
+
+
+def reconstruir_registros_diarios(conn, user_id=None, rollup=_ROLLUP):
+    """Recalcula registros_diarios a partir de registros (todos os pacientes ou um só)."""
+    ts = f"COALESCE(r.ts_epoch, {SQL_TS_EPOCH.format(coluna='r.data_hora')})"
+    filtro, params = ("AND r.user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    conn.execute(f"DELETE FROM registros_diarios {'WHERE user_id = ?' if user_id is not None else ''}", params)
+    conn.execute(f"""
+        INSERT INTO registros_diarios ({_colunas_diarias(rollup)})
+        SELECT r.user_id, date({ts}, 'unixepoch') AS dia_registro, {_agregados_diarios(rollup)}
+        FROM registros r LEFT JOIN detalhes_refeicao dr ON dr.registro_id = r.id
+        WHERE {ts} IS NOT NULL {filtro}
+        GROUP BY r.user_id, dia_registro
+    """, params)
+
+
+# Colunas de registros que, ao mudar, recalculam o dia no rollup.
+# ts_epoch fica fora da lista: o UPDATE interno não dispara o trigger de novo.
+_COLUNAS_UPDATE_007 = 'user_id, data_hora, valor, total_carbs, total_calorias, dose_insulina, dose_aplicada'
+_COLUNAS_UPDATE = 'user_id, data_hora, tipo, valor, total_carbs, total_calorias, dose_insulina, dose_aplicada'
+
+
+def _criar_gatilhos_registros_diarios(conn, rollup, colunas_update):
+    """
+    Triggers que mantêm registros_diarios: INSERT soma a linha nova no dia;
+    UPDATE/DELETE (e mudanças em detalhes_refeicao) recalculam o(s) dia(s)
+    afetado(s). Também mantêm registros.ts_epoch antes de cada recálculo.
+    """
+    ts_novo = SQL_TS_EPOCH.format(coluna='NEW.data_hora')
+    ts_antigo = f"COALESCE(OLD.ts_epoch, {SQL_TS_EPOCH.format(coluna='OLD.data_hora')})"
+    valores_novos = ', '.join(valor for _, _, valor, _ in rollup)
+    combinacoes = ',\n                '.join(combinar(nome) for nome, _, _, combinar in rollup)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_registros_insert
+        AFTER INSERT ON registros
+        BEGIN
+            UPDATE registros SET ts_epoch = {ts_novo} WHERE id = NEW.id;
+            INSERT INTO registros_diarios ({_colunas_diarias(rollup)})
+            SELECT NEW.user_id, date({ts_novo}, 'unixepoch'), {valores_novos}
+            WHERE {ts_novo} IS NOT NULL
+            ON CONFLICT (user_id, dia) DO UPDATE SET
+                {combinacoes};
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_registros_update
+        AFTER UPDATE OF {colunas_update} ON registros
+        BEGIN
+            UPDATE registros SET ts_epoch = {ts_novo} WHERE id = NEW.id;
+            {_sql_recalcular_dia('OLD.user_id', ts_antigo, rollup)}
+            {_sql_recalcular_dia('NEW.user_id', ts_novo, rollup)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_registros_delete
+        AFTER DELETE ON registros
+        BEGIN
+            {_sql_recalcular_dia('OLD.user_id', ts_antigo, rollup)}
+        END
+    """)
+    for evento, linha in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        usuario = f"(SELECT user_id FROM registros WHERE id = {linha}.registro_id)"
+        ts = f"(SELECT ts_epoch FROM registros WHERE id = {linha}.registro_id)"
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_detalhes_refeicao_{evento.lower()}
+            AFTER {evento} ON detalhes_refeicao
+            BEGIN
+                {_sql_recalcular_dia(usuario, ts, rollup)}
+            END
+        """)
+
+
+def _m007_registros_diarios(conn):
+    """
+    Tabela registros_diarios (um resumo por paciente e dia) mantida por triggers:
+    INSERT em registros soma incrementalmente; UPDATE/DELETE (e mudanças em
+    detalhes_refeicao) recalculam só o(s) dia(s) afetado(s). Os triggers de
+    ts_epoch da 006 são incorporados aos novos, para que ts_epoch esteja
+    sempre atualizado antes do recálculo.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS registros_diarios (
+            user_id INTEGER NOT NULL,
+            dia TEXT NOT NULL,
+            total_registros INTEGER NOT NULL DEFAULT 0,
+            glicemia_count INTEGER NOT NULL DEFAULT 0,
+            glicemia_soma REAL NOT NULL DEFAULT 0,
+            glicemia_soma_quadrados REAL NOT NULL DEFAULT 0,
+            glicemia_min REAL,
+            glicemia_max REAL,
+            hipo_count INTEGER NOT NULL DEFAULT 0,
+            hiper_count INTEGER NOT NULL DEFAULT 0,
+            carbs_total REAL NOT NULL DEFAULT 0,
+            kcal_total REAL NOT NULL DEFAULT 0,
+            insulina_total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, dia)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_registros_diarios_dia ON registros_diarios (dia)")
+
+    conn.execute("DROP TRIGGER IF EXISTS trg_registros_ts_epoch_insert")
+    conn.execute("DROP TRIGGER IF EXISTS trg_registros_ts_epoch_update")
+
+    _criar_gatilhos_registros_diarios(conn, _ROLLUP_007, _COLUNAS_UPDATE_007)
+    reconstruir_registros_diarios(conn, rollup=_ROLLUP_007)
+
+
+def _m008_versao_dados_paciente(conn):
+    """
+    Contador de versão dos dados de cada paciente, incrementado por triggers a
+    cada escrita em registros. Caches derivados (AGP, relatórios) usam a versão
+    na chave: qualquer escrita, de qualquer processo, invalida o que depende dela.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS versao_dados_paciente (
+            user_id INTEGER PRIMARY KEY,
+            versao INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    incremento = """
+            INSERT INTO versao_dados_paciente (user_id, versao) VALUES ({usuario}, 1)
+            ON CONFLICT (user_id) DO UPDATE SET versao = versao + 1;"""
+    gatilhos = (
+        ('insert', 'AFTER INSERT ON registros', incremento.format(usuario='NEW.user_id')),
+        # ts_epoch fora da lista: o ajuste interno feito pelos outros triggers não conta como nova versão
+        ('update', 'AFTER UPDATE OF user_id, data_hora, tipo, valor, observacoes, alimentos_json, '
+                   'total_calorias, total_carbs, dose_insulina, dose_aplicada, tipo_medicao ON registros',
+         incremento.format(usuario='OLD.user_id') + incremento.format(usuario='NEW.user_id')),
+        ('delete', 'AFTER DELETE ON registros', incremento.format(usuario='OLD.user_id')),
+    )
+    for evento, quando, corpo in gatilhos:
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_registros_versao_{evento}
+            {quando}
+            BEGIN{corpo}
+            END
+        """)
+
+
+
+def _m009_agenda_parametros(conn):
+    """
+    Agenda de parâmetros de Bolus por horário do dia (segmentos como nas bombas
+    de insulina). Cada linha vale de inicio_minuto (0-1439) até o início do
+    próximo segmento; campos NULL herdam os parâmetros gerais do paciente.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agenda_parametros (
+            user_id INTEGER NOT NULL,
+            inicio_minuto INTEGER NOT NULL CHECK (inicio_minuto BETWEEN 0 AND 1439),
+            ric REAL,
+            fsi REAL,
+            glicemia_alvo REAL,
+            PRIMARY KEY (user_id, inicio_minuto),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        ) WITHOUT ROWID
+    """)
+
+
+def _fts5_disponivel(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._teste_fts5 USING fts5(x)")
+        conn.execute("DROP TABLE temp._teste_fts5")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _m010_alimentos_fts(conn):
+    """
+    Índice FTS5 (external content) sobre alimentos.alimento, com o tokenizador
+    unicode61 sem acentos: "pao" encontra "Pão". Triggers mantêm o índice em
+    sincronia com a tabela. Se o SQLite não tiver FTS5, a busca continua no
+    índice em memória (busca_alimentos.py).
+    """
+    if not _fts5_disponivel(conn):
+        print("Aviso: SQLite sem FTS5; alimentos_fts não foi criado.")
+        return
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS alimentos_fts USING fts5(
+            alimento,
+            content='alimentos',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    inserir = "INSERT INTO alimentos_fts (rowid, alimento) VALUES (NEW.id, NEW.alimento);"
+    remover = "INSERT INTO alimentos_fts (alimentos_fts, rowid, alimento) VALUES ('delete', OLD.id, OLD.alimento);"
+    gatilhos = (
+        ('insert', 'AFTER INSERT ON alimentos', inserir),
+        ('delete', 'AFTER DELETE ON alimentos', remover),
+        ('update', 'AFTER UPDATE OF id, alimento ON alimentos', remover + inserir),
+    )
+    for evento, quando, corpo in gatilhos:
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_alimentos_fts_{evento}
+            {quando}
+            BEGIN {corpo} END
+        """)
+    conn.execute("INSERT INTO alimentos_fts (alimentos_fts) VALUES ('rebuild')")
+
+# --- Valores nutricionais pré-calculados ---
+# kcal/carbs de alimentos são os valores base (por 100 g); peso é o da medida caseira.
+_SQL_POR_GRAMA = "COALESCE({tabela}.{coluna}, 0) / 100.0"
+_SQL_POR_PESO = "COALESCE({tabela}.{coluna}, 0) * {peso} / 100.0"  # mesma conta (e arredondamento) de antes
+_SQL_PESO_PORCAO = "COALESCE({tabela}.peso, 100)"
+
+
+def _sql_derivados_alimento(tabela):
+    """SET dos valores derivados de uma linha de alimentos (NEW nos triggers, alimentos no backfill)."""
+    peso = _SQL_PESO_PORCAO.format(tabela=tabela)
+    return ", ".join(
+        f"{coluna}_por_grama = {_SQL_POR_GRAMA.format(tabela=tabela, coluna=coluna)}, "
+        f"{coluna}_porcao = {_SQL_POR_PESO.format(tabela=tabela, coluna=coluna, peso=peso)}"
+        for coluna in ('carbs', 'kcal')
+    )
+
+
+def _m011_nutricao_pre_calculada(conn):
+    """
+    Valores por grama e por porção gravados em alimentos, e a tabela
+    medidas_caseiras (várias medidas por alimento; a 'principal' espelha
+    alimentos.medida_caseira/peso). Tudo é derivado por triggers no momento em
+    que o alimento é importado ou editado, e a busca só lê os valores prontos.
+    """
+    _adicionar_colunas(conn, 'alimentos', [
+        ('carbs_por_grama', 'REAL'),
+        ('kcal_por_grama', 'REAL'),
+        ('carbs_porcao', 'REAL'),
+        ('kcal_porcao', 'REAL'),
+    ])
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS medidas_caseiras (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            alimento_id INTEGER NOT NULL,
+            descricao TEXT NOT NULL,
+            peso REAL NOT NULL,
+            carbs REAL NOT NULL,
+            kcal REAL NOT NULL,
+            principal INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (alimento_id) REFERENCES alimentos (id) ON DELETE CASCADE
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medidas_caseiras_alimento ON medidas_caseiras (alimento_id)")
+
+    peso_new = _SQL_PESO_PORCAO.format(tabela='NEW')
+
+    def por_peso(coluna, peso):
+        return _SQL_POR_PESO.format(tabela='NEW', coluna=coluna, peso=peso)
+
+    inserir_principal = f"""
+        INSERT INTO medidas_caseiras (alimento_id, descricao, peso, carbs, kcal, principal)
+        VALUES (NEW.id, COALESCE(NEW.medida_caseira, ''), {peso_new},
+                {por_peso('carbs', peso_new)}, {por_peso('kcal', peso_new)}, 1);
+    """
+    gatilhos = (
+        ('insert', 'AFTER INSERT ON alimentos', f"""
+            UPDATE alimentos SET {_sql_derivados_alimento('NEW')} WHERE id = NEW.id;
+            {inserir_principal}
+        """),
+        # Só as colunas base: o UPDATE dos derivados não dispara o próprio trigger
+        ('update', 'AFTER UPDATE OF medida_caseira, peso, kcal, carbs ON alimentos', f"""
+            UPDATE alimentos SET {_sql_derivados_alimento('NEW')} WHERE id = NEW.id;
+            UPDATE medidas_caseiras
+               SET descricao = COALESCE(NEW.medida_caseira, ''), peso = {peso_new}
+             WHERE alimento_id = NEW.id AND principal = 1;
+            UPDATE medidas_caseiras
+               SET carbs = {por_peso('carbs', 'peso')}, kcal = {por_peso('kcal', 'peso')}
+             WHERE alimento_id = NEW.id;
+        """),
+        # As conexões do DatabaseManager ativam foreign_keys, e aí o ON DELETE CASCADE
+        # já apaga as medidas; o trigger cobre scripts que abrem o banco com sqlite3
+        # direto, sem o PRAGMA (nesse caso o cascade não roda)
+        ('delete', 'AFTER DELETE ON alimentos', """
+            DELETE FROM medidas_caseiras WHERE alimento_id = OLD.id;
+        """),
+    )
+    for evento, quando, corpo in gatilhos:
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_alimentos_nutricao_{evento}
+            {quando}
+            BEGIN {corpo} END
+        """)
+
+    # Backfill das linhas existentes
+    conn.execute(f"UPDATE alimentos SET {_sql_derivados_alimento('alimentos')}")
+    conn.execute(f"""
+        INSERT INTO medidas_caseiras (alimento_id, descricao, peso, carbs, kcal, principal)
+        SELECT id, COALESCE(medida_caseira, ''), {_SQL_PESO_PORCAO.format(tabela='alimentos')},
+               carbs_porcao, kcal_porcao, 1
+          FROM alimentos
+         WHERE NOT EXISTS (
+               SELECT 1 FROM medidas_caseiras m WHERE m.alimento_id = alimentos.id AND m.principal = 1
+         )
+    """)
+
+
+# Tabelas (além de registros, migração 008) que mudam a versão dos dados do
+# paciente: (tabela, coluna com o id do paciente). Parâmetros de Bolus ficam em
+# users, agenda_parametros e, quando existir, parametros_clinicos.
+_TABELAS_VERSAO_PACIENTE = (
+    ('fichas_medicas', 'paciente_id'),
+    ('agendamentos', 'paciente_id'),
+    ('exames_laboratoriais', 'paciente_id'),
+    ('agenda_parametros', 'user_id'),
+    ('parametros_clinicos', 'paciente_id'),
+    ('users', 'id'),
+)
+
+
+def _m012_versao_dados_fichas_parametros(conn):
+    """
+    A versão dos dados do paciente (versao_dados_paciente) passa a mudar também
+    com a ficha médica, agendamentos, exames e parâmetros/cadastro, para que os
+    fragmentos de HTML em cache (cache_fragmentos.py) sejam refeitos.
+    """
+    incremento = """
+            INSERT INTO versao_dados_paciente (user_id, versao) VALUES ({usuario}, 1)
+            ON CONFLICT (user_id) DO UPDATE SET versao = versao + 1;"""
+    existentes = {linha[0] for linha in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for tabela, coluna in _TABELAS_VERSAO_PACIENTE:
+        if tabela not in existentes:
+            continue
+        gatilhos = (
+            ('insert', f'AFTER INSERT ON {tabela}', incremento.format(usuario=f'NEW.{coluna}')),
+            ('update', f'AFTER UPDATE ON {tabela}',
+             incremento.format(usuario=f'OLD.{coluna}') + incremento.format(usuario=f'NEW.{coluna}')),
+            ('delete', f'AFTER DELETE ON {tabela}', incremento.format(usuario=f'OLD.{coluna}')),
+        )
+        for evento, quando, corpo in gatilhos:
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{tabela}_versao_{evento}
+                {quando}
+                BEGIN{corpo}
+                END
+            """)
+
+
+def _m013_rollup_por_tipo(conn):
+    """
+    Colunas por tipo de registro em registros_diarios: medicao_count/medicao_soma
+    (só tipos de _TIPOS_MEDICAO, para a média de glicemia do médico) e
+    carbs/kcal_refeicao (só tipo = 'Refeição', para os gráficos diários).
+    Os triggers da 007 são recriados com as colunas novas (e com 'tipo' na
+    lista do UPDATE), e o rollup é reconstruído.
+    """
+    _adicionar_colunas(conn, 'registros_diarios', [
+        ('medicao_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('medicao_soma', 'REAL NOT NULL DEFAULT 0'),
+        ('carbs_refeicao', 'REAL'),
+        ('kcal_refeicao', 'REAL'),
+    ])
+    for gatilho in ('trg_registros_insert', 'trg_registros_update', 'trg_registros_delete',
+                    'trg_detalhes_refeicao_insert', 'trg_detalhes_refeicao_update', 'trg_detalhes_refeicao_delete'):
+        conn.execute(f"DROP TRIGGER IF EXISTS {gatilho}")
+    _criar_gatilhos_registros_diarios(conn, _ROLLUP, _COLUNAS_UPDATE)
+    reconstruir_registros_diarios(conn)
+
+# Lista ORDENADA de migrações: (versão, descrição, função). Nunca renumere nem
+# altere um passo já publicado; adicione um novo passo no final.
+MIGRACOES = [
+    (1, 'Tabelas base', _m001_tabelas_base),
+    (2, 'Colunas de cadastro e parâmetros em users', _m002_colunas_users),
+    (3, 'Colunas de refeição/insulina em registros e de fichas_medicas', _m003_colunas_registros_fichas),
+    (4, 'Índices de série temporal em registros', _m004_indices_registros),
+    (5, 'Importação do data.json legado', _m005_importar_json_legado),
+    (6, 'Coluna ts_epoch em registros (triggers e índices)', _m006_ts_epoch),
+    (7, 'Rollup diário registros_diarios (triggers incrementais)', _m007_registros_diarios),
+    (8, 'Versão dos dados por paciente (invalidação de caches)', _m008_versao_dados_paciente),
+    (9, 'Agenda de parâmetros por horário (agenda_parametros)', _m009_agenda_parametros),
+    (10, 'Busca de alimentos FTS5 (alimentos_fts)', _m010_alimentos_fts),
+    (11, 'Valores nutricionais pré-calculados e medidas_caseiras', _m011_nutricao_pre_calculada),
+    (12, 'Versão dos dados por ficha, agenda, exames e parâmetros', _m012_versao_dados_fichas_parametros),
+    (13, 'Rollup diário por tipo de registro (medições de glicemia e refeições)', _m013_rollup_por_tipo),
+]
+
+VERSAO_ESQUEMA = MIGRACOES[-1][0]
+
+
+def versao_atual(conn):
+    """Versão do esquema registrada no banco (0 se nunca migrado). Não executa DDL."""
+    existe = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if not existe:
+        return 0
+    versao = conn.execute("SELECT MAX(versao) FROM schema_version").fetchone()[0]
+    return versao or 0
+
+
+class EsquemaDesatualizado(RuntimeError):
+    """O banco está numa versão de esquema anterior à que o código espera."""
+
+
+def exigir_esquema_atual(conn):
+    """Retorna a versão do banco; levanta EsquemaDesatualizado se houver migrações pendentes."""
+    versao = versao_atual(conn)
+    if versao < VERSAO_ESQUEMA:
+        raise EsquemaDesatualizado(
+            f"Esquema do banco na versão {versao}, o código espera a versão {VERSAO_ESQUEMA}. "
+            f"Execute 'python migracoes.py' para aplicar as migrações pendentes."
+        )
+    return versao
+
+
+def preencher_ts_epoch(conn, tamanho_lote=5000):
+    """
+    Backfill de registros.ts_epoch para linhas antigas (ts_epoch IS NULL).
+    Percorre a tabela por faixas de id e faz commit a cada lote, para não
+    segurar o lock de escrita por muito tempo. Pode ser interrompido e
+    executado de novo. Retorna o número de linhas preenchidas.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    maior_id = conn.execute("SELECT MAX(id) FROM registros").fetchone()[0] or 0
+    preenchidas = 0
+    inicio = 0
+    while inicio < maior_id:
+        fim = inicio + tamanho_lote
+        cursor = conn.execute(f"""
+            UPDATE registros SET ts_epoch = {SQL_TS_EPOCH.format(coluna='data_hora')}
+            WHERE id > ? AND id <= ? AND ts_epoch IS NULL AND data_hora IS NOT NULL
+        """, (inicio, fim))
+        conn.commit()
+        preenchidas += max(cursor.rowcount, 0)
+        inicio = fim
+    return preenchidas
+
+
+def aplicar_migracoes(conn):
+    """
+    Aplica, em ordem, as migrações com versão maior que a do banco.
+    Cada passo roda em sua própria transação BEGIN IMMEDIATE, então vários
+    processos executando o comando ao mesmo tempo se serializam e a versão é
+    relida depois de obter o lock (um passo nunca roda duas vezes).
+
+    Retorna a lista de versões aplicadas.
+    """
+    if conn.in_transaction:
+        conn.commit()
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT NOT NULL,
+            aplicada_em TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+
+    aplicadas = []
+    for versao, descricao, passo in MIGRACOES:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if versao <= versao_atual(conn):
+                conn.rollback()
+                continue
+            passo(conn)
+            conn.execute(
+                "INSERT INTO schema_version (versao, descricao, aplicada_em) VALUES (?, ?, ?)",
+                (versao, descricao, datetime.now().isoformat(timespec='seconds'))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Migração {versao:03d} aplicada: {descricao}")
+        aplicadas.append(versao)
+    return aplicadas
+
+
+if __name__ == '__main__':
+    from database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description='Migrações do esquema do banco de dados.')
+    parser.add_argument('--db', default='glicemia.db', help='Arquivo do banco (relativo a data/ ou caminho absoluto).')
+    parser.add_argument('--status', action='store_true', help='Apenas mostra a versão atual e as pendentes.')
+    parser.add_argument('--lote', type=int, default=5000, help='Tamanho do lote do backfill de ts_epoch.')
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db, exigir_esquema=False)
+
+    if args.status:
+        with db_manager.get_db_connection() as conn:
+            atual = versao_atual(conn)
+        print(f"Versão do esquema: {atual} (código espera {VERSAO_ESQUEMA})")
+        for versao, descricao, _ in MIGRACOES:
+            if versao > atual:
+                print(f"  pendente: {versao:03d} - {descricao}")
+    else:
+        # migrar() também faz o backfill (idempotente) de ts_epoch das linhas antigas
+        aplicadas = db_manager.migrar(args.lote)
+        if not aplicadas:
+            print(f"Nada a fazer: esquema já está na versão {VERSAO_ESQUEMA}.")
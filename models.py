@@ -1,64 +1,121 @@
 # models.py
 
-from flask_login import UserMixin
-from datetime import datetime
+from functools import lru_cache
 
-class User(UserMixin):
+# Papéis como bits: cada usuário tem um bit, e as checagens de permissão
+# comparam com uma máscara (um único AND inteiro).
+PAPEL_ADMIN = 1 << 0
+PAPEL_MEDICO = 1 << 1
+PAPEL_SECRETARIO = 1 << 2
+PAPEL_PACIENTE = 1 << 3
+PAPEL_CUIDADOR = 1 << 4
+PAPEL_USER = 1 << 5  # papel genérico antigo, tratado como paciente em is_paciente
+
+PAPEIS = {
+    'admin': PAPEL_ADMIN,
+    'medico': PAPEL_MEDICO,
+    'secretario': PAPEL_SECRETARIO,
+    'paciente': PAPEL_PACIENTE,
+    'cuidador': PAPEL_CUIDADOR,
+    'user': PAPEL_USER,
+}
+
+# Máscaras usadas pelas propriedades e pelos decoradores de app.py
+MASCARA_MEDICO = PAPEL_MEDICO | PAPEL_ADMIN  # admin tem todas as permissões de médico
+MASCARA_GESTAO = PAPEL_ADMIN | PAPEL_SECRETARIO | PAPEL_MEDICO
+MASCARA_PACIENTE = PAPEL_PACIENTE | PAPEL_USER
+
+
+@lru_cache(maxsize=None)
+def normalizar_papel(role):
+    """(role em minúsculas, bit do papel); calculado uma vez por valor de role."""
+    role = (role or 'user').lower()
+    return role, PAPEIS.get(role, 0)
+
+
+class User:
     """
     Modelo de Usuário para integração com Flask-Login e armazenamento de dados.
-    Contém os dados básicos e as propriedades de checagem de papel (role).
+    Contém os dados básicos e o papel (role) já convertido em bit ('papel'),
+    para que as checagens de permissão sejam um AND com uma das máscaras.
+
+    Usa __slots__ (sem __dict__ por instância) e implementa diretamente a
+    interface do Flask-Login (is_authenticated, is_active, is_anonymous, get_id).
     """
-    def __init__(self, id, username, password_hash, role='user', email=None, 
-                 razao_ic=1.0, fator_sensibilidade=1.0, data_nascimento=None, 
-                 sexo=None, meta_glicemia=None, 
-                 # NOVOS CAMPOS ADICIONADOS AQUI:
-                 nome_completo=None, telefone=None, documento=None, 
+
+    __slots__ = (
+        'id', 'username', 'password_hash', 'role', 'papel', 'email',
+        'razao_ic', 'fator_sensibilidade', 'data_nascimento', 'sexo', 'meta_glicemia',
+        'nome_completo', 'telefone', 'documento', 'crm', 'cns', 'especialidade',
+    )
+
+    # Interface do Flask-Login: todo User carregado é um usuário ativo e autenticado
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, username, password_hash, role='user', email=None,
+                 razao_ic=1.0, fator_sensibilidade=1.0, data_nascimento=None,
+                 sexo=None, meta_glicemia=None,
+                 nome_completo=None, telefone=None, documento=None,
                  crm=None, cns=None, especialidade=None):
-        
+
         self.id = id
         self.username = username
         self.password_hash = password_hash
-        # Armazena a role em minúsculas para consistência em toda a aplicação
-        self.role = role.lower() 
+        # role em minúsculas para consistência em toda a aplicação, e o bit correspondente
+        self.role, self.papel = normalizar_papel(role)
         self.email = email
         self.razao_ic = razao_ic
         self.fator_sensibilidade = fator_sensibilidade
         self.data_nascimento = data_nascimento
         self.sexo = sexo
-        self.meta_glicemia = meta_glicemia 
-        
-        # NOVAS ATRIBUIÇÕES:
+        self.meta_glicemia = meta_glicemia
         self.nome_completo = nome_completo
         self.telefone = telefone
         self.documento = documento
         self.crm = crm
         self.cns = cns
         self.especialidade = especialidade
-        
+
     def get_id(self):
         # Implementação obrigatória para Flask-Login
         return str(self.id)
-        
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        igual = self.__eq__(other)
+        return igual if igual is NotImplemented else not igual
+
+    __hash__ = object.__hash__
+
+    def tem_papel(self, mascara):
+        """True se o papel do usuário está na máscara (ex.: MASCARA_GESTAO)."""
+        return bool(self.papel & mascara)
+
     @property
     def is_medico(self):
-        # CORREÇÃO AQUI: Inclui o 'admin' para que ele tenha todas as permissões de médico.
-        return self.role in ['medico', 'admin']
+        return bool(self.papel & MASCARA_MEDICO)
 
     @property
     def is_admin(self):
-        return self.role == 'admin'
+        return bool(self.papel & PAPEL_ADMIN)
 
     @property
     def is_secretario(self):
-        return self.role == 'secretario'
+        return bool(self.papel & PAPEL_SECRETARIO)
 
     @property
     def is_paciente(self):
         # Mantendo 'user' por compatibilidade
-        return self.role == 'paciente' or self.role == 'user' 
+        return bool(self.papel & MASCARA_PACIENTE)
 
     @property
     def is_cuidador(self):
-        return self.role == 'cuidador'
+        return bool(self.papel & PAPEL_CUIDADOR)
 
-# Fim de models.py
\ No newline at end of file
+# Fim de models.py
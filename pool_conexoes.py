@@ -0,0 +1,240 @@
+# pool_conexoes.py
+
+import sqlite3
+import threading
+import time
+
+
+class ConexaoPool:
+    """
+    Handle devolvido por DatabaseManager.get_db_connection().
+    Repassa tudo para a sqlite3.Connection real, mas close() e o fim de um
+    bloco 'with' devolvem a conexão ao pool em vez de fechá-la.
+
+    Só o handle externo (o primeiro checkout da thread) controla a transação:
+    o fim do seu bloco 'with' faz commit ou rollback. Handles aninhados
+    compartilham a mesma conexão e, ao sair do 'with', apenas a devolvem, sem
+    encerrar a transação de quem está por fora.
+    """
+    __slots__ = ('_pool', '_conn', '_liberada', '_externa')
+
+    def __init__(self, pool, conn, externa=True):
+        self._pool = pool
+        self._conn = conn
+        self._liberada = False
+        self._externa = externa
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+    # row_factory é atribuída por vários métodos do DatabaseManager
+    @property
+    def row_factory(self):
+        return self._conn.row_factory
+
+    @row_factory.setter
+    def row_factory(self, valor):
+        self._conn.row_factory = valor
+
+    def __enter__(self):
+        if self._externa:
+            self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if self._externa:
+                # Mantém a semântica do sqlite3: commit em sucesso, rollback em erro
+                return self._conn.__exit__(exc_type, exc_value, traceback)
+            # Nível aninhado: a transação pertence ao bloco externo
+            return False
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._liberada:
+            self._liberada = True
+            self._pool._devolver(self._conn)
+
+    def __del__(self):
+        # Garante a devolução mesmo quando o chamador esquece o close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class PoolConexoes:
+    """
+    Pool de conexões SQLite com tamanho máximo fixo.
+
+    - Reentrante por thread: chamadas aninhadas na mesma thread (ex.: um método
+      que chama outro método do DatabaseManager) reutilizam a mesma conexão,
+      e só o nível externo faz commit/rollback ao sair do 'with'.
+    - Quando a última referência da thread é liberada, a conexão volta para a
+      lista de ociosas e pode ser usada por outra thread.
+    - Conexões ociosas há mais de 'intervalo_verificacao' segundos passam por
+      um health check (SELECT 1) antes de serem entregues.
+    """
+
+    def __init__(self, fabrica, tamanho_maximo=8, timeout=30.0, intervalo_verificacao=60.0):
+        self._fabrica = fabrica
+        self.tamanho_maximo = tamanho_maximo
+        self.timeout = timeout
+        self.intervalo_verificacao = intervalo_verificacao
+
+        self._ociosas = []  # Pilha de (conexão, instante do último uso)
+        self._total = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+        # Métricas
+        self._checkouts = 0
+        self._reutilizacoes = 0
+        self._esperas = 0
+        self._tempo_espera_total = 0.0
+        self._tempo_espera_max = 0.0
+        self._reconexoes = 0
+
+    def obter(self):
+        """Retorna um ConexaoPool para a thread atual."""
+        local = self._local
+        conn = getattr(local, 'conn', None)
+
+        if conn is not None:
+            # Chamada aninhada na mesma thread: reutiliza a conexão já retirada
+            local.contador += 1
+            with self._cond:
+                self._reutilizacoes += 1
+            return ConexaoPool(self, conn, externa=False)
+
+        conn = self._retirar()
+        local.conn = conn
+        local.contador = 1
+        return ConexaoPool(self, conn)
+
+    def em_uso_nesta_thread(self):
+        """True se a thread atual já retirou uma conexão deste pool (e não devolveu)."""
+        return getattr(self._local, 'conn', None) is not None
+
+    def _retirar(self):
+        inicio = time.monotonic()
+        conn = None
+        ultimo_uso = None
+        esperou = False
+
+        with self._cond:
+            while True:
+                if self._ociosas:
+                    conn, ultimo_uso = self._ociosas.pop()
+                    break
+                if self._total < self.tamanho_maximo:
+                    # Reserva a vaga antes de abrir a conexão fora do lock
+                    self._total += 1
+                    break
+
+                restante = self.timeout - (time.monotonic() - inicio)
+                if restante <= 0:
+                    raise sqlite3.OperationalError(
+                        f"Pool de conexões esgotado ({self.tamanho_maximo} em uso) após {self.timeout:.0f}s de espera."
+                    )
+                if not esperou:
+                    esperou = True
+                    self._esperas += 1
+                self._cond.wait(restante)
+
+            espera = time.monotonic() - inicio
+            self._checkouts += 1
+            self._tempo_espera_total += espera
+            self._tempo_espera_max = max(self._tempo_espera_max, espera)
+
+        if conn is None:
+            return self._abrir()
+
+        if time.monotonic() - ultimo_uso > self.intervalo_verificacao and not self._saudavel(conn):
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            with self._cond:
+                self._reconexoes += 1
+            # A vaga da conexão descartada é reaproveitada pela nova
+            return self._abrir()
+
+        return conn
+
+    def _abrir(self):
+        try:
+            return self._fabrica()
+        except Exception:
+            # Libera a vaga reservada se a conexão não pôde ser aberta
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+    @staticmethod
+    def _saudavel(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _devolver(self, conn):
+        local = self._local
+        if getattr(local, 'conn', None) is not conn:
+            # Handle liberado fora da thread que o retirou (ex.: coletado pelo GC
+            # em outra thread). A conexão continua com a thread dona.
+            return
+
+        local.contador -= 1
+        if local.contador > 0:
+            return
+
+        local.conn = None
+        try:
+            # Não deixa transação pendente vazar para o próximo usuário da conexão
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            # Conexão quebrada: descarta e libera a vaga
+            with self._cond:
+                self._total -= 1
+                self._reconexoes += 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._ociosas.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def fechar_todas(self):
+        """Fecha as conexões ociosas (ex.: no encerramento do processo)."""
+        with self._cond:
+            ociosas, self._ociosas = self._ociosas, []
+            self._total -= len(ociosas)
+        for conn, _ in ociosas:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def estatisticas(self):
+        """Métricas do pool para diagnóstico/monitoramento."""
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                'tamanho_maximo': self.tamanho_maximo,
+                'conexoes_abertas': self._total,
+                'ociosas': len(self._ociosas),
+                'em_uso': self._total - len(self._ociosas),
+                'checkouts': checkouts,
+                'reutilizacoes': self._reutilizacoes,
+                'esperas': self._esperas,
+                'reconexoes': self._reconexoes,
+                'tempo_espera_total_ms': round(self._tempo_espera_total * 1000, 3),
+                'tempo_espera_medio_ms': round(self._tempo_espera_total * 1000 / checkouts, 3) if checkouts else 0.0,
+                'tempo_espera_max_ms': round(self._tempo_espera_max * 1000, 3),
+            }
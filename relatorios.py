@@ -3,6 +3,8 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user 
 # from app import db_manager # <-- REMOVA OU COMENTE ESTA LINHA
 from db_instance import db_manager # <--- NOVO: Importa a instância global
+from database_manager import datetime_para_epoch
+from datetime import datetime
 
 relatorios_bp = Blueprint('relatorios', __name__)
 relatorios_bp = Blueprint('relatorios', __name__)
@@ -26,6 +28,32 @@ def buscar_dados_registros():
     )
     return registros_glicemia, registros_refeicao
 
+# Limites de pontos devolvidos por /dados_glicemia_json
+MAX_PONTOS_PADRAO = 1000
+MAX_PONTOS_LIMITE = 5000
+MAX_PONTOS_MINIMO = 3  # LTTB mantém o primeiro e o último ponto; abaixo disso não reduz nada
+
+def _parse_data_param(valor):
+    """
+    Converte 'AAAA-MM-DD' ou 'AAAA-MM-DDTHH:MM[:SS]' em ts_epoch (None se vazio).
+    Com fuso (ex.: '2025-01-01T00:00Z'), converte para o horário local do
+    servidor, o mesmo em que data_hora é gravado.
+    """
+    if not valor:
+        return None
+    data = datetime.fromisoformat(valor)
+    if data.tzinfo is not None:
+        data = data.astimezone().replace(tzinfo=None)
+    return datetime_para_epoch(data)
+
+def _parse_max_pontos(valor):
+    """max_points: 0 desliga a redução; positivos ficam entre MAX_PONTOS_MINIMO e MAX_PONTOS_LIMITE."""
+    if valor < 0:
+        raise ValueError(valor)
+    if valor == 0:
+        return 0
+    return min(max(valor, MAX_PONTOS_MINIMO), MAX_PONTOS_LIMITE)
+
 # --------------------------------------------------------------------------
 # --- ROTAS DE RELATÓRIO ---
 # --------------------------------------------------------------------------
@@ -33,13 +61,31 @@ def buscar_dados_registros():
 @relatorios_bp.route('/dados_glicemia_json')
 @login_required
 def dados_glicemia_json():
-    """Endpoint API: Retorna dados de glicemia (mg/dL) para gráfico de linha."""
+    """
+    Endpoint API: Retorna dados de glicemia (mg/dL) para gráfico de linha.
+    Parâmetros opcionais: start e end (AAAA-MM-DD ou AAAA-MM-DDTHH:MM; end é
+    exclusivo; com fuso, convertidas para o horário local) e max_points
+    (padrão 1000, entre 3 e 5000; 0 = sem redução). Séries maiores que
+    max_points são reduzidas no servidor com LTTB.
+    """
     if not verificar_permissao_relatorio():
         return jsonify({'error': 'Acesso negado'}), 403
 
+    try:
+        inicio_ts = _parse_data_param(request.args.get('start'))
+        fim_ts = _parse_data_param(request.args.get('end'))
+    except (ValueError, TypeError, OverflowError):
+        return jsonify({'error': 'Datas inválidas. Use AAAA-MM-DD ou AAAA-MM-DDTHH:MM.'}), 400
+    try:
+        max_pontos = _parse_max_pontos(request.args.get('max_points', MAX_PONTOS_PADRAO, type=int))
+    except ValueError:
+        return jsonify({'error': 'max_points inválido. Use 0 (sem redução) ou um número positivo.'}), 400
+
     try:
         # Chama a função otimizada do DB Manager
-        dados_brutos = db_manager.obter_dados_glicemia_para_grafico(current_user.id)
+        dados_brutos = db_manager.obter_dados_glicemia_para_grafico(
+            current_user.id, inicio_ts=inicio_ts, fim_ts=fim_ts, max_pontos=max_pontos
+        )
         
         labels = [d['data_hora'] for d in dados_brutos]
         data_valores = [d['valor'] for d in dados_brutos]
@@ -53,6 +99,33 @@ def dados_glicemia_json():
         return jsonify({'error': 'Erro no servidor ao buscar dados.'}), 500
 
 
+@relatorios_bp.route('/dados_agp_json')
+@login_required
+def dados_agp_json():
+    """
+    Endpoint API: Perfil ambulatorial de glicose (AGP) calculado no servidor.
+    Parâmetros: dias (padrão 14, máx. 365) e, para médicos, paciente_id.
+    Retorna só as curvas de percentis por faixa de horário (compacto).
+    """
+    if not verificar_permissao_relatorio():
+        return jsonify({'error': 'Acesso negado'}), 403
+
+    paciente_id = current_user.id
+    paciente_param = request.args.get('paciente_id', type=int)
+    if paciente_param and paciente_param != current_user.id:
+        if not (current_user.is_medico and db_manager.medico_tem_acesso_a_paciente(current_user.id, paciente_param)):
+            return jsonify({'error': 'Acesso negado'}), 403
+        paciente_id = paciente_param
+
+    dias = min(max(request.args.get('dias', 14, type=int), 1), 365)
+
+    try:
+        return jsonify(db_manager.obter_agp(paciente_id, dias=dias))
+    except Exception as e:
+        print(f"Erro ao calcular AGP: {e}")
+        return jsonify({'error': 'Erro no servidor ao calcular o AGP.'}), 500
+
+
 @relatorios_bp.route('/dados_carbs_diarios_json')
 @login_required
 def dados_carbs_diarios_json():
@@ -3,8 +3,12 @@
 from datetime import datetime
 import math 
 
-from datetime import datetime, timedelta 
 # Garanta que o 'datetime' e 'timedelta' estão importados, se você os usa.
+from database_manager import datetime_para_epoch, epoch_para_datetime
+from agenda_parametros import AgendaParametros, resolver_agendas_lote
+from insulina_ativa import CurvaInsulina, obter_curva, insulina_ativa, insulina_ativa_lote, serie_insulina_ativa
+
+import numpy as np
 
 def formatar_registros_para_exibicao(registros_brutos):
     """
@@ -19,8 +23,11 @@ def formatar_registros_para_exibicao(registros_brutos):
         reg = dict(registro_row) 
         
         # --- 1. CONVERSÃO DE DATA E HORA ---
+        # Caminho rápido: ts_epoch (inteiro canônico) dispensa o parse do texto
         data_hora_str = reg.get('data_hora')
-        if data_hora_str and isinstance(data_hora_str, str):
+        if reg.get('ts_epoch') is not None:
+            reg['data_hora'] = epoch_para_datetime(reg['ts_epoch'])
+        elif data_hora_str and isinstance(data_hora_str, str):
             try:
                 # Tentativa de converter formatos comuns ('T' ou ' ')
                 if 'T' in data_hora_str:
@@ -63,51 +70,54 @@ def formatar_registros_para_exibicao(registros_brutos):
     return registros_formatados
 
 class BolusService:
-    # Duração de Ação Máxima da insulina (4h para ultrarrápida é um bom padrão)
-    DOA_MAX_HORAS = 4.0 
+    # Curva padrão da Insulina Ativa: linear em 4h (ver insulina_ativa.CURVAS)
+    CURVA_PADRAO = 'linear'
     
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, curva=None):
         self.db = db_manager 
+        # Aceita o nome de uma curva registrada ou uma CurvaInsulina pronta
+        self.curva = curva if isinstance(curva, CurvaInsulina) else obter_curva(curva or self.CURVA_PADRAO)
+
+    @property
+    def DOA_MAX_HORAS(self):
+        # Duração de Ação Máxima da insulina, derivada da curva em uso
+        return self.curva.duracao_horas
 
     # --- RIC POR HORÁRIO ---
-    def obter_ric_por_horario(self, parametros):
-        HORARIO_MANHA = 6
-        HORARIO_ALMOCO = 12
-        HORARIO_JANTAR = 18
-        hora_atual = datetime.now().hour
-        
-        if HORARIO_MANHA <= hora_atual < HORARIO_ALMOCO:
-            return parametros.get('ric_manha')
-        elif HORARIO_ALMOCO <= hora_atual < HORARIO_JANTAR:
-            return parametros.get('ric_almoco')
-        else:
-            return parametros.get('ric_jantar')
+    def obter_ric_por_horario(self, parametros, momento=None):
+        # Turnos fixos (6h/12h/18h) a partir do dicionário de parâmetros
+        return AgendaParametros.de_parametros(parametros).parametros_em(momento)['ric']
 
     # --- FSI POR HORÁRIO ---
-    def obter_fsi_por_horario(self, parametros):
-        HORARIO_MANHA = 6
-        HORARIO_ALMOCO = 12
-        HORARIO_JANTAR = 18
-        hora_atual = datetime.now().hour
-        
-        if HORARIO_MANHA <= hora_atual < HORARIO_ALMOCO:
-            return parametros.get('fsi_manha')
-        elif HORARIO_ALMOCO <= hora_atual < HORARIO_JANTAR:
-            return parametros.get('fsi_almoco')
-        else:
-            return parametros.get('fsi_jantar')
+    def obter_fsi_por_horario(self, parametros, momento=None):
+        return AgendaParametros.de_parametros(parametros).parametros_em(momento)['fsi']
 
     # --- MÉTODO PRINCIPAL ---
-    def calcular_bolus_total(self, gc_atual, carboidratos, paciente_id): 
-        parametros = self.db.obter_parametros_clinicos(paciente_id)
+    def calcular_bolus_total(self, gc_atual, carboidratos, paciente_id, momento=None): 
+        """
+        Sugestão de Bolus. 'momento' (datetime/ts_epoch, padrão agora) escolhe o
+        segmento da agenda de parâmetros e o instante da Insulina Ativa.
+        """
+        agenda = self.db.obter_agenda_parametros(paciente_id)
         
-        if not parametros or not parametros.get('glicemia_alvo'):
+        if not agenda:
             return None, "Parâmetros clínicos incompletos ou ausentes."
 
-        glicemia_alvo = parametros['glicemia_alvo']
-        fsi = self.obter_fsi_por_horario(parametros) or 50.0 # Valor padrão se for None
-        ric = self.obter_ric_por_horario(parametros) or 10.0 # Valor padrão se for None
+        vigentes = agenda.parametros_em(momento)
         
+        # CÁLCULO DA INSULINA ATIVA (IA)
+        ia_ativa = self.calcular_insulina_ativa(paciente_id, momento)
+
+        return self.compor_bolus(
+            gc_atual, carboidratos, vigentes['ric'], vigentes['fsi'], vigentes['glicemia_alvo'], ia_ativa
+        )
+
+    @staticmethod
+    def compor_bolus(gc_atual, carboidratos, ric, fsi, glicemia_alvo, ia_ativa):
+        """
+        Fórmula do Bolus com os parâmetros e a IA já resolvidos (sem acesso ao
+        banco; usada também pelo back-test). Retorna (resultado, erro).
+        """
         if fsi <= 0:
             return None, "FSI inválido (zero ou negativo)."
         if ric <= 0:
@@ -121,9 +131,6 @@ class BolusService:
         bolus_correcao_bruto = max(0, diferenca_glicemia / fsi) # Garante que a correção não é negativa
         
         bolus_bruto = bolus_nutricional + bolus_correcao_bruto
-        
-        # CÁLCULO DA INSULINA ATIVA (IA)
-        ia_ativa = self.calcular_insulina_ativa(paciente_id)
 
         # Bolus Final
         bolus_final = bolus_bruto - ia_ativa
@@ -142,62 +149,145 @@ class BolusService:
             'ric_usado': ric
         }, None
 
+    # --- CÁLCULO EM LOTE ---
+    def calcular_bolus_lote(self, cenarios):
+        """
+        Calcula várias sugestões de Bolus de uma vez (auditorias da clínica,
+        simulação de ajustes de RIC/FSI).
+
+        cenarios: lista de (paciente_id, gc_atual, carboidratos, momento), onde
+        momento é datetime, ts_epoch ou None (agora). A IA considera as doses
+        registradas até aquele momento.
+
+        Parâmetros e doses saem de duas consultas para todos os pacientes; o
+        cálculo é vetorizado. Retorna uma lista, na ordem de entrada, de tuplas
+        (resultado, erro) no mesmo formato de calcular_bolus_total.
+        """
+        if not cenarios:
+            return []
+
+        agora_ts = datetime_para_epoch(datetime.now())
+        paciente_ids = [c[0] for c in cenarios]
+        gc = np.array([c[1] for c in cenarios], dtype=np.float64)
+        carbs = np.array([c[2] for c in cenarios], dtype=np.float64)
+        ts = np.array([
+            agora_ts if momento is None
+            else datetime_para_epoch(momento) if isinstance(momento, datetime)
+            else int(momento)
+            for *_, momento in cenarios
+        ], dtype=np.int64)
+
+        # 1. Agendas de parâmetros de todos os pacientes (consultas em lote)
+        agendas = self.db.obter_agendas_parametros_lote(paciente_ids)
+        # Índices de grupo na mesma ordem das doses (ORDER BY user_id, ts_epoch)
+        ids_unicos = sorted(agendas)
+        grupo_por_id = {pid: i for i, pid in enumerate(ids_unicos)}
+        grupo = np.array([grupo_por_id.get(pid, -1) for pid in paciente_ids], dtype=np.int64)
+        com_parametros = grupo >= 0
+
+        erro_parametros = (None, "Parâmetros clínicos incompletos ou ausentes.")
+        if not ids_unicos:
+            return [erro_parametros] * len(cenarios)
+
+        # Segmento vigente de cada cenário no horário do próprio cenário (busca binária)
+        ric, fsi, alvo = resolver_agendas_lote(
+            [agendas[pid] for pid in ids_unicos], np.where(com_parametros, grupo, 0), ts
+        )
+
+        # 2. Doses de todos os pacientes na janela total (uma consulta) e IA vetorizada
+        ia = np.zeros(len(cenarios))
+        duracao_s = self.curva.duracao_minutos * 60
+        doses = self.db.buscar_doses_insulina_lote(ids_unicos, ts.min() - duracao_s, ts.max())
+        if doses:
+            dose_ids, dose_ts, dose_ui = zip(*doses)
+            dose_grupos = np.array([grupo_por_id[pid] for pid in dose_ids], dtype=np.int64)
+            ia[com_parametros] = insulina_ativa_lote(
+                self.curva, dose_grupos, dose_ts, dose_ui, grupo[com_parametros], ts[com_parametros]
+            )
+        # round() do Python, como em calcular_insulina_ativa: np.round escala por 10
+        # e arredonda diferente nos empates (0.95 -> 1.0 contra 0.9), mudando a dose
+        ia = np.array([round(float(valor), 1) for valor in ia])
+
+        # 3. Bolus (mesmas fórmulas de calcular_bolus_total)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bolus_nutricional = carbs / ric
+            bolus_correcao = np.maximum(0, (gc - alvo) / fsi)
+        bolus_total = np.maximum(0, np.round((bolus_nutricional + bolus_correcao - ia) * 2) / 2)
+
+        resultados = []
+        for i in range(len(cenarios)):
+            if not com_parametros[i]:
+                resultados.append(erro_parametros)
+            elif fsi[i] <= 0:
+                resultados.append((None, "FSI inválido (zero ou negativo)."))
+            elif ric[i] <= 0:
+                resultados.append((None, "RIC inválido (zero ou negativo)."))
+            else:
+                resultados.append(({
+                    'bolus_refeicao': round(float(bolus_nutricional[i]), 1),
+                    'bolus_correcao': round(float(bolus_correcao[i]), 1),
+                    'insulina_ativa': float(ia[i]),
+                    'bolus_total': float(bolus_total[i]),
+                    'fsi_usado': float(fsi[i]),
+                    'ric_usado': float(ric[i])
+                }, None))
+        return resultados
+
     # --- MÉTODO DE CÁLCULO DA INSULINA ATIVA CORRIGIDO ---
-    def calcular_insulina_ativa(self, user_id):
+    def calcular_insulina_ativa(self, user_id, momento=None):
         """
         Calcula a Insulina Ativa (IA) total baseada em doses recentes.
-        Usa um modelo linear simplificado.
+        Usa a curva configurada no serviço (tabela por minuto, ver insulina_ativa.py).
+        'momento' (datetime/ts_epoch) calcula a IA num instante passado; padrão agora.
         """
         
-        # 1. Obter as doses do DB
-        # O db_manager deve buscar a dose_insulina e data_hora
-        doses_recentes = self.db.buscar_doses_insulina_recentes(user_id, horas_limite=math.ceil(self.DOA_MAX_HORAS))
-        
-        ia_total = 0.0
+        # 1. Obter as doses do DB (só a janela da duração de ação)
+        if momento is None:
+            doses_recentes = self.db.buscar_doses_insulina_recentes(user_id, horas_limite=math.ceil(self.DOA_MAX_HORAS))
+            agora_ts = datetime_para_epoch(datetime.now())
+        else:
+            agora_ts = datetime_para_epoch(momento) if isinstance(momento, datetime) else int(momento)
+            doses_recentes = self.db.buscar_doses_insulina_periodo(
+                user_id, agora_ts - self.curva.duracao_minutos * 60, agora_ts
+            )
         
         if not doses_recentes:
             return 0.0
         
-        for dose in doses_recentes:
-            dose_ui = dose.get('dose_insulina', 0.0)
-            data_aplicacao_str = dose.get('data_hora')
-            
-            if dose_ui <= 0.0 or not data_aplicacao_str:
-                continue
-                
-            # 2. Conversão e Cálculo
-            try:
-                # Lógica de conversão de data/hora (copiada do seu código, mas agora identada)
-                data_aplicacao = None
-                if 'T' in data_aplicacao_str:
-                    data_aplicacao = datetime.fromisoformat(data_aplicacao_str.replace('Z', '+00:00'))
-                elif len(data_aplicacao_str) >= 19:
-                    data_aplicacao = datetime.strptime(data_aplicacao_str, '%Y-%m-%d %H:%M:%S')
-                else:
-                    data_aplicacao = datetime.strptime(data_aplicacao_str, '%Y-%m-%d %H:%M')
-
-                if not data_aplicacao:
-                    continue 
-
-                tempo_decorrido: timedelta = datetime.now() - data_aplicacao
-                
-                # Tempo decorrido em horas
-                horas_decorridas = tempo_decorrido.total_seconds() / 3600.0
-                
-                # Se passou do tempo de ação, pule.
-                if horas_decorridas >= self.DOA_MAX_HORAS:
-                    continue
-                    
-                # Modelo Linear de Insulina Ativa (Simples):
-                # IA = Dose * (DOA_MAX - horas_decorridas) / DOA_MAX
-                fator_remanescente = (self.DOA_MAX_HORAS - horas_decorridas) / self.DOA_MAX_HORAS
-                
-                ia_dose_atual = dose_ui * fator_remanescente
-                ia_total += ia_dose_atual
-                
-            except (ValueError, TypeError):
-                # Ignora doses com data/hora inválida
-                continue
+        ts_doses, doses_ui = self._doses_validas(doses_recentes)
+        
+        # 2. Cálculo: uma consulta à tabela da curva por dose
+        ia_total = insulina_ativa(self.curva, ts_doses, doses_ui, agora_ts)
 
-        # 3. Retorna o total de IA arredondado (fora do loop)
-        return round(ia_total, 1) # Arredondar para 1 casa decimal (ex: 0.5 UI)
\ No newline at end of file
+        # 3. Retorna o total de IA arredondado
+        return round(ia_total, 1) # Arredondar para 1 casa decimal (ex: 0.5 UI)
+
+    def serie_insulina_ativa(self, user_id, inicio_ts, fim_ts, passo_minutos=5):
+        """
+        Série de IA do paciente entre inicio_ts e fim_ts (ts_epoch), a cada
+        passo_minutos, calculada numa única passada vetorizada (gráficos/back-test).
+        Retorna lista de {'ts_epoch', 'insulina_ativa'}.
+        """
+        # Doses aplicadas antes do início ainda contribuem dentro da duração de ação
+        doses = self.db.buscar_doses_insulina_periodo(
+            user_id, inicio_ts - self.curva.duracao_minutos * 60, fim_ts
+        )
+        ts_doses, doses_ui = self._doses_validas(doses)
+        ts_grade, ia = serie_insulina_ativa(self.curva, ts_doses, doses_ui, inicio_ts, fim_ts, passo_minutos)
+        return [
+            {'ts_epoch': int(ts), 'insulina_ativa': round(float(valor), 2)}
+            for ts, valor in zip(ts_grade, ia)
+        ]
+
+    @staticmethod
+    def _doses_validas(doses):
+        """Separa (ts_epoch, dose) das doses positivas com horário conhecido."""
+        ts_doses, doses_ui = [], []
+        for dose in doses:
+            dose_ui = dose.get('dose_insulina') or 0.0
+            ts_aplicacao = dose.get('ts_epoch')
+            if dose_ui <= 0.0 or ts_aplicacao is None:
+                continue
+            ts_doses.append(ts_aplicacao)
+            doses_ui.append(dose_ui)
+        return ts_doses, doses_ui
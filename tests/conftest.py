@@ -0,0 +1,56 @@
+# tests/conftest.py
+"""Fixtures compartilhadas: banco SQLite temporário migrado até VERSAO_ESQUEMA."""
+
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_manager import DatabaseManager  # noqa: E402
+from migracoes import aplicar_migracoes  # noqa: E402
+
+PACIENTE_ID = 500
+
+
+def criar_banco_migrado(caminho):
+    """Cria um banco vazio em 'caminho', aplica todas as migrações e adiciona um paciente com registros."""
+    conn = sqlite3.connect(caminho)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            aplicar_migracoes(conn)
+        conn.execute(
+            "INSERT INTO users (id, username, password_hash, role, ric_manha, fator_sensibilidade, meta_glicemia) "
+            "VALUES (?, 'paciente_teste', 'x', 'paciente', 10, 50, 120)",
+            (PACIENTE_ID,)
+        )
+        agora = datetime.now().replace(microsecond=0)
+        linhas = []
+        for i in range(60):
+            data_hora = (agora - timedelta(hours=6 * i)).isoformat()
+            linhas.append((PACIENTE_ID, data_hora, 'Glicemia', 80 + i, None, None, None))
+            linhas.append((PACIENTE_ID, data_hora, 'Refeição', None, 45.0, 2.0, 3.0))
+        conn.executemany(
+            "INSERT INTO registros (user_id, data_hora, tipo, valor, total_carbs, dose_insulina, dose_aplicada) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            linhas
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope='module')
+def db(tmp_path_factory):
+    """DatabaseManager sobre um banco temporário migrado (um por módulo de teste)."""
+    caminho = str(tmp_path_factory.mktemp('banco') / 'teste.db')
+    criar_banco_migrado(caminho)
+    db = DatabaseManager(caminho)
+    yield db
+    db.auditoria.encerrar()
+    db.pool.fechar_todas()
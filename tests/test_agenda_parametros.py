@@ -0,0 +1,93 @@
+# tests/test_agenda_parametros.py
+"""Agenda de parâmetros: segmento vigente por minuto do dia, individual e em lote."""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from agenda_parametros import AgendaParametros, minuto_do_dia, resolver_agendas_lote
+
+DIA = 19_700 * 86400        # meia-noite de um dia qualquer em ts_epoch (hora de parede)
+
+PARAMETROS = {
+    'glicemia_alvo': 110.0,
+    'ric_manha': 8.0, 'ric_almoco': 12.0, 'ric_jantar': 15.0,
+    'fsi_manha': 40.0, 'fsi_almoco': 45.0, 'fsi_jantar': 60.0,
+}
+
+
+def _ts(hora, minuto=0):
+    return DIA + (hora * 60 + minuto) * 60
+
+
+def test_madrugada_continua_o_ultimo_segmento_sem_inicio_a_meia_noite():
+    agenda = AgendaParametros([(7 * 60, 10, 50, 100), (22 * 60, 14, 70, 130)])
+    assert agenda.inicios == (0, 7 * 60, 22 * 60)
+    for hora, minuto in ((0, 0), (3, 30), (6, 59), (22, 0), (23, 59)):
+        assert agenda.parametros_em(_ts(hora, minuto))['ric'] == 14
+    assert agenda.parametros_em(_ts(7))['ric'] == 10
+
+
+def test_limites_exatos_dos_segmentos():
+    agenda = AgendaParametros([(0, 10, 50, 100), (6 * 60 + 30, 11, 51, 101), (6 * 60 + 31, 12, 52, 102)])
+    assert agenda.parametros_em(_ts(6, 29))['ric'] == 10
+    assert agenda.parametros_em(_ts(6, 30))['ric'] == 11
+    assert agenda.parametros_em(_ts(6, 31))['ric'] == 12
+    # Segundos dentro do minuto não mudam o segmento
+    assert agenda.parametros_em(_ts(6, 30) + 59)['ric'] == 11
+    assert agenda.parametros_em(datetime(2024, 5, 1, 6, 30, 59))['ric'] == 11
+    assert minuto_do_dia(_ts(23, 59) + 59) == 1439
+
+
+def test_turnos_padrao_sem_segmentos():
+    agenda = AgendaParametros.de_parametros(PARAMETROS)
+    assert agenda.parametros_em(_ts(5, 59))['ric'] == 15      # madrugada = jantar
+    assert agenda.parametros_em(_ts(6))['ric'] == 8
+    assert agenda.parametros_em(_ts(12))['fsi'] == 45
+    assert agenda.parametros_em(_ts(18))['fsi'] == 60
+
+
+def test_campos_nulos_herdam_o_turno_padrao_do_minuto():
+    agenda = AgendaParametros.de_parametros(PARAMETROS, [
+        (0, None, None, None),
+        (7 * 60, 9.0, None, None),          # manhã: FSI e alvo do turno manhã
+        (13 * 60, None, 42.0, 95.0),        # almoço: RIC do turno almoço
+        (20 * 60, None, None, 140.0),       # jantar: RIC e FSI do turno jantar
+    ])
+    assert agenda.parametros_em(_ts(1)) == {'inicio_minuto': 0, 'ric': 15.0, 'fsi': 60.0, 'glicemia_alvo': 110.0}
+    assert agenda.parametros_em(_ts(7)) == {'inicio_minuto': 420, 'ric': 9.0, 'fsi': 40.0, 'glicemia_alvo': 110.0}
+    assert agenda.parametros_em(_ts(13)) == {'inicio_minuto': 780, 'ric': 12.0, 'fsi': 42.0, 'glicemia_alvo': 95.0}
+    assert agenda.parametros_em(_ts(20)) == {'inicio_minuto': 1200, 'ric': 15.0, 'fsi': 60.0, 'glicemia_alvo': 140.0}
+
+
+@pytest.mark.parametrize('segmentos', [
+    [],
+    [(1440, 10, 50, 100)],
+    [(0, 10, 50, 100), (0, 11, 51, 101)],
+    [(0, 10, None, 100)],
+])
+def test_agenda_invalida(segmentos):
+    with pytest.raises(ValueError):
+        AgendaParametros(segmentos)
+
+
+def test_lote_igual_a_parametros_em():
+    agendas = [
+        AgendaParametros.de_parametros(PARAMETROS),
+        AgendaParametros([(7 * 60, 10, 50, 100), (22 * 60, 14, 70, 130)]),
+        AgendaParametros([(m, 5 + m / 60, 30 + m / 30, 100 + m / 90) for m in range(0, 1440, 30)]),
+        AgendaParametros([(0, 11, 44, 105)]),
+    ]
+    rng = np.random.default_rng(14)
+    grupos = rng.integers(0, len(agendas), 2000)
+    ts = DIA + rng.integers(-5 * 86400, 5 * 86400, 2000)
+    # Inclui os inícios exatos e o minuto anterior de cada segmento
+    extras = [(g, DIA + m * 60 + d) for g, a in enumerate(agendas) for m in a.inicios for d in (-60, 0)]
+    grupos = np.concatenate([grupos, [g for g, _ in extras]])
+    ts = np.concatenate([ts, [t for _, t in extras]])
+
+    ric, fsi, alvo = resolver_agendas_lote(agendas, grupos, ts)
+    for i, (g, t) in enumerate(zip(grupos, ts)):
+        esperado = agendas[g].parametros_em(int(t))
+        assert (ric[i], fsi[i], alvo[i]) == (esperado['ric'], esperado['fsi'], esperado['glicemia_alvo'])
@@ -0,0 +1,56 @@
+# tests/test_auditoria.py
+"""Fila de auditoria: retentativas, contagem de perdas e encerramento."""
+
+import threading
+import time
+
+from auditoria import FilaAuditoria
+
+
+def test_lote_com_falha_temporaria_e_gravado_na_retentativa():
+    gravados, falhas = [], [2]
+
+    def gravar(lote):
+        if falhas[0]:
+            falhas[0] -= 1
+            raise RuntimeError('database is locked')
+        gravados.extend(lote)
+
+    fila = FilaAuditoria(gravar, intervalo_s=0.01, espera_retentativa=0.001)
+    for i in range(50):
+        fila.registrar(f'acao {i}', 'usuario')
+    fila.encerrar()
+
+    estat = fila.estatisticas()
+    assert len(gravados) == 50
+    assert estat['retentativas'] == 2
+    assert estat['perdidos'] == 0
+
+
+def test_perdas_sao_contadas_por_acao():
+    def gravar(lote):
+        raise RuntimeError('disk I/O error')
+
+    fila = FilaAuditoria(gravar, intervalo_s=0.01, tentativas=2, espera_retentativa=0.001)
+    for i in range(30):
+        fila.registrar(f'acao {i}', 'usuario')
+    fila.encerrar()
+
+    estat = fila.estatisticas()
+    assert estat['perdidos'] == 30
+    assert estat['gravados'] == 0
+
+
+def test_encerrar_com_fila_cheia_respeita_o_timeout():
+    liberar = threading.Event()
+
+    def gravar(lote):
+        liberar.wait(5)
+
+    fila = FilaAuditoria(gravar, tamanho_maximo=2, tamanho_lote=1, intervalo_s=0.01, politica='descartar')
+    for i in range(10):
+        fila.registrar(f'acao {i}', 'usuario')
+    inicio = time.monotonic()
+    fila.encerrar(timeout=0.2)
+    assert time.monotonic() - inicio < 1.0
+    liberar.set()
@@ -0,0 +1,37 @@
+# tests/test_backtest_bolus.py
+"""Back-test do Bolus: memória limitada à duração de ação da insulina."""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+from backtest_bolus import backtest_paciente
+from conftest import PACIENTE_ID, criar_banco_migrado
+from database_manager import DatabaseManager
+from insulina_ativa import obter_curva
+
+
+def test_historico_so_de_doses_nao_acumula_na_memoria(tmp_path):
+    caminho = str(tmp_path / 'doses.db')
+    criar_banco_migrado(caminho)
+    # 30 dias de correções a cada 30 min, sem nenhuma refeição
+    inicio = datetime(2024, 1, 1)
+    conn = sqlite3.connect(caminho)
+    conn.executemany(
+        "INSERT INTO registros (user_id, data_hora, tipo, dose_insulina, dose_aplicada) VALUES (?, ?, 'Insulina', 1.0, 1.0)",
+        [(PACIENTE_ID, (inicio + timedelta(minutes=30 * i)).isoformat()) for i in range(30 * 48)]
+    )
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(caminho)
+    try:
+        agenda = db.obter_agendas_parametros_lote([PACIENTE_ID])[PACIENTE_ID]
+    finally:
+        db.auditoria.encerrar()
+        db.pool.fechar_todas()
+
+    curva = obter_curva('linear')
+    _, dados, contadores = backtest_paciente(caminho, PACIENTE_ID, agenda, 'linear', tamanho_lote=100)
+
+    assert contadores['linhas'] >= 30 * 48
+    assert contadores['doses_max'] <= curva.duracao_minutos // 30 + 1
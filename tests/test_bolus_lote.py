@@ -0,0 +1,79 @@
+# tests/test_bolus_lote.py
+"""calcular_bolus_lote deve dar exatamente o mesmo que calcular_bolus_total, cenário a cenário."""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import PACIENTE_ID
+from database_manager import datetime_para_epoch
+from service_manager import BolusService
+
+OUTRO_PACIENTE = PACIENTE_ID + 1      # outros parâmetros, com agenda por horário
+FSI_NEGATIVO = PACIENTE_ID + 2
+RIC_NEGATIVO = PACIENTE_ID + 3
+INEXISTENTE = 99999
+
+
+@pytest.fixture(scope='module')
+def servico(db):
+    agora = datetime.now().replace(microsecond=0)
+    conn = sqlite3.connect(db.db_path)
+    conn.executemany(
+        "INSERT INTO users (id, username, password_hash, role, razao_ic, fator_sensibilidade, meta_glicemia) "
+        "VALUES (?, ?, 'x', 'paciente', ?, ?, ?)",
+        [
+            (OUTRO_PACIENTE, 'outro', 12, 40, 100),
+            (FSI_NEGATIVO, 'fsi_negativo', 10, -20, 120),
+            (RIC_NEGATIVO, 'ric_negativo', -5, 50, 120),
+        ]
+    )
+    conn.executemany(
+        "INSERT INTO agenda_parametros (user_id, inicio_minuto, ric, fsi, glicemia_alvo) VALUES (?, ?, ?, ?, ?)",
+        [(OUTRO_PACIENTE, 6 * 60, 8, None, None), (OUTRO_PACIENTE, 18 * 60, None, 30, 110)]
+    )
+    conn.executemany(
+        "INSERT INTO registros (user_id, data_hora, tipo, dose_insulina) VALUES (?, ?, 'Insulina', ?)",
+        [(OUTRO_PACIENTE, (agora - timedelta(minutes=37 * i)).isoformat(), 1.5 + i % 4) for i in range(40)]
+    )
+    conn.commit()
+    conn.close()
+    return BolusService(db)
+
+
+def _cenarios():
+    agora = datetime.now().replace(microsecond=0)
+    cenarios = []
+    for i in range(48):
+        momento = agora - timedelta(minutes=53 * i)
+        # momento como datetime e como ts_epoch
+        cenarios.append((PACIENTE_ID, 90 + 5 * i, 15 * (i % 5), momento))
+        cenarios.append((OUTRO_PACIENTE, 250 - 3 * i, 10 * (i % 7), datetime_para_epoch(momento)))
+    cenarios += [
+        (FSI_NEGATIVO, 200, 30, agora),
+        (RIC_NEGATIVO, 200, 30, agora),
+        (INEXISTENTE, 200, 30, agora),
+    ]
+    return cenarios
+
+
+def test_lote_igual_ao_calculo_individual(servico):
+    cenarios = _cenarios()
+    individuais = [servico.calcular_bolus_total(gc, carbs, pid, momento) for pid, gc, carbs, momento in cenarios]
+    assert servico.calcular_bolus_lote(cenarios) == individuais
+
+
+def test_lote_cobre_os_casos_de_erro_e_a_insulina_ativa(servico):
+    resultados = servico.calcular_bolus_lote(_cenarios())
+    assert resultados[-3] == (None, "FSI inválido (zero ou negativo).")
+    assert resultados[-2] == (None, "RIC inválido (zero ou negativo).")
+    assert resultados[-1] == (None, "Parâmetros clínicos incompletos ou ausentes.")
+    # Há cenários com IA > 0 e com parâmetros diferentes entre os pacientes/horários
+    validos = [r for r, erro in resultados if erro is None]
+    assert any(r['insulina_ativa'] > 0 for r in validos)
+    assert len({(r['ric_usado'], r['fsi_usado']) for r in validos}) > 2
+
+
+def test_lote_vazio(servico):
+    assert servico.calcular_bolus_lote([]) == []
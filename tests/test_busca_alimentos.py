@@ -0,0 +1,95 @@
+# tests/test_busca_alimentos.py
+"""Busca de alimentos: substrings no meio da palavra e correção de digitação."""
+
+import sqlite3
+
+import pytest
+
+from busca_alimentos import IndiceAlimentos
+from conftest import criar_banco_migrado
+from database_manager import DatabaseManager
+
+ALIMENTOS = [
+    'Arroz branco cozido',
+    'Arroz integral',
+    'Coração de galinha',
+    'Bolo zero adição de açúcar',
+    'Pão francês',
+    'Pão de queijo',
+    'Frango grelhado',
+    'Macarrão ao sugo',
+]
+
+
+def _indice():
+    return IndiceAlimentos(
+        {'id': i, 'alimento': nome, 'medida_caseira': None, 'peso': 100, 'kcal': 0, 'carbs': 0}
+        for i, nome in enumerate(ALIMENTOS, start=1)
+    )
+
+
+@pytest.mark.parametrize('termo, esperado', [
+    ('arros', 'arroz'),
+    ('macarao', 'macarrao'),
+    ('frnago grelhado', 'frango grelhado'),
+])
+def test_corrige_palavra_desconhecida(termo, esperado):
+    assert _indice().corrigir_termo(termo) == esperado
+
+
+@pytest.mark.parametrize('termo', ['ção', 'rroz', 'arroz', 'pao', 'ado'])
+def test_nao_corrige_palavra_que_aparece_num_nome(termo):
+    # 'ção' está em coração/adição: não pode virar 'pao'
+    assert _indice().corrigir_termo(termo) is None
+
+
+@pytest.fixture(params=['fts', 'indice'])
+def db(request, tmp_path):
+    caminho = str(tmp_path / 'alimentos.db')
+    criar_banco_migrado(caminho)
+    conn = sqlite3.connect(caminho)
+    conn.executemany(
+        "INSERT INTO alimentos (alimento, medida_caseira, peso, kcal, carbs) VALUES (?, '1 porção', 100, 100, 10)",
+        [(nome,) for nome in ALIMENTOS]
+    )
+    conn.commit()
+    conn.close()
+    return DatabaseManager(caminho, motor_busca_alimentos=request.param)
+
+
+def _nomes(resultados):
+    return sorted(item['alimento'] for item in resultados)
+
+
+def test_substring_no_meio_da_palavra_nao_aciona_correcao(db):
+    resultados, corrigido = db.buscar_alimentos_com_correcao('ção')
+    assert corrigido is None
+    assert _nomes(resultados) == ['Bolo zero adição de açúcar', 'Coração de galinha']
+
+    resultados, corrigido = db.buscar_alimentos_com_correcao('rroz')
+    assert corrigido is None
+    assert _nomes(resultados) == ['Arroz branco cozido', 'Arroz integral']
+
+
+def test_prefixo_vem_antes_da_substring(db):
+    resultados, _ = db.buscar_alimentos_com_correcao('ar')
+    assert [item['alimento'] for item in resultados][:2] == ['Arroz integral', 'Arroz branco cozido']
+
+
+def test_termo_com_erro_e_corrigido(db):
+    resultados, corrigido = db.buscar_alimentos_com_correcao('arros', limite=5)
+    assert corrigido == 'arroz'
+    assert _nomes(resultados) == ['Arroz branco cozido', 'Arroz integral']
+
+
+def test_termo_sem_correspondencia(db):
+    assert db.buscar_alimentos_com_correcao('xyzw') == ([], None)
+
+
+def test_peso_nulo_usa_a_porcao_padrao_de_100g(db):
+    with db.get_db_connection() as conn:
+        conn.execute("INSERT INTO alimentos (alimento, peso, kcal, carbs) VALUES ('Tapioca', NULL, 240, 54)")
+    db._invalidar_busca_alimentos()
+    [item] = db.buscar_alimentos_por_nome('tapioca')
+    assert item['peso_g'] == 100
+    assert item['carbs_porcao'] == pytest.approx(54)
@@ -0,0 +1,40 @@
+# tests/test_esquema.py
+"""A inicialização recusa um banco com migrações pendentes."""
+
+import sqlite3
+
+import pytest
+
+from conftest import criar_banco_migrado
+from database_manager import DatabaseManager
+from migracoes import VERSAO_ESQUEMA, EsquemaDesatualizado
+
+
+def test_banco_sem_migracoes_falha_na_construcao(tmp_path):
+    caminho = str(tmp_path / 'antigo.db')
+    sqlite3.connect(caminho).close()
+    with pytest.raises(EsquemaDesatualizado, match="python migracoes.py"):
+        DatabaseManager(caminho)
+
+
+def test_migrador_abre_banco_antigo_e_migra(tmp_path, capsys):
+    caminho = str(tmp_path / 'antigo.db')
+    sqlite3.connect(caminho).close()
+    db = DatabaseManager(caminho, exigir_esquema=False)
+    assert db.migrar()[-1] == VERSAO_ESQUEMA
+    assert db.verificar_esquema()
+
+
+def test_migrar_preenche_ts_epoch_das_linhas_antigas(tmp_path, capsys):
+    caminho = str(tmp_path / 'migrado.db')
+    criar_banco_migrado(caminho)
+    conn = sqlite3.connect(caminho)
+    conn.execute("UPDATE registros SET ts_epoch = NULL")
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(caminho)
+    db.migrar()
+    with db.get_db_connection(somente_leitura=True) as conn:
+        nulos = conn.execute("SELECT COUNT(*) FROM registros WHERE ts_epoch IS NULL").fetchone()[0]
+    assert nulos == 0
@@ -0,0 +1,70 @@
+# tests/test_insulina_ativa.py
+"""Curvas de Insulina Ativa: limites, monotonicidade e o cálculo em lote."""
+
+import numpy as np
+import pytest
+
+from insulina_ativa import CURVAS, SEGUNDOS_MINUTO, insulina_ativa, insulina_ativa_lote
+
+T0 = 1_700_000_000
+DOSE = 4.0
+
+
+@pytest.fixture(params=sorted(CURVAS))
+def curva(request):
+    return CURVAS[request.param]
+
+
+def _ia(curva, minutos):
+    return insulina_ativa(curva, [T0], [DOSE], T0 + minutos * SEGUNDOS_MINUTO)
+
+
+def test_dose_inteira_na_aplicacao(curva):
+    assert _ia(curva, 0) == DOSE
+    # Menos de um minuto depois ainda é o minuto 0
+    assert insulina_ativa(curva, [T0], [DOSE], T0 + 59) == DOSE
+
+
+def test_zero_a_partir_da_duracao(curva):
+    for minutos in (curva.duracao_minutos, curva.duracao_minutos + 1, 3 * curva.duracao_minutos):
+        assert _ia(curva, minutos) == 0.0
+
+
+def test_dose_futura_nao_conta(curva):
+    assert _ia(curva, -1) == 0.0
+    assert insulina_ativa(curva, [T0, T0 + 30 * SEGUNDOS_MINUTO], [DOSE, 10.0], T0) == DOSE
+
+
+def test_curva_nunca_aumenta(curva):
+    assert np.all(np.diff(curva.tabela) <= 0)
+    ia = [_ia(curva, m) for m in range(curva.duracao_minutos + 2)]
+    assert all(depois <= antes for antes, depois in zip(ia, ia[1:]))
+    assert 0.0 < _ia(curva, curva.duracao_minutos // 2) < DOSE
+
+
+def test_lote_igual_ao_calculo_individual(curva):
+    rng = np.random.default_rng(11)
+    doses_por_grupo = {
+        0: (T0 + np.sort(rng.integers(0, 2 * 86400, 60)), rng.integers(1, 20, 60) / 2),
+        1: (T0 + np.sort(rng.integers(0, 2 * 86400, 5)), rng.integers(1, 20, 5) / 2),
+        2: (np.array([], dtype=np.int64), np.array([])),    # grupo sem doses
+    }
+    grupos_doses = np.concatenate([np.full(len(ts), g) for g, (ts, _) in doses_por_grupo.items()])
+    ts_doses = np.concatenate([ts for ts, _ in doses_por_grupo.values()])
+    doses_ui = np.concatenate([ui for _, ui in doses_por_grupo.values()])
+
+    grupos_consulta = rng.integers(0, 3, 500)
+    # Consultas antes, durante e depois das doses, incluindo os instantes exatos das doses
+    ts_consulta = np.concatenate([T0 + rng.integers(-3600, 3 * 86400, 497), ts_doses[:3]])
+    grupos_consulta[-3:] = 0
+
+    lote = insulina_ativa_lote(curva, grupos_doses, ts_doses, doses_ui, grupos_consulta, ts_consulta)
+    individuais = [
+        insulina_ativa(curva, *doses_por_grupo[g], t) for g, t in zip(grupos_consulta, ts_consulta)
+    ]
+    np.testing.assert_allclose(lote, individuais, rtol=0, atol=1e-9)
+
+
+def test_lote_sem_doses_ou_sem_consultas(curva):
+    assert insulina_ativa_lote(curva, [], [], [], [0, 1], [T0, T0]).tolist() == [0.0, 0.0]
+    assert insulina_ativa_lote(curva, [0], [T0], [DOSE], [], []).size == 0
@@ -0,0 +1,34 @@
+# tests/test_parametros_clinicos.py
+"""Cache de parâmetros de Bolus: uma gravação de outro processo vale na hora."""
+
+import sqlite3
+
+from conftest import PACIENTE_ID
+
+
+def _gravar_em_outro_processo(db, sql, params):
+    # Conexão própria, sem passar pelo DatabaseManager (como outro worker faria)
+    conn = sqlite3.connect(db.db_path)
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def test_parametros_acompanham_gravacao_externa(db):
+    assert db.obter_parametros_clinicos(PACIENTE_ID)['glicemia_alvo'] == 120
+    assert db.obter_parametros_clinicos_lote([PACIENTE_ID])[PACIENTE_ID]['glicemia_alvo'] == 120
+
+    _gravar_em_outro_processo(db, "UPDATE users SET meta_glicemia = 140 WHERE id = ?", (PACIENTE_ID,))
+
+    assert db.obter_parametros_clinicos(PACIENTE_ID)['glicemia_alvo'] == 140
+    assert db.obter_parametros_clinicos_lote([PACIENTE_ID])[PACIENTE_ID]['glicemia_alvo'] == 140
+
+
+def test_agenda_acompanha_gravacao_externa(db):
+    assert db.obter_agenda_parametros(PACIENTE_ID).parametros_em(8 * 3600)['fsi'] == 50
+
+    _gravar_em_outro_processo(
+        db, "INSERT INTO agenda_parametros (user_id, inicio_minuto, fsi) VALUES (?, 0, 35)", (PACIENTE_ID,)
+    )
+
+    assert db.obter_agenda_parametros(PACIENTE_ID).parametros_em(8 * 3600)['fsi'] == 35
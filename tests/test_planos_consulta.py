@@ -0,0 +1,32 @@
+# tests/test_planos_consulta.py
+"""Regressão de planos: as leituras quentes sobre registros devem usar índice."""
+
+import contextlib
+import io
+
+import pytest
+
+from conftest import PACIENTE_ID
+from database_manager import CONSULTAS_QUENTES_REGISTROS, etapas_sem_indice
+
+
+@pytest.fixture(scope='module')
+def planos(db):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return db.verificar_planos_consulta(PACIENTE_ID)
+
+
+@pytest.mark.parametrize('metodo', CONSULTAS_QUENTES_REGISTROS)
+def test_consulta_quente_usa_indice(planos, metodo):
+    resultados = [r for r in planos if r['metodo'] == metodo]
+    assert resultados, f"{metodo} não executou nenhum SELECT sobre registros"
+    for r in resultados:
+        assert r['usa_indice'], f"{metodo}: {r['sql']}\nplano: {r['plano']}"
+
+
+def test_etapas_sem_indice_detecta_scan_e_btree_temporaria():
+    assert etapas_sem_indice(['SCAN registros']) == ['SCAN registros']
+    assert etapas_sem_indice(['SEARCH registros USING INDEX idx_registros_user_ts (user_id=?)',
+                              'USE TEMP B-TREE FOR ORDER BY']) == ['USE TEMP B-TREE FOR ORDER BY']
+    assert etapas_sem_indice(['SCAN registros USING INDEX idx_registros_user_ts']) == []
+    assert etapas_sem_indice(['SEARCH registros_diarios USING PRIMARY KEY (user_id=?)']) == []
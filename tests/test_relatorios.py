@@ -0,0 +1,33 @@
+# tests/test_relatorios.py
+"""Parâmetros de /dados_glicemia_json."""
+
+from datetime import datetime
+
+import pytest
+
+from database_manager import datetime_para_epoch
+from relatorios import MAX_PONTOS_LIMITE, _parse_data_param, _parse_max_pontos
+
+
+def test_data_com_fuso_vira_horario_local():
+    esperado = datetime(2025, 1, 1)
+    local = datetime.fromisoformat('2025-01-01T00:00+00:00').astimezone().replace(tzinfo=None)
+    assert _parse_data_param('2025-01-01T00:00Z') == datetime_para_epoch(local)
+    assert _parse_data_param('2025-01-01') == datetime_para_epoch(esperado)
+
+
+def test_data_invalida_levanta_value_error():
+    with pytest.raises(ValueError):
+        _parse_data_param('ontem')
+
+
+@pytest.mark.parametrize('valor, esperado', [
+    (0, 0), (1, 3), (2, 3), (3, 3), (1000, 1000), (10**9, MAX_PONTOS_LIMITE),
+])
+def test_max_pontos_so_zero_desliga_a_reducao(valor, esperado):
+    assert _parse_max_pontos(valor) == esperado
+
+
+def test_max_pontos_negativo_e_invalido():
+    with pytest.raises(ValueError):
+        _parse_max_pontos(-1)
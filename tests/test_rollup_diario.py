@@ -0,0 +1,62 @@
+# tests/test_rollup_diario.py
+"""Colunas por tipo do rollup registros_diarios (migração 013)."""
+
+import sqlite3
+
+import pytest
+
+from conftest import criar_banco_migrado
+from database_manager import DatabaseManager
+
+MEDICO_ID = 600
+PACIENTE_ID = 601
+
+
+@pytest.fixture
+def db(tmp_path):
+    caminho = str(tmp_path / 'rollup.db')
+    criar_banco_migrado(caminho)
+    conn = sqlite3.connect(caminho)
+    conn.execute("INSERT INTO users (id, username, password_hash, role) VALUES (?, 'medico', 'x', 'medico')", (MEDICO_ID,))
+    conn.execute(
+        "INSERT INTO users (id, username, password_hash, role, medico_id) VALUES (?, 'p', 'x', 'paciente', ?)",
+        (PACIENTE_ID, MEDICO_ID)
+    )
+    conn.execute("INSERT INTO vinculos_medico_paciente (medico_id, paciente_id) VALUES (?, ?)", (MEDICO_ID, PACIENTE_ID))
+    conn.executemany(
+        "INSERT INTO registros (user_id, data_hora, tipo, valor, total_carbs) VALUES (?, ?, ?, ?, ?)",
+        [
+            (PACIENTE_ID, '2025-01-01T08:00:00', 'Glicemia', 100, None),
+            (PACIENTE_ID, '2025-01-01T12:00:00', 'Pos_Refeicao', 200, None),
+            (PACIENTE_ID, '2025-01-01T22:00:00', 'Antes_Dormir', 300, None),
+            (PACIENTE_ID, '2025-01-01T12:00:00', 'Refeição', None, 60),
+            (PACIENTE_ID, '2025-01-02T12:00:00', 'Lanche', None, 40),
+        ]
+    )
+    conn.commit()
+    conn.close()
+    return DatabaseManager(caminho)
+
+
+def test_media_do_medico_usa_so_medicoes(db):
+    assert db.calcular_media_glicemia_por_medico(MEDICO_ID) == 150.0
+    assert db.carregar_painel_medico(MEDICO_ID).media_glicemia == 150.0
+
+
+def test_graficos_de_carbs_usam_so_refeicoes(db):
+    assert db.obter_carbs_diarios_para_grafico(PACIENTE_ID) == [{'data': '2025-01-01', 'total_carbs': 60.0}]
+
+
+def test_mudanca_de_tipo_recalcula_o_dia(db):
+    with db.get_db_connection() as conn:
+        conn.execute("UPDATE registros SET tipo = 'Glicemia' WHERE user_id = ? AND tipo = 'Antes_Dormir'", (PACIENTE_ID,))
+    assert db.calcular_media_glicemia_por_medico(MEDICO_ID) == 200.0
+
+
+def test_kpis_do_medico_sem_medicoes_e_registros_de_hoje(db):
+    assert db.contar_registros_hoje_por_medico(MEDICO_ID) == 0
+    with db.get_db_connection() as conn:
+        conn.execute("INSERT INTO registros (user_id, data_hora, tipo) VALUES (?, datetime('now', 'localtime'), 'Lanche')",
+                     (PACIENTE_ID,))
+    assert db.contar_registros_hoje_por_medico(MEDICO_ID) == 1
+    assert db.calcular_media_glicemia_por_medico(MEDICO_ID + 99) == 0.0    # médico sem pacientes